@@ -7,4 +7,24 @@ class BaseModel(models.Model):
     updated_at = models.DateTimeField(auto_now=True, null= True)
 
     class Meta:
-        abstract = True
\ No newline at end of file
+        abstract = True
+
+# Remembers the values loaded from the database so signal handlers can work out deltas without re-querying
+class TrackedFieldsMixin:
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.snapshot_tracked_fields()
+        return instance
+
+    def snapshot_tracked_fields(self):
+        # Deferred fields are skipped so a snapshot never triggers an extra query
+        self._loaded_values = {field: self.__dict__[field] for field in self.tracked_fields if field in self.__dict__}
+
+    def has_loaded_value(self, field):
+        return field in getattr(self, "_loaded_values", {})
+
+    def get_loaded_value(self, field, default=None):
+        return getattr(self, "_loaded_values", {}).get(field, default)
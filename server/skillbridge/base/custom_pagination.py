@@ -1,13 +1,97 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+import math
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination, CursorPagination
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 
+
+def estimate_count(queryset):
+    """Row estimate taken from the PostgreSQL planner, avoids running a full COUNT(*) on large tables"""
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return queryset.count()
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class ApproximateCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        if hasattr(self.object_list, "query"):
+            return estimate_count(self.object_list)
+        return len(self.object_list)
+
+
+"""Keyset (cursor) pagination ordered on created_at, id. Deep pages are an index range scan instead of OFFSET n.
+Counting is opt in with ?count=exact or ?count=approximate (planner estimate), otherwise count is null"""
+class KeysetPagination(CursorPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+    count_query_param = 'count'
+
+    def get_ordering(self, request, queryset, view):
+        # Views can override the direction, e.g. chat history reads oldest first
+        return getattr(view, 'keyset_ordering', self.ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        count_mode = request.query_params.get(self.count_query_param)
+        if count_mode == 'approximate':
+            self.total_count = estimate_count(queryset)
+        elif count_mode == 'exact':
+            self.total_count = queryset.count()
+        else:
+            self.total_count = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        # Same envelope as CustomPagination so clients can switch modes without new parsing code
+        return Response({
+            'count': self.total_count,
+            'total_pages': math.ceil(self.total_count / self.page_size) if self.total_count is not None else None,
+            'current_page': None,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        })
+
+
+def wants_keyset(request, keyset_class):
+    return request.query_params.get('pagination') == 'cursor' or keyset_class.cursor_query_param in request.query_params
+
+
 """Custom Pagination is configured here, Defalut page size and maximu allowed page size are configured along"""
 class CustomPagination(PageNumberPagination):
     page_size = 10  # Default page size
     page_size_query_param = 'page_size'  
     max_page_size = 100  # Maximum allowed page size
+    keyset_class = None  # Set on subclasses whose querysets can be ordered on created_at, id
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_class and wants_keyset(request, self.keyset_class):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+
+        if request.query_params.get('count') == 'approximate':
+            self.django_paginator_class = ApproximateCountPaginator
+        return super().paginate_queryset(queryset, request, view)
 
     def get_paginated_response(self, data):
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
         return Response({
             'count': self.page.paginator.count,  # Total items
             'total_pages': self.page.paginator.num_pages,  # Total pages
@@ -16,8 +100,101 @@ class CustomPagination(PageNumberPagination):
             'previous': self.get_previous_link(),  # Previous page URL
             'results': data  # Courses data
         })
+
+
+"""Page number pagination by default, switches to keyset pagination on ?pagination=cursor or a cursor param"""
+class CursorEnabledPagination(CustomPagination):
+    keyset_class = KeysetPagination
+
+
+"""For endpoints that have always returned a plain list, keyset pagination only kicks in when asked for"""
+class OptionalKeysetPagination(KeysetPagination):
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not wants_keyset(request, type(self)):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+
+"""
+Chat history windows, ?before=<message id> returns the messages right before it and ?after=<message id> the ones
+right after it, ?pagination=window the latest ones. Results are always oldest first. Without any of these it
+behaves like OptionalKeysetPagination, so the legacy full list keeps working
+"""
+class MessageHistoryPagination(OptionalKeysetPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    before_query_param = 'before'
+    after_query_param = 'after'
+    window_ordering = ('created_at', 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.window = None
+        before = request.query_params.get(self.before_query_param)
+        after = request.query_params.get(self.after_query_param)
+        if before or after or request.query_params.get('pagination') == 'window':
+            return self.paginate_window(queryset, request, before, after)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_window_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, settings.CHAT_HISTORY_PAGE_SIZE))
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: "Must be an integer."})
+        return max(1, min(size, self.max_page_size))
+
+    def get_anchor(self, queryset, message_id):
+        try:
+            anchor = queryset.filter(pk=int(message_id)).values_list('created_at', 'id').first()
+        except ValueError:
+            raise ValidationError({"detail": "Message ids must be integers."})
+        if anchor is None:
+            raise NotFound({"detail": "Message not found."})
+        return anchor
+
+    def paginate_window(self, queryset, request, before, after):
+        size = self.get_window_size(request)
+        created_field, id_field = self.window_ordering
+
+        if after:
+            created_at, anchor_id = self.get_anchor(queryset, after)
+            newer = Q(**{f"{created_field}__gt": created_at}) | Q(**{created_field: created_at, f"{id_field}__gt": anchor_id})
+            rows = list(queryset.filter(newer).order_by(created_field, id_field)[:size + 1])
+            has_more = len(rows) > size
+            rows = rows[:size]
+        else:
+            if before:
+                created_at, anchor_id = self.get_anchor(queryset, before)
+                older = Q(**{f"{created_field}__lt": created_at}) | Q(**{created_field: created_at, f"{id_field}__lt": anchor_id})
+                queryset = queryset.filter(older)
+            rows = list(queryset.order_by(f"-{created_field}", f"-{id_field}")[:size + 1])
+            has_more = len(rows) > size
+            rows = rows[:size][::-1]
+
+        self.window = {"has_more": has_more, "direction": "after" if after else "before", "rows": rows}
+        return rows
+
+    def get_paginated_response(self, data):
+        if self.window is None:
+            return super().get_paginated_response(data)
+        rows = self.window["rows"]
+        return Response({
+            'has_more': self.window["has_more"],  # More messages exist in the direction that was paged
+            'direction': self.window["direction"],
+            'oldest_id': rows[0].pk if rows else None,  # Pass as ?before= to page further back
+            'newest_id': rows[-1].pk if rows else None,  # Pass as ?after= to fetch newer messages
+            'results': data
+        })
+
     
+"""Chat inbox, newest activity first. Always keyset paged since an inbox is read from the top"""
+class InboxPagination(KeysetPagination):
+    page_size = 20
+    ordering = ('-last_activity_at', '-id')
+
+
 class BlogPagination(PageNumberPagination):
     page_size = 2
     page_size_query_param = 'page_size'
-    max_page_size = 20
\ No newline at end of file
+    max_page_size = 20
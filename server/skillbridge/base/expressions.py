@@ -0,0 +1,13 @@
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def running_average(sum_field, count_field, sum_delta=0, count_delta=0):
+    """
+    Average of a running sum/count pair after applying the deltas, for use inside the same UPDATE
+    that shifts the counters. Every column reference reads the old row, so the result matches the
+    new counters, and an empty count gives 0.0 instead of a division by zero.
+    """
+    new_sum = F(sum_field) + sum_delta
+    new_count = F(count_field) + count_delta
+    return Coalesce(Cast(new_sum, FloatField()) / NullIf(new_count, Value(0)), Value(0.0), output_field=FloatField())
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import time
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from .redis_client import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+
+"""
+Room presence backed by one sorted set per room. Every socket is a member "<user_id>:<channel_name>" scored
+with the time it expires at; consumers push the expiry forward with a heartbeat, so connections of a crashed
+worker drop out on their own (sweep_expired_presence broadcasts them as left). A user is online while any of
+their connections is live. Only online/offline transitions are broadcast, as presence.delta events that are
+coalesced per room over BROADCAST_DEBOUNCE seconds.
+"""
+
+HEARTBEAT_INTERVAL = 20
+PRESENCE_TTL = 60
+BROADCAST_DEBOUNCE = 0.5
+ROOMS_KEY = "presence:rooms"
+
+# Returns 1 when the user had no other live connection in the room
+JOIN_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[3])
+local present = 0
+for _, member in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+    if string.sub(member, 1, string.len(ARGV[4])) == ARGV[4] then
+        present = 1
+        break
+    end
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return 1 - present
+"""
+
+# Returns 1 when the connection was the user's last live one in the room
+LEAVE_SCRIPT = """
+local removed = redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+if removed == 0 then
+    return 0
+end
+for _, member in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+    if string.sub(member, 1, string.len(ARGV[3])) == ARGV[3] then
+        return 0
+    end
+end
+return 1
+"""
+
+# Removes expired connections and returns them
+SWEEP_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if #expired > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+end
+return expired
+"""
+
+# Keeps the broadcast tasks referenced until they finish
+_pending_flushes = set()
+
+
+def _member_user_id(member):
+    return member.split(":", 1)[0]
+
+
+class RoomPresence:
+
+    def __init__(self, namespace, room_id, group_name):
+        self.group_name = group_name
+        self.key = f"presence:{namespace}:{room_id}"
+        self.names_key = f"{self.key}:names"
+        self.pending_key = f"{self.key}:pending"
+        self.flush_key = f"{self.key}:flush"
+
+    def member(self, user_id, connection_id):
+        return f"{user_id}:{connection_id}"
+
+    async def join(self, user_id, connection_id, name=None):
+        """Registers a connection, returns True when it brought the user online"""
+        client = get_async_redis()
+        now = time.time()
+        pipeline = client.pipeline(transaction=False)
+        pipeline.hset(ROOMS_KEY, self.key, self.group_name)
+        if name is not None:
+            pipeline.hset(self.names_key, user_id, name)
+            pipeline.expire(self.names_key, PRESENCE_TTL * 10)
+        await pipeline.execute()
+
+        came_online = await client.register_script(JOIN_SCRIPT)(
+            keys=[self.key],
+            args=[self.member(user_id, connection_id), now + PRESENCE_TTL, now, f"{user_id}:", PRESENCE_TTL * 10]
+        )
+        return bool(came_online)
+
+    async def heartbeat(self, user_id, connection_id):
+        """Pushes the connection's expiry forward, returns False if it had already expired and was swept"""
+        updated = await get_async_redis().zadd(
+            self.key, {self.member(user_id, connection_id): time.time() + PRESENCE_TTL}, xx=True, ch=True
+        )
+        return bool(updated)
+
+    async def leave(self, user_id, connection_id):
+        """Drops a connection, returns True when it took the user offline"""
+        went_offline = await get_async_redis().register_script(LEAVE_SCRIPT)(
+            keys=[self.key], args=[self.member(user_id, connection_id), time.time(), f"{user_id}:"]
+        )
+        return bool(went_offline)
+
+    async def online(self):
+        """{user_id: name} of the users with at least one live connection, user ids as strings"""
+        client = get_async_redis()
+        members = await client.zrangebyscore(self.key, time.time(), "+inf")
+        user_ids = sorted({_member_user_id(member) for member in members})
+        if not user_ids:
+            return {}
+        names = await client.hmget(self.names_key, user_ids)
+        return dict(zip(user_ids, names))
+
+    async def schedule_broadcast(self, user_id):
+        """Marks the user as changed, the first change in a debounce window schedules the delta broadcast"""
+        client = get_async_redis()
+        await client.sadd(self.pending_key, user_id)
+        await client.expire(self.pending_key, PRESENCE_TTL)
+        if await client.set(self.flush_key, 1, nx=True, px=int(BROADCAST_DEBOUNCE * 4000)):
+            task = asyncio.create_task(self._flush_later())
+            _pending_flushes.add(task)
+            task.add_done_callback(_pending_flushes.discard)
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(BROADCAST_DEBOUNCE)
+            client = get_async_redis()
+            # Release the debounce window first so a change arriving from here on schedules its own flush
+            await client.delete(self.flush_key)
+            pipeline = client.pipeline(transaction=True)
+            pipeline.smembers(self.pending_key)
+            pipeline.delete(self.pending_key)
+            changed, _ = await pipeline.execute()
+            if not changed:
+                return
+
+            online = await self.online()
+            await get_channel_layer().group_send(self.group_name, {
+                "type": "presence.delta",
+                "joined": [{"id": user_id, "name": online[user_id]} for user_id in changed if user_id in online],
+                "left": [user_id for user_id in changed if user_id not in online],
+            })
+        except Exception as e:
+            logger.error(f"Presence broadcast failed for {self.key}: {e}", exc_info=True)
+
+
+def sweep_expired_presence():
+    """Drops connections whose heartbeat stopped and broadcasts the users that went offline with them"""
+    client = get_redis()
+    sweep = client.register_script(SWEEP_SCRIPT)
+    channel_layer = get_channel_layer()
+    now = time.time()
+    gone_offline = 0
+
+    for key, group_name in client.hgetall(ROOMS_KEY).items():
+        expired = sweep(keys=[key], args=[now])
+        if not client.exists(key):
+            client.hdel(ROOMS_KEY, key)
+        if not expired:
+            continue
+
+        still_online = {_member_user_id(member) for member in client.zrangebyscore(key, now, "+inf")}
+        left = sorted({_member_user_id(member) for member in expired} - still_online)
+        if left:
+            gone_offline += len(left)
+            async_to_sync(channel_layer.group_send)(group_name, {"type": "presence.delta", "joined": [], "left": left})
+    return gone_offline
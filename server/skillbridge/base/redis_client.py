@@ -0,0 +1,44 @@
+import asyncio
+import weakref
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+
+"""
+Shared Redis connections configured from settings.REDIS_URL.
+get_redis() is the blocking client for views, tasks and management commands. get_async_redis() is for
+consumers and other code running on the event loop. asyncio connections can't be shared between loops,
+so each loop gets its own pool. Both pools wait for a free connection instead of failing when
+REDIS_MAX_CONNECTIONS are in use.
+"""
+
+_sync_pool = None
+_async_pools = weakref.WeakKeyDictionary()
+
+
+def get_redis():
+    global _sync_pool
+    if _sync_pool is None:
+        _sync_pool = redis.BlockingConnectionPool.from_url(
+            settings.REDIS_URL, decode_responses=True, max_connections=settings.REDIS_MAX_CONNECTIONS
+        )
+    return redis.Redis(connection_pool=_sync_pool)
+
+
+def get_async_redis():
+    loop = asyncio.get_running_loop()
+    pool = _async_pools.get(loop)
+    if pool is None:
+        pool = aioredis.BlockingConnectionPool.from_url(
+            settings.REDIS_URL, decode_responses=True, max_connections=settings.REDIS_MAX_CONNECTIONS
+        )
+        _async_pools[loop] = pool
+    return aioredis.Redis(connection_pool=pool)
+
+
+def reset_pools():
+    """Drops the pools so the next call connects to the current settings.REDIS_URL, for tools that switch it"""
+    global _sync_pool
+    _sync_pool = None
+    _async_pools.clear()
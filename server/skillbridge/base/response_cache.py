@@ -0,0 +1,117 @@
+import hashlib
+import logging
+import time
+from functools import wraps
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+
+"""
+Response cache for the public (AllowAny) read endpoints.
+Entries are keyed by endpoint, normalized query params and the current version of every tag the
+endpoint depends on, so bumping a tag version invalidates all of its entries at once. Entries are
+kept for a stale window after they expire: one request refreshes it while the others keep getting
+the stale copy. Hit, miss and stale counters are stored next to the entries.
+"""
+
+RESPONSE_CACHE_TIMEOUT = 60 * 5
+RESPONSE_CACHE_STALE_TIMEOUT = 60 * 30
+REFRESH_LOCK_TIMEOUT = 30
+CACHE_OUTCOMES = ("hit", "miss", "stale")
+CACHED_ENDPOINTS = ("course_list", "course_detail", "category_list", "top_rated_courses", "top_rated_tutors", "global_summary")
+
+
+def _tag_key(tag):
+    return f"response_cache_tag_{tag}"
+
+
+def _metric_key(name, outcome):
+    return f"response_cache_metric_{name}_{outcome}"
+
+
+def get_tag_versions(tags):
+    keys = [_tag_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def invalidate_tags(*tags):
+    """Bumps the tag versions once the current transaction commits, so readers never cache uncommitted state"""
+    def bump():
+        version = time.time_ns()
+        cache.set_many({_tag_key(tag): version for tag in tags}, timeout=None)
+    transaction.on_commit(bump)
+
+
+def record_outcome(name, outcome):
+    key = _metric_key(name, outcome)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def get_cache_metrics(names):
+    keys = {_metric_key(name, outcome): (name, outcome) for name in names for outcome in CACHE_OUTCOMES}
+    values = cache.get_many(keys.keys())
+    metrics = {name: {outcome: 0 for outcome in CACHE_OUTCOMES} for name in names}
+    for key, (name, outcome) in keys.items():
+        metrics[name][outcome] = values.get(key, 0)
+    return metrics
+
+
+def build_cache_key(name, request, tags, kwargs):
+    params = sorted((key, value) for key in request.query_params for value in request.query_params.getlist(key))
+    raw = repr((request.get_host(), request.path, sorted(kwargs.items()), params, get_tag_versions(tags)))
+    return f"response_cache_{name}_{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def cache_public_response(name, tags, timeout=RESPONSE_CACHE_TIMEOUT, stale_timeout=RESPONSE_CACHE_STALE_TIMEOUT, anonymous_only=True):
+    """
+    Caches the responses of a view method. With anonymous_only, authenticated requests always reach the
+    view, use it for endpoints whose output depends on the requesting user
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if anonymous_only and request.user.is_authenticated:
+                return view_method(self, request, *args, **kwargs)
+
+            key = build_cache_key(name, request, tags, kwargs)
+            entry = cache.get(key)
+            now = time.time()
+
+            if entry and entry["fresh_until"] > now:
+                record_outcome(name, "hit")
+                return Response(entry["data"], status=entry["status"], headers={"X-Cache": "HIT"})
+
+            lock_key = f"{key}_refresh"
+            if entry and not cache.add(lock_key, 1, timeout=REFRESH_LOCK_TIMEOUT):
+                # Someone else is already refreshing this entry
+                record_outcome(name, "stale")
+                return Response(entry["data"], status=entry["status"], headers={"X-Cache": "STALE"})
+
+            record_outcome(name, "miss")
+            try:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code == 200:
+                    cache.set(
+                        key,
+                        {"data": response.data, "status": response.status_code, "fresh_until": now + timeout},
+                        timeout=timeout + stale_timeout
+                    )
+                response["X-Cache"] = "MISS"
+                return response
+            finally:
+                if entry:
+                    cache.delete(lock_key)
+        return wrapper
+    return decorator
@@ -0,0 +1,60 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connections
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+
+"""Full-text search helpers shared by the course, community and tutor listings"""
+
+SEARCH_CONFIG = "english"
+
+
+def supports_full_text(queryset):
+    return connections[queryset.db].vendor == "postgresql"
+
+
+def weighted_vector(*weighted_fields):
+    """Builds a tsvector from (field_or_expression, weight) pairs, e.g. ("title", "A")"""
+    vector = None
+    for field, weight in weighted_fields:
+        part = SearchVector(field, weight=weight, config=SEARCH_CONFIG)
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def ranked_search(queryset, term, vector_field, trigram_fields, fallback_fields):
+    """
+    Filters a queryset by full-text match on `vector_field`, falling back to trigram similarity on
+    `trigram_fields` so small typos still match, and orders the results by combined rank.
+    Databases without tsvector support get a plain icontains filter on `fallback_fields`.
+    """
+    if not supports_full_text(queryset):
+        condition = Q()
+        for field in fallback_fields:
+            condition |= Q(**{f"{field}__icontains": term})
+        return queryset.filter(condition)
+
+    query = SearchQuery(term, search_type="websearch", config=SEARCH_CONFIG)
+    similarities = [TrigramSimilarity(field, term) for field in trigram_fields]
+    similarity = Greatest(*similarities) if len(similarities) > 1 else similarities[0]
+
+    condition = Q(**{vector_field: query})
+    for field in trigram_fields:
+        condition |= Q(**{f"{field}__trigram_similar": term})
+
+    return queryset.annotate(
+        search_rank=SearchRank(F(vector_field), query) + similarity
+    ).filter(condition).order_by("-search_rank")
+
+
+def refresh_search_vector(model, pk, vector):
+    """Stores a freshly computed vector without going through save() again"""
+    model.objects.filter(pk=pk).update(search_vector=vector)
+
+
+def create_trigram_extension(sender, using, **kwargs):
+    """pre_migrate hook, the trigram indexes need pg_trgm before their migrations run"""
+    connection = connections[using]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
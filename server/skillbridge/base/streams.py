@@ -0,0 +1,139 @@
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+import redis
+from django.db import IntegrityError, transaction
+
+logger = logging.getLogger(__name__)
+
+
+"""
+Helpers for Redis Stream consumer groups, used by the write-behind pipelines that persist chat traffic.
+Delivery is at-least-once: an entry stays pending until it is acked, and entries left pending by a dead
+worker are claimed by the next reader once they have been idle for claim_idle_ms. Writers therefore have to
+attach an idempotency key to every entry, unique per sender, and the time it was sent so rows keep the send order
+however late they are drained.
+"""
+
+DEFAULT_STREAM_MAXLEN = 100000
+CLIENT_ID_MAX_LENGTH = 64
+
+
+def make_client_id(value=None):
+    """Keeps a client supplied idempotency key when it is usable, otherwise generates one"""
+    if isinstance(value, str) and 0 < len(value) <= CLIENT_ID_MAX_LENGTH:
+        return value
+    return uuid.uuid4().hex
+
+
+def insert_new_rows(model, rows):
+    """
+    Inserts rows keyed by an idempotency key the caller found unused, skipping the ones a concurrent drain stored
+    in the meantime. Returns the rows that were inserted, run it inside the caller's transaction
+    """
+    try:
+        with transaction.atomic():
+            return model.objects.bulk_create(rows)
+    except IntegrityError:
+        pass
+    inserted = []
+    for row in rows:
+        try:
+            with transaction.atomic():
+                row.save(force_insert=True)
+        except IntegrityError:
+            continue
+        inserted.append(row)
+    return inserted
+
+
+def sent_at_field():
+    """Send time to store on an entry, the drain uses it as the row's created_at"""
+    return f"{time.time():.6f}"
+
+
+def entry_sent_at(fields):
+    """Send time of an entry, entries written without one count as sent now"""
+    try:
+        return datetime.fromtimestamp(float(fields["sent_at"]), tz=timezone.utc)
+    except (KeyError, TypeError, ValueError):
+        return datetime.now(tz=timezone.utc)
+
+
+def ensure_group(client, stream, group):
+    try:
+        client.xgroup_create(stream, group, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def read_batch(client, stream, group, consumer, count=500, block_ms=None, claim_idle_ms=60000):
+    """Returns [(entry_id, fields)], entries abandoned by other consumers first, then new ones"""
+    entries = []
+    if claim_idle_ms is not None:
+        claimed = client.xautoclaim(stream, group, consumer, min_idle_time=claim_idle_ms, start_id="0-0", count=count)
+        # XAUTOCLAIM returns [next_start_id, entries, deleted_ids], entries of trimmed ids come back as None
+        entries.extend(entry for entry in claimed[1] if entry and entry[1])
+
+    if len(entries) < count:
+        response = client.xreadgroup(group, consumer, {stream: ">"}, count=count - len(entries), block=block_ms)
+        for _, stream_entries in response or []:
+            entries.extend(stream_entries)
+    return entries
+
+
+def ack(client, stream, group, entry_ids):
+    """Acks and deletes processed entries so the stream only holds undelivered or in-flight work"""
+    if not entry_ids:
+        return
+    pipeline = client.pipeline()
+    pipeline.xack(stream, group, *entry_ids)
+    pipeline.xdel(stream, *entry_ids)
+    pipeline.execute()
+
+
+def group_lag(client, stream, group):
+    """Entries not yet delivered to the group plus delivered entries still waiting for an ack"""
+    try:
+        groups = client.xinfo_groups(stream)
+    except redis.ResponseError:
+        return {"lag": 0, "pending": 0}
+    for info in groups:
+        if info.get("name") == group:
+            lag = info.get("lag")
+            return {"lag": lag if lag is not None else client.xlen(stream), "pending": info.get("pending", 0)}
+    return {"lag": client.xlen(stream), "pending": 0}
+
+
+def metrics_key(stream):
+    return f"stream_metrics:{stream}"
+
+
+def record_drain(client, stream, group, persisted):
+    """Stores the group's lag after a drain together with running persistence counters"""
+    lag = group_lag(client, stream, group)
+    pipeline = client.pipeline(transaction=False)
+    pipeline.hset(metrics_key(stream), mapping={
+        "lag": lag["lag"],
+        "pending": lag["pending"],
+        "last_drain_at": int(time.time()),
+    })
+    pipeline.hincrby(metrics_key(stream), "persisted", persisted)
+    pipeline.hincrby(metrics_key(stream), "drains", 1)
+    pipeline.execute()
+    if lag["lag"] or lag["pending"]:
+        logger.info(f"Stream {stream} left {lag['lag']} undelivered and {lag['pending']} pending entries for {group}")
+    return lag
+
+
+def get_stream_metrics(client, streams):
+    """{stream: {"lag", "pending", "persisted", "drains", "last_drain_at"}} as last recorded by record_drain"""
+    pipeline = client.pipeline(transaction=False)
+    for stream in streams:
+        pipeline.hgetall(metrics_key(stream))
+    return {
+        stream: {field: int(value) for field, value in metrics.items()}
+        for stream, metrics in zip(streams, pipeline.execute())
+    }
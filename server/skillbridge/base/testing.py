@@ -0,0 +1,19 @@
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+
+
+"""
+Shared setup of the app test suites. Channel layers and the Django cache run in process so tests don't see state
+left in Redis by other runs. Code that talks to Redis directly (streams, counters, locks) still needs the server
+of settings.REDIS_URL, point it at a database you don't mind tests writing to.
+"""
+
+IN_MEMORY_CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+isolated_services = override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, CACHES=LOCMEM_CACHES)
+
+
+def make_user(email, role="student", **fields):
+    fields.setdefault("first_name", email.split("@")[0].title())
+    return get_user_model().objects.create_user(email, "password", role=role, **fields)
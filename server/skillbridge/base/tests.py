@@ -0,0 +1,86 @@
+import datetime
+from zoneinfo import ZoneInfo
+from django.test import SimpleTestCase
+from .timeseries import bucket_start, iter_buckets
+
+BERLIN = ZoneInfo("Europe/Berlin")
+
+
+def dates(*values):
+    return [datetime.date.fromisoformat(value) for value in values]
+
+
+class BucketStartTests(SimpleTestCase):
+
+    def test_dates(self):
+        value = datetime.date(2024, 2, 29)
+        self.assertEqual(bucket_start(value, "day"), value)
+        self.assertEqual(bucket_start(value, "week"), datetime.date(2024, 2, 26))
+        self.assertEqual(bucket_start(value, "month"), datetime.date(2024, 2, 1))
+        self.assertEqual(bucket_start(value, "year"), datetime.date(2024, 1, 1))
+
+    def test_week_starts_on_monday_across_the_year(self):
+        self.assertEqual(bucket_start(datetime.date(2025, 1, 2), "week"), datetime.date(2024, 12, 30))
+
+    def test_datetimes_start_at_local_midnight(self):
+        # 23:30 UTC on the 31st is already the 1st in Berlin
+        value = datetime.datetime(2024, 3, 31, 23, 30, tzinfo=datetime.timezone.utc)
+        self.assertEqual(bucket_start(value, "day", BERLIN), datetime.datetime(2024, 4, 1, tzinfo=BERLIN))
+        self.assertEqual(bucket_start(value, "month", BERLIN), datetime.datetime(2024, 4, 1, tzinfo=BERLIN))
+        self.assertEqual(bucket_start(value, "year", BERLIN), datetime.datetime(2024, 1, 1, tzinfo=BERLIN))
+        self.assertEqual(bucket_start(value, "hour", BERLIN), datetime.datetime(2024, 4, 1, 1, tzinfo=BERLIN))
+
+    def test_day_on_a_dst_change_keeps_the_offset_of_midnight(self):
+        # Berlin moves to summer time at 02:00 on 2024-03-31, midnight is still +01:00
+        start = bucket_start(datetime.datetime(2024, 3, 31, 12, tzinfo=BERLIN), "day", BERLIN)
+        self.assertEqual(start.utcoffset(), datetime.timedelta(hours=1))
+        self.assertEqual(start.astimezone(datetime.timezone.utc), datetime.datetime(2024, 3, 30, 23, tzinfo=datetime.timezone.utc))
+
+
+class IterBucketsTests(SimpleTestCase):
+
+    def test_days_across_a_month_boundary(self):
+        buckets = list(iter_buckets(datetime.date(2024, 2, 27), datetime.date(2024, 3, 2), "day"))
+        self.assertEqual(buckets, dates("2024-02-27", "2024-02-28", "2024-02-29", "2024-03-01", "2024-03-02"))
+
+    def test_weeks_across_a_year_boundary(self):
+        buckets = list(iter_buckets(datetime.date(2023, 12, 28), datetime.date(2024, 1, 10), "week"))
+        self.assertEqual(buckets, dates("2023-12-25", "2024-01-01", "2024-01-08"))
+
+    def test_months_from_the_end_of_a_month(self):
+        buckets = list(iter_buckets(datetime.date(2023, 11, 30), datetime.date(2024, 3, 1), "month"))
+        self.assertEqual(buckets, dates("2023-11-01", "2023-12-01", "2024-01-01", "2024-02-01", "2024-03-01"))
+
+    def test_years_from_a_leap_day(self):
+        buckets = list(iter_buckets(datetime.date(2020, 2, 29), datetime.date(2022, 12, 31), "year"))
+        self.assertEqual(buckets, dates("2020-01-01", "2021-01-01", "2022-01-01"))
+
+    def test_single_bucket_when_start_and_end_share_it(self):
+        self.assertEqual(list(iter_buckets(datetime.date(2024, 5, 2), datetime.date(2024, 5, 30), "month")), dates("2024-05-01"))
+
+    def test_hours_skip_the_missing_hour_in_spring(self):
+        start = datetime.datetime(2024, 3, 31, 0, 30, tzinfo=BERLIN)
+        end = datetime.datetime(2024, 3, 31, 4, 30, tzinfo=BERLIN)
+        buckets = list(iter_buckets(start, end, "hour", BERLIN))
+        self.assertEqual([bucket.hour for bucket in buckets], [0, 1, 3, 4])
+
+    def test_hours_repeat_the_doubled_hour_in_autumn(self):
+        # 02:00-03:00 happens twice on 2024-10-27, once at +02:00 and once at +01:00
+        start = datetime.datetime(2024, 10, 27, 0, 30, tzinfo=BERLIN)
+        end = datetime.datetime(2024, 10, 27, 3, 30, tzinfo=BERLIN)
+        buckets = list(iter_buckets(start, end, "hour", BERLIN))
+        self.assertEqual([bucket.hour for bucket in buckets], [0, 1, 2, 2, 3])
+        self.assertEqual([bucket.utcoffset().seconds // 3600 for bucket in buckets], [2, 2, 2, 1, 1])
+        instants = [bucket.astimezone(datetime.timezone.utc) for bucket in buckets]
+        self.assertEqual(len(set(instants)), 5)
+
+    def test_days_across_dst_changes_start_at_local_midnight(self):
+        spring, autumn = datetime.date(2024, 3, 30), datetime.date(2024, 10, 26)
+        for start, end in ((spring, spring + datetime.timedelta(days=2)), (autumn, autumn + datetime.timedelta(days=2))):
+            buckets = list(iter_buckets(
+                datetime.datetime.combine(start, datetime.time(12), tzinfo=BERLIN),
+                datetime.datetime.combine(end, datetime.time(12), tzinfo=BERLIN),
+                "day", BERLIN,
+            ))
+            self.assertEqual([bucket.date() for bucket in buckets], [start + datetime.timedelta(days=n) for n in range(3)])
+            self.assertTrue(all(bucket.time() == datetime.time() for bucket in buckets))
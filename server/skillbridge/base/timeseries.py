@@ -0,0 +1,93 @@
+import datetime
+from django.db.models import Count, DateTimeField
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+
+"""
+Database side time bucketing for dashboard charts. The rows are grouped with Trunc() so only one row per
+bucket leaves the database, then the empty buckets are filled in with zeros.
+"""
+
+BUCKET_KINDS = ("hour", "day", "week", "month", "year")
+
+
+def bucket_start(value, kind, tzinfo=None):
+    """Start of the bucket holding `value`, in the same terms Trunc() returns it (aware datetime or date)"""
+    if isinstance(value, datetime.datetime):
+        tzinfo = tzinfo or timezone.get_current_timezone()
+        value = value.astimezone(tzinfo)
+        if kind == "hour":
+            return value.replace(minute=0, second=0, microsecond=0)
+        day = bucket_start(value.date(), kind)
+        return datetime.datetime.combine(day, datetime.time(), tzinfo=tzinfo)
+
+    if kind == "week":
+        return value - datetime.timedelta(days=value.weekday())
+    if kind == "month":
+        return value.replace(day=1)
+    if kind == "year":
+        return value.replace(month=1, day=1)
+    return value
+
+
+def _key(value):
+    # Aware datetimes sharing a tzinfo compare by wall time, which breaks on DST folds
+    return value.astimezone(datetime.timezone.utc) if isinstance(value, datetime.datetime) else value
+
+
+def iter_buckets(start, end, kind, tzinfo=None):
+    """Yields every bucket start from the bucket holding `start` up to the one holding `end`"""
+    current = bucket_start(start, kind, tzinfo)
+    last = bucket_start(end, kind, tzinfo)
+    is_datetime = isinstance(current, datetime.datetime)
+
+    while _key(current) <= _key(last):
+        yield current
+        if kind == "hour":
+            # Step in absolute time so DST changes neither skip nor repeat an hour
+            current = (current.astimezone(datetime.timezone.utc) + datetime.timedelta(hours=1)).astimezone(current.tzinfo)
+            continue
+        day = current.date() if is_datetime else current
+        if kind == "month":
+            day = (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+        elif kind == "year":
+            day = day.replace(year=day.year + 1)
+        else:
+            day = day + datetime.timedelta(days=7 if kind == "week" else 1)
+        current = datetime.datetime.combine(day, datetime.time(), tzinfo=current.tzinfo) if is_datetime else day
+
+
+def time_series(queryset, field, kind, start, end=None, value=None, tzinfo=None):
+    """
+    Groups `queryset` by `kind` buckets of `field` between start and end and returns [(bucket, value)]
+    with a zero for every bucket that has no rows. `value` defaults to a row count
+    """
+    if kind not in BUCKET_KINDS:
+        raise ValueError(f"Unsupported bucket kind: {kind}")
+
+    is_datetime = isinstance(queryset.model._meta.get_field(field), DateTimeField)
+    if is_datetime:
+        tzinfo = tzinfo or timezone.get_current_timezone()
+        end = end or timezone.now()
+        trunc = Trunc(field, kind, tzinfo=tzinfo)
+    else:
+        end = end or timezone.localdate()
+        trunc = Trunc(field, kind)
+
+    rows = (
+        queryset.filter(**{f"{field}__gte": bucket_start(start, kind, tzinfo), f"{field}__lte": end})
+        .annotate(bucket=trunc)
+        .values("bucket")
+        .annotate(value=value if value is not None else Count("pk"))
+        .order_by()
+    )
+    totals = {_key(row["bucket"]): row["value"] or 0 for row in rows}
+    return [(bucket, totals.get(_key(bucket), 0)) for bucket in iter_buckets(start, end, kind, tzinfo)]
+
+
+def chart_arrays(series, label_format=None):
+    """Splits a time_series() result into the labels and values arrays the charts consume"""
+    labels = [bucket.strftime(label_format) if label_format else bucket.isoformat() for bucket, _ in series]
+    values = [float(total) for _, total in series]
+    return labels, values
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import resource
+import time
+import tracemalloc
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework_simplejwt.tokens import AccessToken
+from community.membership import MEMBER, membership_key
+from courses.rooms import chat_room_members_key
+from users.middleware import SLIM_USER_CACHE_TIMEOUT, slim_user_cache_key
+from .presence import ROOMS_KEY, RoomPresence
+
+User = get_user_model()
+
+"""
+In-process WebSocket load test. Simulated clients are WebsocketCommunicators driving the real ASGI application,
+JWT middleware included, on one event loop. The users, rooms and memberships are synthetic: their records are
+primed into the cache the consumers read from, so a run never touches the database. Presence and the chat
+streams still talk to Redis, which the caller points at a scratch instance.
+
+Every chat message carries its send time, so fan-out latency is measured on the receiving socket from the
+moment the sender's frame was handed to the consumer.
+"""
+
+SCENARIOS = ("private", "community", "notifications")
+FIRST_SYNTHETIC_ID = 900_000_000
+MESSAGE_PREFIX = "loadtest:"
+
+
+def percentiles(values):
+    """p50/p90/p99/max in milliseconds of a list of seconds"""
+    if not values:
+        return {"count": 0, "p50": None, "p90": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def at(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 2)
+
+    return {"count": len(ordered), "p50": at(0.5), "p90": at(0.9), "p99": at(0.99), "max": at(1.0)}
+
+
+def max_rss_kb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class SimulatedClient:
+
+    def __init__(self, application, user_id, path):
+        self.user_id = user_id
+        token = str(AccessToken.for_user(User(id=user_id)))
+        self.communicator = WebsocketCommunicator(application, f"{path}?token={token}")
+        self.latencies = []
+        self.received = 0
+
+    async def connect(self, timeout):
+        started = time.perf_counter()
+        connected, _ = await self.communicator.connect(timeout=timeout)
+        return connected, time.perf_counter() - started
+
+    async def send_message(self, seq):
+        text = f"{MESSAGE_PREFIX}{self.user_id}:{seq}:{time.perf_counter()}"
+        await self.communicator.send_to(text_data=json.dumps({"message": text}))
+
+    async def collect(self, expected, timeout):
+        """Reads frames until `expected` chat messages from other users arrived or the socket went quiet"""
+        while self.received < expected:
+            try:
+                frame = json.loads(await self.communicator.receive_from(timeout=timeout))
+            except asyncio.TimeoutError:
+                return
+            text = frame.get("message")
+            if isinstance(text, dict):
+                text = text.get("text")  # Community messages are objects, see community/chat_pipeline.py
+            if not isinstance(text, str) or not text.startswith(MESSAGE_PREFIX):
+                continue  # presence frames
+            sender_id, _, sent_at = text[len(MESSAGE_PREFIX):].split(":")
+            if int(sender_id) != self.user_id:
+                self.latencies.append(time.perf_counter() - float(sent_at))
+                self.received += 1
+
+    async def disconnect(self):
+        try:
+            await self.communicator.disconnect()
+        except Exception:
+            pass
+
+
+def prime_user(user_id):
+    cache.set(slim_user_cache_key(user_id), {
+        "id": user_id,
+        "first_name": f"Load{user_id}",
+        "last_name": "Test",
+        "email": f"loadtest-{user_id}@example.invalid",
+        "role": "student",
+        "is_active": True,
+        "is_staff": False,
+        "is_superuser": False,
+        "profile_pic_url": None,
+    }, SLIM_USER_CACHE_TIMEOUT * 12)
+
+
+def build_rooms(scenario, clients, room_size):
+    """Returns [(path, [user_ids])] and primes the cache with the synthetic users and rooms"""
+    user_ids = list(range(FIRST_SYNTHETIC_ID, FIRST_SYNTHETIC_ID + clients))
+    for user_id in user_ids:
+        prime_user(user_id)
+
+    if scenario == "notifications":
+        return [("/ws/notifications/", [user_id]) for user_id in user_ids]
+
+    size = 2 if scenario == "private" else max(2, room_size)
+    rooms = []
+    for index, start in enumerate(range(0, len(user_ids), size)):
+        room_id = FIRST_SYNTHETIC_ID + index
+        members = user_ids[start:start + size]
+        if scenario == "private":
+            if len(members) < 2:
+                break
+            cache.set(chat_room_members_key(room_id), tuple(members), SLIM_USER_CACHE_TIMEOUT * 12)
+            rooms.append((f"/ws/chat/{room_id}/", members))
+        else:
+            for user_id in members:
+                cache.set(membership_key(room_id, user_id), MEMBER, SLIM_USER_CACHE_TIMEOUT * 12)
+            rooms.append((f"/ws/community/{room_id}/", members))
+    return rooms
+
+
+async def _in_batches(coroutines, concurrency):
+    results = []
+    for start in range(0, len(coroutines), concurrency):
+        results.extend(await asyncio.gather(*coroutines[start:start + concurrency]))
+    return results
+
+
+async def run_scenario(application, scenario, clients, room_size=50, senders=1, messages=10,
+                       concurrency=200, timeout=10.0, trace_memory=False):
+    rooms = build_rooms(scenario, clients, room_size)
+    room_clients = [[SimulatedClient(application, user_id, path) for user_id in members] for path, members in rooms]
+    all_clients = [client for members in room_clients for client in members]
+
+    if trace_memory:
+        tracemalloc.start()
+    rss_before = max_rss_kb()
+    traced_before = tracemalloc.get_traced_memory()[0] if trace_memory else 0
+
+    started = time.perf_counter()
+    connects = await _in_batches([client.connect(timeout) for client in all_clients], concurrency)
+    connect_seconds = time.perf_counter() - started
+    connected = sum(1 for ok, _ in connects if ok)
+
+    memory = {"max_rss_delta_kb": max_rss_kb() - rss_before}
+    if trace_memory:
+        memory["traced_bytes_per_connection"] = round(
+            (tracemalloc.get_traced_memory()[0] - traced_before) / max(connected, 1)
+        )
+        tracemalloc.stop()
+
+    # Let the join broadcasts settle so they don't queue in front of the measured messages
+    await asyncio.sleep(1)
+
+    active_senders = []
+    if scenario == "notifications":
+        expected = {client: messages for client in all_clients}
+    else:
+        expected = {}
+        for members in room_clients:
+            active = members[:max(1, min(senders, len(members)))]
+            active_senders.extend(active)
+            for client in members:
+                expected[client] = messages * sum(1 for sender in active if sender is not client)
+
+    # Receivers read while the senders are still sending, so queueing on the socket shows up in the latency
+    started = time.perf_counter()
+    collectors = [asyncio.create_task(client.collect(expected[client], timeout)) for client in all_clients]
+    for seq in range(messages):
+        if scenario == "notifications":
+            await _send_notifications(all_clients, seq)
+        else:
+            await asyncio.gather(*(sender.send_message(seq) for sender in active_senders))
+    await asyncio.gather(*collectors)
+    fan_out_seconds = time.perf_counter() - started
+
+    await _in_batches([client.disconnect() for client in all_clients], concurrency)
+
+    delivered = sum(client.received for client in all_clients)
+    latencies = [latency for client in all_clients for latency in client.latencies]
+    return {
+        "scenario": scenario,
+        "clients": len(all_clients),
+        "rooms": len(rooms),
+        "connected": connected,
+        "connect_seconds": round(connect_seconds, 3),
+        "connect_latency_ms": percentiles([elapsed for ok, elapsed in connects if ok]),
+        "expected_deliveries": sum(expected.values()),
+        "delivered": delivered,
+        "fan_out_seconds": round(fan_out_seconds, 3),
+        "fan_out_latency_ms": percentiles(latencies),
+        "memory": memory,
+    }
+
+
+async def _send_notifications(clients, seq):
+    """Pushes through the channel layer the way users.notifications does, stamped like chat messages"""
+    channel_layer = get_channel_layer()
+    await asyncio.gather(*(
+        channel_layer.group_send(f"notifications_{client.user_id}", {
+            "type": "send.notification",
+            "message": f"{MESSAGE_PREFIX}0:{seq}:{time.perf_counter()}",
+            "notification_type": "loadtest",
+        })
+        for client in clients
+    ))
+
+
+def shortfalls(result):
+    """What a run lost, empty when every client connected and every expected message arrived"""
+    problems = []
+    if result["connected"] < result["clients"]:
+        problems.append(f"{result['clients'] - result['connected']} of {result['clients']} clients failed to connect")
+    if result["delivered"] < result["expected_deliveries"]:
+        problems.append(f"{result['expected_deliveries'] - result['delivered']} of {result['expected_deliveries']} deliveries are missing")
+    return problems
+
+
+def cleanup(client, clients):
+    """Drops the presence state of the synthetic rooms from the scratch Redis"""
+    keys = []
+    for room_id in range(FIRST_SYNTHETIC_ID, FIRST_SYNTHETIC_ID + clients):
+        for namespace in ("private_chat", "community"):
+            presence = RoomPresence(namespace, room_id, "")
+            keys.extend([presence.key, presence.names_key, presence.pending_key, presence.flush_key])
+    for start in range(0, len(keys), 1000):
+        chunk = keys[start:start + 1000]
+        client.delete(*chunk)
+        client.hdel(ROOMS_KEY, *chunk)
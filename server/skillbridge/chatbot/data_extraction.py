@@ -1,36 +1,42 @@
+from django.db.models import Count
 from courses.models import Course, Category
 from tutor.models import TutorProfile
 
 
 """This function fetches the course data from database and returns it for creating promt for Gemini API with course information"""
-def extract_courses_data():
-    courses = Course.objects.all()
+def extract_courses_data(ids=None):
+    courses = Course.objects.select_related("tutor__user", "category").annotate(total_chapters=Count("modules"))
+    if ids is not None:
+        courses = courses.filter(id__in=ids)
     courses_data = []
-    
+
     for course in courses:
         course_info = {
             "id": course.id,
             "title": course.title,
             "description": course.description,
             "tutor": course.tutor.user.get_full_name(),
-            "category": course.category.name,
+            "category": course.category.name if course.category else None,
             "price": str(course.price),
             "rating": course.rating,
             "difficulty":course.skill_level,
-            "total_chapters":course.modules.count()
+            "total_chapters":course.total_chapters
             # Add other relevant fields
         }
         courses_data.append(course_info)
-    
+
     return courses_data
 
 """This function fetches the tutors data from the database and returns it for creating promt for Gemini API with tutor information """
-def extract_tutors_data():
-    tutors = TutorProfile.objects.all()
+def extract_tutors_data(ids=None):
+    tutors = TutorProfile.objects.select_related("user")
+    if ids is not None:
+        tutors = tutors.filter(id__in=ids)
     tutors_data = []
 
     for tutor in tutors:
         tutor_info = {
+            "id": tutor.id,
             "name":tutor.user.get_full_name(),
             "rating":tutor.rating,
             "current_job":tutor.cur_job_role,
@@ -38,4 +44,26 @@ def extract_tutors_data():
         }
         tutors_data.append(tutor_info)
 
-    return tutors_data
\ No newline at end of file
+    return tutors_data
+
+
+"""Searchable text of courses as (id, [(text, weight)]) for the chatbot index, ids=None yields every course"""
+def course_documents(ids=None):
+    courses = Course.objects.values_list(
+        "id", "title", "category__name", "tutor__user__first_name", "tutor__user__last_name", "description"
+    )
+    if ids is not None:
+        courses = courses.filter(id__in=ids)
+
+    for course_id, title, category, first_name, last_name, description in courses.iterator(chunk_size=2000):
+        yield course_id, [(title, 3), (category, 2), (first_name, 1), (last_name, 1), (description, 1)]
+
+
+"""Searchable text of tutors as (id, [(text, weight)]) for the chatbot index, ids=None yields every tutor"""
+def tutor_documents(ids=None):
+    tutors = TutorProfile.objects.values_list("id", "user__first_name", "user__last_name", "cur_job_role", "user__bio")
+    if ids is not None:
+        tutors = tutors.filter(id__in=ids)
+
+    for tutor_id, first_name, last_name, job_role, bio in tutors.iterator(chunk_size=2000):
+        yield tutor_id, [(first_name, 3), (last_name, 3), (job_role, 2), (bio, 1)]
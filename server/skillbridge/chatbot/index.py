@@ -0,0 +1,210 @@
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from operator import itemgetter
+from django.db import transaction
+from base.redis_client import get_redis
+from .data_extraction import course_documents, tutor_documents
+
+logger = logging.getLogger(__name__)
+
+
+"""
+In-process BM25 retrieval over courses and tutors for the chatbot context. Each process builds the inverted
+index once and then keeps it current from a change log in Redis: the signal handlers in chatbot/signals.py
+record the changed documents after commit, and every lookup re-indexes what changed since the process last
+synced, so workers that didn't handle the write pick it up too. The index only holds terms, the course and
+tutor details of the hits are read fresh from the database.
+"""
+
+COURSE = "course"
+TUTOR = "tutor"
+CHANGES_KEY = "chatbot:index_changes"
+CHANGE_RETENTION = 60 * 60 * 24
+# Re-reads a few seconds of the log on every sync, applying a change twice is harmless
+SYNC_OVERLAP = 5
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from how i in is it me my of on or the to what which who with you your".split()
+)
+
+_index = None
+_synced_at = 0.0
+_lock = threading.Lock()
+_build_lock = threading.Lock()
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall((text or "").lower()) if token not in STOP_WORDS]
+
+
+class InvertedIndex:
+    """BM25 over weighted fields, a field's terms count weight times"""
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)  # term -> {doc_id: weighted term frequency}
+        self.doc_terms = {}  # doc_id -> Counter of its terms, needed to take a document out again
+        self.doc_lengths = {}
+        self.total_length = 0
+        self._length_norms = None  # BM25 length normalisation per document, recomputed after changes
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, doc_id, fields):
+        """Indexes [(text, weight)], replacing the document if it was indexed before"""
+        self.remove(doc_id)
+        terms = Counter()
+        for text, weight in fields:
+            for token in tokenize(text):
+                terms[token] += weight
+        if not terms:
+            return
+
+        for token, frequency in terms.items():
+            self.postings[token][doc_id] = frequency
+        self.doc_terms[doc_id] = terms
+        self.doc_lengths[doc_id] = sum(terms.values())
+        self.total_length += self.doc_lengths[doc_id]
+        self._length_norms = None
+
+    def remove(self, doc_id):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for token in terms:
+            postings = self.postings[token]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[token]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        self._length_norms = None
+
+    def length_norms(self):
+        if self._length_norms is None:
+            average_length = self.total_length / len(self.doc_lengths)
+            self._length_norms = {
+                doc_id: self.k1 * (1 - self.b + self.b * length / average_length)
+                for doc_id, length in self.doc_lengths.items()
+            }
+        return self._length_norms
+
+    def search(self, query, limit=5):
+        """[(doc_id, score)] of the best matching documents, best first"""
+        if not self.doc_lengths:
+            return []
+        total_docs = len(self.doc_lengths)
+        norms = self.length_norms()
+        saturation = self.k1 + 1
+        scores = defaultdict(float)
+
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                scores[doc_id] += idf * frequency * saturation / (frequency + norms[doc_id])
+
+        return heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+
+
+def _load(kind, index, ids=None):
+    """(Re)indexes the documents of one kind, ids=None loads all of them. Returns the ids that were found"""
+    documents = course_documents(ids) if kind == COURSE else tutor_documents(ids)
+    found = set()
+    for doc_id, fields in documents:
+        index.add(doc_id, fields)
+        found.add(doc_id)
+    return found
+
+
+def build_index():
+    started = time.perf_counter()
+    index = {COURSE: InvertedIndex(), TUTOR: InvertedIndex()}
+    for kind, kind_index in index.items():
+        _load(kind, kind_index)
+    logger.info(
+        f"Built chatbot index with {len(index[COURSE])} courses and {len(index[TUTOR])} tutors "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
+    return index
+
+
+def apply_changes(index, changes):
+    """Re-reads the changed "<kind>:<id>" documents, the ones that no longer exist are dropped"""
+    by_kind = defaultdict(set)
+    for change in changes:
+        kind, _, doc_id = change.partition(":")
+        if kind in index:
+            by_kind[kind].add(int(doc_id))
+    for kind, ids in by_kind.items():
+        found = _load(kind, index[kind], ids)
+        for doc_id in ids - found:
+            index[kind].remove(doc_id)
+
+
+def get_index():
+    global _synced_at
+    if _index is None or time.time() - _synced_at > CHANGE_RETENTION:
+        # Past the retention the log may have lost changes, so rebuild instead
+        return _rebuild_index()
+
+    with _lock:
+        started = time.time()
+        try:
+            changes = get_redis().zrangebyscore(CHANGES_KEY, _synced_at - SYNC_OVERLAP, "+inf")
+        except Exception as e:
+            # Serve what we have, the changes are picked up again from _synced_at once Redis is back
+            logger.warning(f"Chatbot index sync failed: {e}")
+            return _index
+        if changes:
+            apply_changes(_index, changes)
+        _synced_at = started
+        return _index
+
+
+def _rebuild_index():
+    """
+    Builds outside _lock, the build reads every course and tutor. Only one thread builds, the others keep serving
+    the current index meanwhile, or wait for the build when there is none yet
+    """
+    global _index, _synced_at
+    if not _build_lock.acquire(blocking=_index is None):
+        return _index
+    try:
+        started = time.time()
+        if _index is None or started - _synced_at > CHANGE_RETENTION:
+            index = build_index()
+            with _lock:
+                _index, _synced_at = index, started
+        return _index
+    finally:
+        _build_lock.release()
+
+
+def search(kind, query, limit=5):
+    return [doc_id for doc_id, _ in get_index()[kind].search(query, limit)]
+
+
+def record_changes(kind, ids):
+    """Logs changed documents once the surrounding transaction commits"""
+    ids = [doc_id for doc_id in ids if doc_id is not None]
+    if not ids:
+        return
+
+    def record():
+        now = time.time()
+        pipeline = get_redis().pipeline(transaction=False)
+        pipeline.zadd(CHANGES_KEY, {f"{kind}:{doc_id}": now for doc_id in ids})
+        pipeline.zremrangebyscore(CHANGES_KEY, "-inf", now - CHANGE_RETENTION)
+        pipeline.execute()
+
+    transaction.on_commit(record)
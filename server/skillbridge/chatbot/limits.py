@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import weakref
+from django.conf import settings
+from base.redis_client import get_async_redis
+from .metrics import arecord_queue_depth, arecord_queue_wait, arecord_rejection
+
+logger = logging.getLogger(__name__)
+
+
+"""
+Admission control for the chatbot endpoints, so chatbot traffic can't take over the workers that serve the rest of
+the API. Every request first passes a per client rate limit (a fixed window counter in Redis, shared by all
+workers) and then waits for one of settings.CHATBOT_MAX_CONCURRENCY generation slots of its process. At most
+CHATBOT_MAX_QUEUE requests wait at a time and none longer than CHATBOT_QUEUE_TIMEOUT, the rest are turned away
+with a Retry-After instead of piling up. The slot counts of every process are published for the admin metrics.
+
+Clients are told apart by IP address. daphne runs with --proxy-headers (docker-compose.yml and the Dockerfile), so
+behind the reverse proxy REMOTE_ADDR is the client from X-Forwarded-For rather than the proxy. Without a proxy in
+front, drop the flag, or clients could pick their own address.
+"""
+
+RATE_LIMIT_KEY = "chatbot:rate:{client}"
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_gates = weakref.WeakKeyDictionary()
+# Keeps the metrics tasks referenced until they finish
+_pending_metrics = set()
+
+
+def _in_background(coroutine):
+    task = asyncio.create_task(coroutine)
+    _pending_metrics.add(task)
+    task.add_done_callback(_pending_metrics.discard)
+
+
+class Rejected(Exception):
+    """Raised when a request is not admitted, carries the HTTP status and the seconds to wait before retrying"""
+
+    def __init__(self, status, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+class ConcurrencyGate:
+    """
+    Bounded semaphore with a bounded, timed wait queue in front of it. The counters are only updated between awaits
+    and the metrics go out on their own tasks, so a request cancelled by a client disconnect can't leave a slot or
+    a queue place counted
+    """
+
+    def __init__(self, limit, max_waiting, timeout):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+
+    def busy(self):
+        return Rejected(503, "The assistant is busy right now, please try again shortly.", max(round(self.timeout), 1))
+
+    async def check_capacity(self):
+        """Turns the request away straight away when the wait queue is already full"""
+        if self.waiting >= self.max_waiting and self.semaphore.locked():
+            _in_background(arecord_rejection("queue_full"))
+            raise self.busy()
+
+    async def acquire(self):
+        await self.check_capacity()
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            self.publish()
+            await asyncio.wait_for(self.semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            _in_background(arecord_rejection("queue_timeout"))
+            raise self.busy()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            self.publish()
+            _in_background(arecord_queue_wait(time.perf_counter() - started))
+        except BaseException:
+            self.release_slot()
+            raise
+
+    async def release(self):
+        self.release_slot()
+
+    def release_slot(self):
+        self.active -= 1
+        self.semaphore.release()
+        self.publish()
+
+    def publish(self):
+        _in_background(arecord_queue_depth(PROCESS_ID, self.active, self.waiting, self.limit))
+
+
+def get_gate():
+    """The gate of the running event loop, asyncio primitives can't be shared between loops"""
+    loop = asyncio.get_running_loop()
+    gate = _gates.get(loop)
+    if gate is None:
+        gate = ConcurrencyGate(
+            settings.CHATBOT_MAX_CONCURRENCY, settings.CHATBOT_MAX_QUEUE, settings.CHATBOT_QUEUE_TIMEOUT
+        )
+        _gates[loop] = gate
+    return gate
+
+
+def client_key(request):
+    return request.META.get("REMOTE_ADDR") or "unknown"
+
+
+async def check_rate_limit(client):
+    """Counts the request against the client's window, raises Rejected once the window is used up"""
+    key = RATE_LIMIT_KEY.format(client=client)
+    try:
+        pipeline = get_async_redis().pipeline(transaction=True)
+        pipeline.set(key, 0, ex=settings.CHATBOT_RATE_WINDOW, nx=True)
+        pipeline.incr(key)
+        pipeline.ttl(key)
+        _, count, ttl = await pipeline.execute()
+    except Exception as e:
+        # Rather serve without a limit than fail every chatbot request while Redis is down
+        logger.warning(f"Chatbot rate limit check failed: {e}")
+        return
+
+    if count > settings.CHATBOT_RATE_LIMIT:
+        await arecord_rejection("rate_limited")
+        raise Rejected(429, "Too many questions, please wait a moment before asking again.", max(ttl, 1))
+
+
+class Admission:
+    """
+    Admission of one chatbot request. check() applies the rate limit and the queue bound and is meant to run before
+    the response starts, so a rejection still gets a proper status code. "async with" then holds a generation slot
+    around the call to the model, waiting for one if needed. Both raise Rejected
+    """
+
+    def __init__(self, request):
+        self.client = client_key(request)
+        self.gate = get_gate()
+
+    async def check(self):
+        await check_rate_limit(self.client)
+        await self.gate.check_capacity()
+
+    async def __aenter__(self):
+        await self.gate.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.gate.release()
+        return False
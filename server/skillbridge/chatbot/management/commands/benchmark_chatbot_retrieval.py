@@ -0,0 +1,101 @@
+import itertools
+import random
+import tempfile
+import time
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.index import COURSE, InvertedIndex
+from chatbot import vectors
+
+DEFAULT_DOCUMENTS = {"bm25": 10000, "vector": 100000}
+
+
+def synthetic_corpus(documents, vocabulary_size, seed):
+    """Course-like documents over a Zipf distributed vocabulary, so a few terms are common and most are rare"""
+    rng = random.Random(seed)
+    vocabulary = [f"term{n}" for n in range(vocabulary_size)]
+    cumulative_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(vocabulary_size)))
+
+    def words(count):
+        return " ".join(rng.choices(vocabulary, cum_weights=cumulative_weights, k=count))
+
+    corpus = [(doc_id, [(words(6), 3), (words(1), 2), (words(2), 1), (words(60), 1)]) for doc_id in range(documents)]
+    return corpus, lambda: words(rng.randint(2, 5))
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+
+def timed(function, items):
+    latencies = []
+    for item in items:
+        started = time.perf_counter()
+        function(item)
+        latencies.append(time.perf_counter() - started)
+    return sorted(latencies)
+
+
+class Command(BaseCommand):
+    help = 'Measure chatbot retrieval build time and query latency on a synthetic corpus, without touching the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engine', choices=('bm25', 'vector', 'all'), default='all')
+        parser.add_argument('--documents', type=int, help='Corpus size, 10k for bm25 and 100k for vector by default')
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=32, help='Queries per batch for the batched vector run')
+        parser.add_argument('--vocabulary', type=int, default=20000)
+        parser.add_argument('--limit', type=int, default=5, help='Results per query')
+        parser.add_argument('--dim', type=int, help='Vector dimension, settings.CHATBOT_VECTOR_DIM by default')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        engines = ('bm25', 'vector') if options['engine'] == 'all' else (options['engine'],)
+        if 'vector' in engines and not vectors.is_available():
+            if options['engine'] == 'vector':
+                raise CommandError('numpy is not installed')
+            self.stdout.write(self.style.WARNING('numpy is not installed, skipping the vector engine'))
+            engines = ('bm25',)
+
+        for engine in engines:
+            size = options['documents'] or DEFAULT_DOCUMENTS[engine]
+            corpus, make_query = synthetic_corpus(size, options['vocabulary'], options['seed'])
+            queries = [make_query() for _ in range(options['queries'])]
+            getattr(self, f"benchmark_{engine}")(corpus, queries, options)
+
+    def benchmark_bm25(self, corpus, queries, options):
+        started = time.perf_counter()
+        index = InvertedIndex()
+        for doc_id, fields in corpus:
+            index.add(doc_id, fields)
+        build_seconds = time.perf_counter() - started
+
+        latencies = timed(lambda query: index.search(query, options['limit']), queries)
+        self.stdout.write(self.style.MIGRATE_HEADING(f"bm25: {len(index)} documents, {len(index.postings)} terms"))
+        self.stdout.write(f"  build   {build_seconds:.2f}s")
+        self.write_latencies("query", latencies)
+
+    def benchmark_vector(self, corpus, queries, options):
+        with tempfile.TemporaryDirectory() as directory:
+            built = vectors.build_vector_index(
+                directory, documents=lambda: ((COURSE, doc_id, fields) for doc_id, fields in corpus), dim=options['dim']
+            )
+            reader = vectors.VectorReader(directory)
+            reader.refresh()
+
+            latencies = timed(lambda query: reader.search(COURSE, query, options['limit']), queries)
+            batches = [queries[start:start + options['batch_size']] for start in range(0, len(queries), options['batch_size'])]
+            batch_latencies = timed(lambda batch: reader.search_many(COURSE, batch, options['limit']), batches)
+
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"vector: {built['documents']} documents x {reader.matrix.shape[1]} dims, {built['bytes'] / 2**20:.1f} MiB mapped"
+            ))
+            self.stdout.write(f"  build   {built['seconds']:.2f}s")
+            self.write_latencies("query", latencies)
+            self.write_latencies(f"batch of {options['batch_size']}", batch_latencies)
+            del reader
+
+    def write_latencies(self, label, latencies):
+        self.stdout.write(
+            f"  {label}   p50 {percentile(latencies, 0.5):.3f}ms  p90 {percentile(latencies, 0.9):.3f}ms  "
+            f"p99 {percentile(latencies, 0.99):.3f}ms  max {latencies[-1] * 1000:.3f}ms over {len(latencies)} runs"
+        )
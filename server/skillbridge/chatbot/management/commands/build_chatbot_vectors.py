@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.vectors import is_available, refresh_vector_index
+
+
+class Command(BaseCommand):
+    help = 'Build the chatbot vector index from scratch, or apply pending changes with --incremental'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true', help='Only re-embed what changed since the last run')
+
+    def handle(self, *args, **options):
+        if not is_available():
+            raise CommandError('numpy is not installed, the chatbot falls back to keyword retrieval')
+
+        result = refresh_vector_index(rebuild=not options['incremental'])
+        if result is None:
+            raise CommandError('Another process is writing the vector index, try again later')
+        if 'documents' in result:
+            self.stdout.write(self.style.SUCCESS(
+                f"Embedded {result['documents']} documents in {result['seconds']:.2f}s ({result['bytes'] / 2**20:.1f} MiB)"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Re-embedded {result['updated']} changed document(s)"))
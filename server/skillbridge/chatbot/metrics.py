@@ -0,0 +1,138 @@
+import json
+import logging
+import time
+from base.redis_client import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+
+"""
+Latency samples and counters of chatbot answers, kept in Redis so every worker reports into the same place.
+Time to first token is measured from the request reaching the view to the first chunk of the answer,
+for cached and non streamed answers it equals the total time. Recording never fails the request it measures.
+
+Each process also publishes the state of its generation slots (see chatbot/limits.py): how many generations run,
+how many requests wait for one, and how long admitted requests waited.
+"""
+
+SAMPLES = 1000
+COUNTERS_KEY = "chatbot:metrics:counters"
+TTFT_KEY = "chatbot:metrics:ttft_ms"
+TOTAL_KEY = "chatbot:metrics:total_ms"
+QUEUE_WAIT_KEY = "chatbot:metrics:queue_wait_ms"
+QUEUE_KEY = "chatbot:metrics:queue"
+# A process that hasn't reported for this long is assumed gone, idle ones report 0 anyway
+QUEUE_STALE_AFTER = 60 * 10
+
+
+def _queue_sample(pipeline, ttft, total, streamed, cached):
+    pipeline.lpush(TTFT_KEY, round(ttft * 1000, 1))
+    pipeline.ltrim(TTFT_KEY, 0, SAMPLES - 1)
+    pipeline.lpush(TOTAL_KEY, round(total * 1000, 1))
+    pipeline.ltrim(TOTAL_KEY, 0, SAMPLES - 1)
+    pipeline.hincrby(COUNTERS_KEY, "answers", 1)
+    if streamed:
+        pipeline.hincrby(COUNTERS_KEY, "streamed", 1)
+    if cached:
+        pipeline.hincrby(COUNTERS_KEY, "cached", 1)
+
+
+def record_answer(ttft, total, streamed=False, cached=False):
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        _queue_sample(pipeline, ttft, total, streamed, cached)
+        pipeline.execute()
+    except Exception as e:
+        logger.warning(f"Failed to record chatbot metrics: {e}")
+
+
+async def arecord_answer(ttft, total, streamed=False, cached=False):
+    try:
+        pipeline = get_async_redis().pipeline(transaction=False)
+        _queue_sample(pipeline, ttft, total, streamed, cached)
+        await pipeline.execute()
+    except Exception as e:
+        logger.warning(f"Failed to record chatbot metrics: {e}")
+
+
+def record_failure():
+    try:
+        get_redis().hincrby(COUNTERS_KEY, "failed", 1)
+    except Exception as e:
+        logger.warning(f"Failed to record chatbot metrics: {e}")
+
+
+async def arecord_failure():
+    try:
+        await get_async_redis().hincrby(COUNTERS_KEY, "failed", 1)
+    except Exception as e:
+        logger.warning(f"Failed to record chatbot metrics: {e}")
+
+
+async def arecord_rejection(reason):
+    try:
+        await get_async_redis().hincrby(COUNTERS_KEY, reason, 1)
+    except Exception as e:
+        logger.warning(f"Failed to record chatbot metrics: {e}")
+
+
+async def arecord_queue_wait(seconds):
+    try:
+        pipeline = get_async_redis().pipeline(transaction=False)
+        pipeline.lpush(QUEUE_WAIT_KEY, round(seconds * 1000, 1))
+        pipeline.ltrim(QUEUE_WAIT_KEY, 0, SAMPLES - 1)
+        await pipeline.execute()
+    except Exception as e:
+        logger.warning(f"Failed to record chatbot metrics: {e}")
+
+
+async def arecord_queue_depth(process, active, waiting, limit):
+    try:
+        await get_async_redis().hset(QUEUE_KEY, process, json.dumps(
+            {"active": active, "waiting": waiting, "limit": limit, "updated_at": time.time()}
+        ))
+    except Exception as e:
+        logger.warning(f"Failed to record chatbot metrics: {e}")
+
+
+def _queue_depth(reports):
+    now = time.time()
+    processes = {}
+    for process, report in reports.items():
+        report = json.loads(report)
+        if now - report["updated_at"] < QUEUE_STALE_AFTER:
+            processes[process] = report
+    return {
+        "active": sum(report["active"] for report in processes.values()),
+        "waiting": sum(report["waiting"] for report in processes.values()),
+        "capacity": sum(report["limit"] for report in processes.values()),
+        "processes": processes,
+    }
+
+
+def _percentiles(samples):
+    ordered = sorted(float(sample) for sample in samples)
+    if not ordered:
+        return None
+    return {
+        f"p{int(fraction * 100)}": ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+        for fraction in (0.5, 0.9, 0.99)
+    }
+
+
+def get_chatbot_metrics():
+    pipeline = get_redis().pipeline(transaction=False)
+    pipeline.hgetall(COUNTERS_KEY)
+    pipeline.lrange(TTFT_KEY, 0, -1)
+    pipeline.lrange(TOTAL_KEY, 0, -1)
+    pipeline.lrange(QUEUE_WAIT_KEY, 0, -1)
+    pipeline.hgetall(QUEUE_KEY)
+    counters, ttft, total, queue_wait, queue = pipeline.execute()
+    return {
+        "counters": {name: int(value) for name, value in counters.items()},
+        "ttft_ms": _percentiles(ttft),
+        "total_ms": _percentiles(total),
+        "samples": len(ttft),
+        "queue": _queue_depth(queue),
+        "queue_wait_ms": _percentiles(queue_wait),
+    }
@@ -1,10 +1,204 @@
-import google.generativeai as genai
+import hashlib
+import logging
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+from redis.exceptions import LockError
+from base.redis_client import get_async_redis
 
+logger = logging.getLogger(__name__)
 
 
-def initialize_gemini():
-    """Initializes the Gemini API for chatbot interactions using the provided API key."""
+"""
+LLM backends for the chatbot and the response cache in front of them. The backend class comes from
+settings.CHATBOT_BACKEND and is instantiated once per process, so the Gemini client is configured a single time.
+FakeBackend answers locally and is meant for tests and offline development. Backends also stream, chunk by chunk,
+for the server-sent events endpoint.
 
-    genai.configure(api_key=settings.GEMINI_API_KEY)
-    return genai.GenerativeModel('gemini-1.5-flash')
\ No newline at end of file
+Answers are cached per normalised question and retrieved context, so the same question asked against the same
+catalogue is answered from the cache and a catalogue change produces a new key. Concurrent identical questions are
+coalesced: the first request generates while the others wait on a Redis lock and then read its answer. A failed
+generation is remembered for settings.CHATBOT_FAILURE_CACHE_TTL seconds, so its followers fail at once rather than
+each calling the backend again in turn. Only the request that calls the backend takes a generation slot, cache hits
+and waiting followers don't.
+
+The async entry points run the blocking backend calls on a dedicated pool of settings.CHATBOT_MAX_CONCURRENCY
+threads, so slow generations never hold the event loop or the threads that serve the rest of the API.
+"""
+
+_backend = None
+_backend_lock = threading.Lock()
+_executor = None
+
+
+class GenerationFailed(Exception):
+    """Raised to requests that were coalesced behind a generation that failed a moment ago"""
+
+
+class LLMBackend(ABC):
+    """Interface of the chatbot backends"""
+
+    name = "base"
+
+    @abstractmethod
+    def generate(self, prompt):
+        """Returns the whole answer to the prompt"""
+
+    def stream(self, prompt):
+        """Yields the answer in chunks as the model produces them, backends without streaming yield it whole"""
+        yield self.generate(prompt)
+
+
+class GeminiBackend(LLMBackend):
+
+    def __init__(self, model_name=None):
+        import google.generativeai as genai
+
+        genai.configure(api_key=settings.GEMINI_API_KEY)
+        self.name = model_name or settings.CHATBOT_MODEL
+        self.model = genai.GenerativeModel(self.name)
+
+    def generate(self, prompt):
+        return self.model.generate_content(prompt).text
+
+    def stream(self, prompt):
+        for chunk in self.model.generate_content(prompt, stream=True):
+            try:
+                text = chunk.text
+            except ValueError:
+                # .text raises for chunks without text parts, e.g. one cut by the safety filters
+                logger.warning(f"Skipped a Gemini chunk without text: {getattr(chunk, 'prompt_feedback', '')}")
+                continue
+            if text:
+                yield text
+
+
+class FakeBackend(LLMBackend):
+    """Deterministic local answers after an optional delay that stands in for model latency"""
+
+    name = "fake"
+
+    def __init__(self, delay=None, token_delay=None):
+        self.delay = settings.CHATBOT_FAKE_DELAY if delay is None else delay
+        self.token_delay = settings.CHATBOT_FAKE_TOKEN_DELAY if token_delay is None else token_delay
+
+    def answer(self, prompt):
+        question = prompt.rsplit("User question:", 1)[-1].split("\n", 1)[0].strip()
+        return f"This is a placeholder answer to: {question}"
+
+    def generate(self, prompt):
+        if self.delay:
+            time.sleep(self.delay)
+        return self.answer(prompt)
+
+    def stream(self, prompt):
+        if self.delay:
+            time.sleep(self.delay)
+        for index, word in enumerate(self.answer(prompt).split(" ")):
+            if index and self.token_delay:
+                time.sleep(self.token_delay)
+            yield word if index == 0 else f" {word}"
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        # Generation threads can get here at the same time, only one of them configures the client
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.CHATBOT_BACKEND)()
+    return _backend
+
+
+def generation_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.CHATBOT_MAX_CONCURRENCY, thread_name_prefix="chatbot")
+    return _executor
+
+
+def _off_loop(function):
+    return sync_to_async(function, thread_sensitive=False, executor=generation_executor())
+
+
+def normalize_question(question):
+    """Case, punctuation and whitespace insensitive form of a question, used for the cache key"""
+    return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+
+
+def response_cache_key(question, context):
+    raw = f"{get_backend().name}\n{normalize_question(question)}\n{context}"
+    return f"chatbot_response_{hashlib.sha256(raw.encode()).hexdigest()}"
+
+
+async def agenerate_response(question, context, prompt, slot=None):
+    """
+    Returns (answer, cached). slot is an async context manager held only around the backend call (the request's
+    generation slot, see chatbot/limits.py), so cache hits and requests waiting on a leader never take one
+    """
+    slot = slot or nullcontext()
+    key = response_cache_key(question, context)
+    failed_key = f"{key}:failed"
+    found = await cache.aget_many([key, failed_key])
+    if key in found:
+        return found[key], True
+    if failed_key in found:
+        raise GenerationFailed(found[failed_key])
+
+    lock = get_async_redis().lock(f"{key}:flight", timeout=settings.CHATBOT_GENERATION_TIMEOUT)
+    if not await lock.acquire(blocking=True, blocking_timeout=settings.CHATBOT_GENERATION_TIMEOUT):
+        # The leader is taking too long, answer on our own rather than keep the user waiting
+        logger.warning("Chatbot request coalescing timed out, generating without the lock")
+        async with slot:
+            return await _off_loop(get_backend().generate)(prompt), False
+
+    try:
+        # Whoever held the lock before us may have answered the same question, or failed to
+        found = await cache.aget_many([key, failed_key])
+        if key in found:
+            return found[key], True
+        if failed_key in found:
+            raise GenerationFailed(found[failed_key])
+        async with slot:
+            try:
+                answer = await _off_loop(get_backend().generate)(prompt)
+            except Exception as e:
+                await cache.aset(failed_key, f"{type(e).__name__}: {e}", settings.CHATBOT_FAILURE_CACHE_TTL)
+                raise
+        await cache.aset(key, answer, settings.CHATBOT_RESPONSE_CACHE_TTL)
+        return answer, False
+    finally:
+        try:
+            await lock.release()
+        except LockError:
+            pass  # Expired while generating
+
+
+async def stream_response(question, context, prompt, slot=None):
+    """
+    Async generator of (chunk, cached) for the streaming endpoint. A cached answer comes back as one chunk, otherwise
+    the backend's chunks are forwarded as they arrive, holding slot, and the full answer is cached at the end.
+    Streams are not coalesced, a follower could only start once the leader finished
+    """
+    key = response_cache_key(question, context)
+    answer = await cache.aget(key)
+    if answer is not None:
+        yield answer, True
+        return
+
+    chunks = []
+    async with slot or nullcontext():
+        # Each chunk is pulled on a generation thread so a slow model never blocks the event loop
+        iterator = await _off_loop(lambda: iter(get_backend().stream(prompt)))()
+        done = object()
+        while (chunk := await _off_loop(next)(iterator, done)) is not done:
+            chunks.append(chunk)
+            yield chunk, False
+    await cache.aset(key, "".join(chunks), settings.CHATBOT_RESPONSE_CACHE_TTL)
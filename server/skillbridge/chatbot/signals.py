@@ -0,0 +1,37 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.contrib.auth import get_user_model
+from courses.models import Category, Course
+from tutor.models import TutorProfile
+from .index import COURSE, TUTOR, record_changes
+
+User = get_user_model()
+
+
+"""Logs the courses and tutors whose searchable text changed, every process re-indexes them on its next lookup"""
+
+@receiver([post_save, post_delete], sender=Course)
+def course_changed(sender, instance, **kwargs):
+    record_changes(COURSE, [instance.pk])
+
+
+@receiver([post_save, post_delete], sender=TutorProfile)
+def tutor_profile_changed(sender, instance, **kwargs):
+    record_changes(TUTOR, [instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def category_changed(sender, instance, created, **kwargs):
+    if not created:
+        record_changes(COURSE, Course.objects.filter(category=instance).values_list("id", flat=True))
+
+
+@receiver(post_save, sender=User)
+def tutor_user_changed(sender, instance, created, update_fields=None, **kwargs):
+    """Tutor names and bios live on User and are indexed with the tutor and their courses"""
+    if created or instance.role != "tutor":
+        return
+    if update_fields and not {"first_name", "last_name", "bio"} & set(update_fields):
+        return
+    record_changes(TUTOR, TutorProfile.objects.filter(user=instance).values_list("id", flat=True))
+    record_changes(COURSE, Course.objects.filter(tutor__user=instance).values_list("id", flat=True))
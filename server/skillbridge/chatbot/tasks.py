@@ -0,0 +1,24 @@
+import logging
+from celery import shared_task
+from .vectors import is_available, refresh_vector_index
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def refresh_chatbot_vectors():
+    """Re-embeds the courses and tutors changed since the last run"""
+    if not is_available():
+        return None
+    return refresh_vector_index()
+
+
+@shared_task
+def rebuild_chatbot_vectors():
+    """Full rebuild, the only point where the idf table catches up with the content"""
+    if not is_available():
+        return None
+    result = refresh_vector_index(rebuild=True)
+    if result:
+        logger.info(f"Rebuilt chatbot vectors: {result['documents']} documents in {result['seconds']:.1f}s")
+    return result
@@ -1,3 +1,388 @@
-from django.test import TestCase
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock, skipUnless
+from django.core.cache import cache
+from django.test import AsyncClient, SimpleTestCase, override_settings
+from base.redis_client import get_redis
+from base.testing import isolated_services
+from .index import COURSE, TUTOR
+from .limits import RATE_LIMIT_KEY, ConcurrencyGate, get_gate
+from .services import FakeBackend, GeminiBackend, LLMBackend, agenerate_response, response_cache_key
+from . import index, vectors
 
-# Create your tests here.
+
+COURSES = {
+    1: [("Django for beginners", 3), ("Build web apps with python and django", 1)],
+    2: [("Watercolor painting", 3), ("Brushes, paper and color mixing", 1)],
+}
+
+
+class IndexSyncTests(SimpleTestCase):
+
+    def setUp(self):
+        self.current = {COURSE: "current", TUTOR: "current"}
+        for name, value in (("_index", self.current), ("_synced_at", time.time() - 60)):
+            patcher = mock.patch.object(index, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_redis_errors_serve_the_current_index(self):
+        synced_at = index._synced_at
+        with mock.patch.object(index, "get_redis", side_effect=ConnectionError("redis down")):
+            with self.assertLogs("chatbot.index", "WARNING"):
+                self.assertIs(index.get_index(), self.current)
+        self.assertEqual(index._synced_at, synced_at)
+
+    def test_stale_index_is_served_while_another_thread_rebuilds(self):
+        index._synced_at = time.time() - index.CHANGE_RETENTION - 1
+        with mock.patch.object(index, "build_index") as build_index:
+            with index._build_lock:
+                self.assertIs(index.get_index(), self.current)
+            build_index.assert_not_called()
+
+            rebuilt = index.get_index()
+        self.assertIs(rebuilt, build_index.return_value)
+
+
+@skipUnless(vectors.is_available(), "numpy is not installed")
+class VectorIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        temporary = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary.cleanup)
+        self.directory = Path(temporary.name)
+        self.courses = dict(COURSES)
+        vectors.build_vector_index(
+            self.directory, documents=lambda: ((COURSE, doc_id, fields) for doc_id, fields in self.courses.items()), dim=256
+        )
+        self.reader = vectors.VectorReader(self.directory)
+
+    def update(self, *doc_ids):
+        loaders = {COURSE: lambda ids: [(doc_id, self.courses[doc_id]) for doc_id in ids if doc_id in self.courses]}
+        return vectors.update_vector_index([f"{COURSE}:{doc_id}" for doc_id in doc_ids], self.directory, loaders)
+
+    def matrix_file(self):
+        return vectors._read_meta(self.directory)["matrix"]
+
+    def search(self, query):
+        return [doc_id for doc_id, _ in self.reader.search(COURSE, query)]
+
+    def test_build_ranks_by_similarity(self):
+        self.assertEqual(self.search("django"), [1])
+        self.assertEqual(self.search("painting with color"), [2])
+        self.assertEqual(self.reader.search(TUTOR, "django"), [])
+
+    def test_append_grows_then_fills_in_place(self):
+        built_file = self.matrix_file()
+        self.courses[3] = [("Rust systems programming", 3)]
+        self.assertEqual(self.update(3), 1)
+        grown_file = self.matrix_file()
+        # The built matrix had no spare rows, the copy has twice the capacity under a new name
+        self.assertNotEqual(grown_file, built_file)
+        self.assertFalse((self.directory / built_file).exists())
+        self.assertEqual(self.search("rust programming"), [3])
+
+        self.courses[4] = [("Go concurrency patterns", 3)]
+        self.update(4)
+        self.assertEqual(self.matrix_file(), grown_file)
+        self.assertEqual(self.search("go concurrency"), [4])
+        self.assertEqual(self.search("django"), [1])
+
+    def test_deleted_document_is_zeroed(self):
+        self.search("django")
+        del self.courses[1]
+        self.update(1)
+        self.assertEqual(self.search("django"), [])
+        meta = vectors._read_meta(self.directory)
+        self.assertEqual(meta["kinds"][meta["ids"].index(1)], vectors.DELETED)
+        self.assertEqual(self.search("watercolor"), [2])
+
+    def test_changed_document_is_rewritten_in_place(self):
+        self.courses[2] = [("Django REST framework", 3)]
+        built_file = self.matrix_file()
+        self.update(2)
+        self.assertEqual(self.matrix_file(), built_file)
+        self.assertEqual(self.search("watercolor"), [])
+        self.assertEqual(set(self.search("django")), {1, 2})
+
+    @mock.patch("chatbot.vectors.get_redis")
+    def test_refresh_rebuilds_on_a_new_dimension(self, get_redis):
+        get_redis.return_value.lock.return_value.acquire.return_value = True
+        with self.settings(CHATBOT_VECTOR_DIM=512):
+            with mock.patch("chatbot.vectors._all_documents", lambda: ((COURSE, doc_id, fields) for doc_id, fields in self.courses.items())):
+                vectors.refresh_vector_index(self.directory)
+        self.assertEqual(vectors._read_meta(self.directory)["dim"], 512)
+        self.assertEqual(self.search("django"), [1])
+
+
+async def slow_metrics(*args):
+    await asyncio.sleep(1)
+
+
+@mock.patch("chatbot.limits.arecord_queue_depth", slow_metrics)
+@mock.patch("chatbot.limits.arecord_queue_wait", slow_metrics)
+class ConcurrencyGateTests(SimpleTestCase):
+    """Client disconnects cancel the view task at any await, the gate's counts have to survive that"""
+
+    async def test_cancelled_waiter_leaves_no_counts(self):
+        gate = ConcurrencyGate(1, 2, 5)
+        await gate.acquire()
+        waiter = asyncio.create_task(gate.acquire())
+        while not gate.waiting:
+            await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        self.assertEqual((gate.active, gate.waiting), (1, 0))
+
+        await gate.release()
+        self.assertEqual((gate.active, gate.waiting), (0, 0))
+        self.assertFalse(gate.semaphore.locked())
+
+    async def test_cancelling_at_any_point_frees_the_slot(self):
+        gate = ConcurrencyGate(1, 2, 5)
+        for ticks in range(5):
+            task = asyncio.create_task(gate.acquire())
+            for _ in range(ticks):
+                await asyncio.sleep(0)
+            task.cancel()
+            if not (await asyncio.gather(task, return_exceptions=True))[0]:
+                await gate.release()
+            self.assertEqual((gate.active, gate.waiting), (0, 0), ticks)
+            self.assertFalse(gate.semaphore.locked(), ticks)
+
+
+@isolated_services
+@override_settings(CHATBOT_RATE_LIMIT=100, CHATBOT_MAX_CONCURRENCY=1, CHATBOT_MAX_QUEUE=1, CHATBOT_QUEUE_TIMEOUT=5)
+@mock.patch("chatbot.views.retrieve_relevant_context", lambda message: "Courses: Django for beginners")
+class ChatbotViewTests(SimpleTestCase):
+    """The rate limit counts in the Redis of settings.REDIS_URL, see base/testing.py"""
+
+    def setUp(self):
+        self.client = AsyncClient()
+        cache.clear()
+        rate_key = RATE_LIMIT_KEY.format(client="127.0.0.1")
+        get_redis().delete(rate_key)
+        self.addCleanup(get_redis().delete, rate_key)
+        backend = mock.patch("chatbot.services._backend", FakeBackend(delay=0.5, token_delay=0))
+        backend.start()
+        self.addCleanup(backend.stop)
+
+    def ask(self, message):
+        return self.client.post("/api/chatbot/chat/", {"message": message}, content_type="application/json")
+
+    async def hold_the_slot(self, message):
+        """Starts a generation and waits until it holds the only slot"""
+        task = asyncio.create_task(self.ask(message))
+        for _ in range(100):
+            if get_gate().active:
+                return task
+            await asyncio.sleep(0.01)
+        self.fail("The generation never took the slot")
+
+    @override_settings(CHATBOT_RATE_LIMIT=2)
+    async def test_rate_limited_client_gets_429(self):
+        with mock.patch("chatbot.services._backend", FakeBackend(delay=0)):
+            statuses = [(await self.ask(f"Question {n}")).status_code for n in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        response = await self.ask("Question 4")
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+
+    @override_settings(CHATBOT_MAX_QUEUE=0)
+    async def test_full_queue_gets_503(self):
+        running = await self.hold_the_slot("First question")
+        response = await self.ask("Second question")
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+        self.assertEqual((await running).status_code, 200)
+
+    @override_settings(CHATBOT_QUEUE_TIMEOUT=0.1)
+    async def test_queue_timeout_gets_503(self):
+        running = await self.hold_the_slot("First question")
+        response = await self.ask("Second question")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertEqual((await running).status_code, 200)
+
+    @override_settings(CHATBOT_QUEUE_TIMEOUT=0.1)
+    async def test_cached_answer_skips_the_queue(self):
+        self.assertEqual((await self.ask("What is Django?")).status_code, 200)
+        running = await self.hold_the_slot("Another question")
+        response = await self.ask("what is django")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["response"], "This is a placeholder answer to: What is Django?")
+        await running
+
+    async def test_form_encoded_message_is_accepted(self):
+        with mock.patch("chatbot.services._backend", FakeBackend(delay=0)):
+            response = await self.client.post("/api/chatbot/chat/", {"message": "What is Django?"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["response"], "This is a placeholder answer to: What is Django?")
+
+    async def test_missing_message_gets_400(self):
+        for body in ({}, {"message": "   "}, {"message": 42}):
+            response = await self.client.post("/api/chatbot/chat/", body, content_type="application/json")
+            self.assertEqual(response.status_code, 400, body)
+
+    async def test_backend_failure_gets_503(self):
+        with mock.patch("chatbot.services._backend", CountingBackend(error=RuntimeError("model down"))):
+            with self.assertLogs("chatbot.views", "ERROR"):
+                response = await self.ask("What is Django?")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {"error": "The assistant is unavailable right now, please try again."})
+
+
+class CountingBackend(FakeBackend):
+
+    def __init__(self, delay=0, error=None):
+        super().__init__(delay=delay, token_delay=0)
+        self.error = error
+        self.calls = 0
+
+    def generate(self, prompt):
+        self.calls += 1
+        answer = super().generate(prompt)
+        if self.error:
+            raise self.error
+        return answer
+
+
+@isolated_services
+class ResponseCacheTests(SimpleTestCase):
+    """Coalescing locks live in the Redis of settings.REDIS_URL, see base/testing.py"""
+
+    context = "Courses: Django for beginners"
+
+    def setUp(self):
+        cache.clear()
+
+    def use_backend(self, backend):
+        patcher = mock.patch("chatbot.services._backend", backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return backend
+
+    def answer(self, question):
+        return agenerate_response(question, self.context, f"User question: {question}")
+
+    async def test_normalized_question_is_answered_from_the_cache(self):
+        backend = self.use_backend(CountingBackend())
+        first = await self.answer("What is Django?")
+        again = await self.answer("  what is   DJANGO ")
+        self.assertEqual(first, ("This is a placeholder answer to: What is Django?", False))
+        self.assertEqual(again, (first[0], True))
+        self.assertEqual(backend.calls, 1)
+
+    async def test_concurrent_identical_questions_share_one_generation(self):
+        backend = self.use_backend(CountingBackend(delay=0.3))
+        results = await asyncio.gather(*(self.answer("What is Django?") for _ in range(5)))
+        self.assertEqual(backend.calls, 1)
+        self.assertEqual(len({answer for answer, _ in results}), 1)
+        self.assertEqual(sorted(cached for _, cached in results), [False, True, True, True, True])
+
+    async def test_leader_failure_fails_its_followers_fast(self):
+        backend = self.use_backend(CountingBackend(delay=0.3, error=RuntimeError("model down")))
+        started = time.perf_counter()
+        results = await asyncio.gather(*(self.answer("What is Django?") for _ in range(5)), return_exceptions=True)
+        # Each follower retrying after the leader would take 5 x 0.3s
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertEqual(backend.calls, 1)
+        self.assertEqual(sorted(type(result).__name__ for result in results), ["GenerationFailed"] * 4 + ["RuntimeError"])
+
+
+class StreamingBackend(FakeBackend):
+    """Fails after the first token when error is set"""
+
+    def __init__(self, error=None):
+        super().__init__()
+        self.error = error
+
+    def stream(self, prompt):
+        for position, chunk in enumerate(super().stream(prompt)):
+            if position and self.error:
+                raise self.error
+            yield chunk
+
+
+@isolated_services
+@override_settings(CHATBOT_FAKE_DELAY=0, CHATBOT_FAKE_TOKEN_DELAY=0.01)
+@mock.patch("chatbot.views.retrieve_relevant_context", lambda message: ChatbotStreamTests.context)
+class ChatbotStreamTests(SimpleTestCase):
+    """The rate limit counts in the Redis of settings.REDIS_URL, see base/testing.py"""
+
+    context = "Courses: Django for beginners"
+
+    def setUp(self):
+        cache.clear()
+        rate_key = RATE_LIMIT_KEY.format(client="127.0.0.1")
+        self.addCleanup(get_redis().delete, rate_key)
+
+    async def events(self, message):
+        response = await AsyncClient().get("/api/chatbot/chat/stream/", {"message": message})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        events = []
+        for block in body.strip().split("\n\n"):
+            event, data = block.split("\n")
+            events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+        return events
+
+    async def test_tokens_then_done_and_the_answer_is_cached(self):
+        with mock.patch("chatbot.services._backend", StreamingBackend()):
+            events = await self.events("What is Django?")
+            cached = await cache.aget(response_cache_key("What is Django?", self.context))
+
+        answer = "This is a placeholder answer to: What is Django?"
+        self.assertEqual([event for event, _ in events], ["token"] * len(answer.split(" ")) + ["done"])
+        self.assertEqual("".join(data["text"] for event, data in events[:-1]), answer)
+        self.assertFalse(events[-1][1]["cached"])
+        self.assertGreaterEqual(events[-1][1]["total_ms"], events[-1][1]["ttft_ms"])
+        self.assertEqual(cached, answer)
+
+        with mock.patch("chatbot.services._backend", StreamingBackend()):
+            events = await self.events("what is django")
+        self.assertEqual(events[0], ("token", {"text": answer}))
+        self.assertEqual(events[1][0], "done")
+        self.assertTrue(events[1][1]["cached"])
+
+    async def test_backend_failure_ends_with_an_error_event(self):
+        with mock.patch("chatbot.services._backend", StreamingBackend(error=RuntimeError("model down"))):
+            with self.assertLogs("chatbot.views", "ERROR"):
+                events = await self.events("What is Django?")
+            cached = await cache.aget(response_cache_key("What is Django?", self.context))
+
+        self.assertEqual([event for event, _ in events], ["token", "error"])
+        self.assertEqual(events[-1][1], {"error": "The assistant is unavailable right now, please try again."})
+        self.assertIsNone(cached)
+
+
+class LLMBackendTests(SimpleTestCase):
+
+    def test_backend_without_generate_cannot_be_instantiated(self):
+        class StreamOnlyBackend(LLMBackend):
+            def stream(self, prompt):
+                yield "answer"
+
+        with self.assertRaises(TypeError):
+            StreamOnlyBackend()
+
+
+class GeminiBackendTests(SimpleTestCase):
+
+    def test_stream_skips_chunks_without_text(self):
+        class BlockedChunk:
+            prompt_feedback = "block_reason: SAFETY"
+
+            @property
+            def text(self):
+                raise ValueError("The response.text quick accessor only works when the response contains a valid Part")
+
+        backend = GeminiBackend.__new__(GeminiBackend)
+        backend.model = mock.Mock()
+        backend.model.generate_content.return_value = [
+            mock.Mock(text="Django is "), BlockedChunk(), mock.Mock(text=""), mock.Mock(text="a web framework."),
+        ]
+        with self.assertLogs("chatbot.services", "WARNING"):
+            self.assertEqual(list(backend.stream("prompt")), ["Django is ", "a web framework."])
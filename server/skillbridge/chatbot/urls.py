@@ -1,6 +1,7 @@
 from django.urls import path,include
-from .views import ChatbotView
+from .views import ChatbotView, ChatbotStreamView
 
 urlpatterns = [
     path('chat/', ChatbotView.as_view(), name='chat-bot-chat'),
+    path('chat/stream/', ChatbotStreamView.as_view(), name='chat-bot-stream'),
 ]
\ No newline at end of file
@@ -1,21 +1,46 @@
 from .data_extraction import extract_courses_data, extract_tutors_data
+from .index import COURSE, TUTOR, search
+from .vectors import semantic_search
+from .constants import WEBSITE_OVERVIEW, GENERAL_QUERIES_INFO
+
+MAX_COURSES = 5
+MAX_TUTORS = 3
+# Reciprocal rank fusion constant, dampens how much the top ranks of either list dominate
+FUSION_K = 60
+
+
+def fuse_rankings(rankings, limit):
+    """Merges ranked id lists with reciprocal rank fusion, ids found by several stages move up"""
+    scores = {}
+    for ranking in rankings:
+        for rank, row_id in enumerate(ranking):
+            scores[row_id] = scores.get(row_id, 0) + 1 / (FUSION_K + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+
+def rank(kind, query, limit):
+    """Keyword (BM25) and semantic candidates fused into one ranking"""
+    return fuse_rankings([search(kind, query, limit * 2), semantic_search(kind, query, limit * 2)], limit)
+
+
+def _in_order(rows, ids):
+    """Rows come back in database order, the context lists them by relevance"""
+    by_id = {row["id"]: row for row in rows}
+    return [by_id[row_id] for row_id in ids if row_id in by_id]
+
 
 def retrieve_relevant_context(query):
-    """Retrieves relevant course or tutor information based on the user's query using a keyword-based retrieval system."""
+    """Retrieves relevant course or tutor information based on the user's query, ranked by the BM25 index and the vector index"""
     context_parts = []
     query_lower = query.lower()
     
-    courses = extract_courses_data()
-    tutors = extract_tutors_data()
-    
     # Check for course-related queries
     course_keywords = ['course', 'courses', 'class', 'learn', 'study', 'subject', 'lesson', 'training']
     if any(keyword in query_lower for keyword in course_keywords):
         relevant_courses = []
-        for course in courses:
-            course_title_lower = course['title'].lower()
-            if any(word in course_title_lower for word in query_lower.split()):
-                relevant_courses.append(f"Course: {course['title']} - {course['description']} - Rating: {course['rating']} - Tutor: {course['tutor']} - Price: {course['price']}")
+        course_ids = rank(COURSE, query, MAX_COURSES)
+        for course in _in_order(extract_courses_data(course_ids), course_ids):
+            relevant_courses.append(f"Course: {course['title']} - {course['description']} - Rating: {course['rating']} - Tutor: {course['tutor']} - Price: {course['price']}")
         
         if relevant_courses:
             context_parts.append("Relevant courses based on your query:")
@@ -25,10 +50,9 @@ def retrieve_relevant_context(query):
     tutor_keywords = ['tutor','tutors','teacher', 'instructor', 'mentor', 'professor']
     if any(keyword in query_lower for keyword in tutor_keywords):
         relevant_tutors = []
-        for tutor in tutors:
-            tutor_name_lower = tutor['name'].lower()
-            if any(word in tutor_name_lower for word in query_lower.split()):
-                relevant_tutors.append(f"Tutor: {tutor['name']} - {tutor['bio']} - Specialization: {tutor['current_job']} - Rating:{tutor['rating']}")
+        tutor_ids = rank(TUTOR, query, MAX_TUTORS)
+        for tutor in _in_order(extract_tutors_data(tutor_ids), tutor_ids):
+            relevant_tutors.append(f"Tutor: {tutor['name']} - {tutor['bio']} - Specialization: {tutor['current_job']} - Rating:{tutor['rating']}")
         
         if relevant_tutors:
             context_parts.append("Relevant tutors based on your query:")
@@ -40,3 +64,24 @@ def retrieve_relevant_context(query):
     
     return "\n".join(context_parts)
 
+
+def build_prompt(user_message, context):
+    """Prompt with the platform overview, the assistant instructions and the retrieved context"""
+    return f"""
+        You are an AI assistant for SkillBridge, an e-learning platform. 
+        
+        Here is an overview of the SkillBridge platform:
+        {WEBSITE_OVERVIEW}
+        
+        Your capabilities and how you should interact with users:
+        {GENERAL_QUERIES_INFO}
+        
+        Specific information related to the user's query:
+        {context}
+        
+        User question: {user_message}
+        
+        Please respond based on the information provided. If you don't find relevant information, 
+        respond with general advice based on the overview of SkillBridge and your capabilities.
+        Keep responses friendly, informative, and concise as mentioned in your instructions.
+        """
@@ -0,0 +1,307 @@
+import json
+import logging
+import math
+import os
+import time
+import zlib
+from collections import Counter
+from pathlib import Path
+from django.conf import settings
+from base.redis_client import get_redis
+from .data_extraction import course_documents, tutor_documents
+from .index import CHANGES_KEY, COURSE, SYNC_OVERLAP, TUTOR, tokenize
+
+try:
+    import numpy as np
+except ImportError:  # Optional, without it the chatbot context is ranked by BM25 alone
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+"""
+Semantic retrieval stage for the chatbot context. Courses and tutors are embedded as hashed TF-IDF vectors (signed
+feature hashing of the weighted field terms, no model to download) and stored as a float32 matrix in an .npy file
+that every process opens as a read only memory map, so the vectors are shared through the page cache instead of
+being loaded per worker. Queries are scored with one matrix product and ranked with argpartition.
+
+A single writer (the refresh_chatbot_vectors task or the build_chatbot_vectors command) owns the files. It follows
+the change log of chatbot/index.py: changed rows are rewritten in place, new documents are appended, and deleted
+ones are zeroed. Readers notice a new meta.json and remap. The idf table is only recomputed by a full build.
+"""
+
+KINDS = {COURSE: 0, TUTOR: 1}
+DELETED = -1
+WRITER_LOCK_KEY = "chatbot:vector_index_lock"
+META_FILE = "meta.json"
+
+_reader = None
+
+
+def is_available():
+    return np is not None
+
+
+def _bucket(token, dim):
+    digest = zlib.crc32(token.encode())
+    return digest % dim, (1.0 if digest & 0x80000000 else -1.0)
+
+
+def hashed_terms(fields, dim):
+    """{bucket: signed log term frequency} of [(text, weight)] fields"""
+    counts = Counter()
+    for text, weight in fields:
+        for token in tokenize(text):
+            counts[token] += weight
+    buckets = Counter()
+    for token, count in counts.items():
+        bucket, sign = _bucket(token, dim)
+        buckets[bucket] += sign * (1 + math.log(count))
+    return buckets
+
+
+def idf_table(document_frequency, documents):
+    return (np.log((1 + documents) / (1 + np.asarray(document_frequency, dtype=np.float32))) + 1).astype(np.float32)
+
+
+def embed(fields_list, idf):
+    """L2 normalised TF-IDF rows of [(text, weight)] fields, one row per document"""
+    matrix = np.zeros((len(fields_list), len(idf)), dtype=np.float32)
+    for row, fields in enumerate(fields_list):
+        for bucket, value in hashed_terms(fields, len(idf)).items():
+            matrix[row, bucket] = value
+    matrix *= idf
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def _all_documents():
+    for kind, documents in ((COURSE, course_documents), (TUTOR, tutor_documents)):
+        for doc_id, fields in documents():
+            yield kind, doc_id, fields
+
+
+def _read_meta(directory):
+    with open(directory / META_FILE) as meta_file:
+        return json.load(meta_file)
+
+
+def _write_meta(directory, meta):
+    temporary = directory / f"{META_FILE}.tmp"
+    with open(temporary, "w") as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(temporary, directory / META_FILE)
+
+
+def _remove_stale_matrices(directory, current):
+    # Readers still mapping an old file keep it alive until they remap, unlinking it is safe
+    for path in directory.glob("vectors-*.npy"):
+        if path.name != current:
+            path.unlink(missing_ok=True)
+
+
+def build_vector_index(directory=None, documents=None, dim=None, chunk_size=2048):
+    """
+    Embeds every document into a new matrix. documents is a callable returning (kind, id, fields) tuples,
+    it is iterated twice: once for the document frequencies and once for the vectors
+    """
+    directory = Path(directory or settings.CHATBOT_VECTOR_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    documents = documents or _all_documents
+    dim = dim or settings.CHATBOT_VECTOR_DIM
+    started = time.perf_counter()
+    synced_at = time.time()
+
+    document_frequency = np.zeros(dim, dtype=np.int64)
+    total = 0
+    for _, _, fields in documents():
+        document_frequency[list(hashed_terms(fields, dim))] += 1
+        total += 1
+    idf = idf_table(document_frequency, total)
+
+    version = time.time_ns()
+    matrix_name = f"vectors-{version}.npy"
+    matrix = np.lib.format.open_memmap(directory / matrix_name, mode="w+", dtype=np.float32, shape=(max(total, 1), dim))
+    kinds, ids = [], []
+    chunk = []
+
+    def flush():
+        matrix[len(ids) - len(chunk):len(ids)] = embed(chunk, idf)
+        chunk.clear()
+
+    for kind, doc_id, fields in documents():
+        kinds.append(KINDS[kind])
+        ids.append(doc_id)
+        chunk.append(fields)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    matrix.flush()
+    del matrix
+
+    _write_meta(directory, {
+        "version": version, "matrix": matrix_name, "dim": dim, "rows": len(ids),
+        "kinds": kinds, "ids": ids, "document_frequency": document_frequency.tolist(),
+        "documents": total, "synced_at": synced_at,
+    })
+    _remove_stale_matrices(directory, matrix_name)
+    seconds = time.perf_counter() - started
+    logger.info(f"Built chatbot vector index with {len(ids)} documents in {seconds:.2f}s")
+    return {"documents": len(ids), "seconds": seconds, "bytes": (directory / matrix_name).stat().st_size}
+
+
+def update_vector_index(changes, directory=None, loaders=None):
+    """Re-embeds the changed "<kind>:<id>" documents in place, appends new ones and zeroes deleted ones"""
+    directory = Path(directory or settings.CHATBOT_VECTOR_DIR)
+    loaders = loaders or {COURSE: course_documents, TUTOR: tutor_documents}
+    meta = _read_meta(directory)
+    idf = idf_table(meta["document_frequency"], meta["documents"])
+
+    by_kind = {}
+    for change in changes:
+        kind, _, doc_id = change.partition(":")
+        if kind in KINDS:
+            by_kind.setdefault(kind, set()).add(int(doc_id))
+    if not by_kind:
+        return 0
+
+    positions = {(kind, doc_id): row for row, (kind, doc_id) in enumerate(zip(meta["kinds"], meta["ids"]))}
+    updates = {}
+    for kind, ids in by_kind.items():
+        found = dict(loaders[kind](ids))
+        for doc_id in ids:
+            updates[(KINDS[kind], doc_id)] = found.get(doc_id)
+
+    appended = [key for key, fields in updates.items() if key not in positions and fields is not None]
+    rows = meta["rows"]
+    matrix_path = directory / meta["matrix"]
+    capacity = np.load(matrix_path, mmap_mode="r").shape[0]
+
+    if rows + len(appended) > capacity:
+        # Out of room, copy into a matrix twice the size under a new name so readers keep the old one until they remap
+        old = np.load(matrix_path, mmap_mode="r")
+        meta["matrix"] = f"vectors-{time.time_ns()}.npy"
+        matrix = np.lib.format.open_memmap(
+            directory / meta["matrix"], mode="w+", dtype=np.float32,
+            shape=(max(2 * capacity, rows + len(appended)), meta["dim"]),
+        )
+        matrix[:rows] = old[:rows]
+        del old
+    else:
+        matrix = np.load(matrix_path, mmap_mode="r+")
+
+    for key in appended:
+        positions[key] = rows
+        meta["kinds"].append(key[0])
+        meta["ids"].append(key[1])
+        rows += 1
+
+    changed = [key for key in updates if key in positions]
+    vectors = embed([updates[key] or [] for key in changed], idf)
+    for key, vector in zip(changed, vectors):
+        row = positions[key]
+        matrix[row] = vector
+        if updates[key] is None:
+            meta["kinds"][row] = DELETED
+    matrix.flush()
+    del matrix
+
+    meta["rows"] = rows
+    meta["version"] = time.time_ns()
+    _write_meta(directory, meta)
+    _remove_stale_matrices(directory, meta["matrix"])
+    return len(changed)
+
+
+def refresh_vector_index(directory=None, rebuild=False):
+    """
+    Applies the change log since the last refresh, or builds the index from scratch when there is none yet, it was
+    built with another dimension or rebuild is set. Returns None when another writer holds the lock
+    """
+    directory = Path(directory or settings.CHATBOT_VECTOR_DIR)
+    lock = get_redis().lock(WRITER_LOCK_KEY, timeout=60 * 30, blocking=False)
+    if not lock.acquire():
+        return None
+    try:
+        if rebuild or not (directory / META_FILE).exists():
+            return build_vector_index(directory)
+
+        started = time.time()
+        meta = _read_meta(directory)
+        if meta["dim"] != settings.CHATBOT_VECTOR_DIM:
+            return build_vector_index(directory)
+        changes = get_redis().zrangebyscore(CHANGES_KEY, meta["synced_at"] - SYNC_OVERLAP, "+inf")
+        updated = update_vector_index(changes, directory) if changes else 0
+        meta = _read_meta(directory)
+        meta["synced_at"] = started
+        _write_meta(directory, meta)
+        return {"updated": updated}
+    finally:
+        lock.release()
+
+
+class VectorReader:
+    """Read side of the index, remaps whenever the writer publishes a new meta.json"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.version = None
+        self.meta_mtime = None
+        self.matrix = None
+
+    def refresh(self):
+        # meta.json is replaced atomically on every write, so its mtime is enough to tell whether to reread it
+        try:
+            mtime = os.stat(self.directory / META_FILE).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self.meta_mtime:
+            return True
+        meta = _read_meta(self.directory)
+        self.meta_mtime = mtime
+        if meta["version"] != self.version:
+            self.matrix = np.load(self.directory / meta["matrix"], mmap_mode="r")
+            self.kinds = np.asarray(meta["kinds"], dtype=np.int8)
+            self.ids = np.asarray(meta["ids"], dtype=np.int64)
+            self.rows = meta["rows"]
+            self.idf = idf_table(meta["document_frequency"], meta["documents"])
+            self.version = meta["version"]
+        return True
+
+    def search_many(self, kind, queries, limit=5):
+        """[[(id, score)]] per query, best first. Scores are cosine similarities, non positive ones are dropped"""
+        if not self.refresh() or not self.rows:
+            return [[] for _ in queries]
+        query_matrix = embed([[(query, 1)] for query in queries], self.idf)
+        scores = self.matrix[:self.rows] @ query_matrix.T
+        scores[self.kinds[:self.rows] != KINDS[kind]] = -np.inf
+        top = min(limit, self.rows)
+
+        results = []
+        for column in range(len(queries)):
+            column_scores = scores[:, column]
+            candidates = np.argpartition(-column_scores, top - 1)[:top]
+            ranked = candidates[np.argsort(-column_scores[candidates])]
+            results.append([
+                (int(self.ids[row]), float(column_scores[row])) for row in ranked if column_scores[row] > 0
+            ])
+        return results
+
+    def search(self, kind, query, limit=5):
+        return self.search_many(kind, [query], limit)[0]
+
+
+def semantic_search(kind, query, limit=5):
+    """Ids of the closest documents, empty when numpy isn't installed or the index hasn't been built yet"""
+    global _reader
+    if np is None:
+        return []
+    if _reader is None:
+        _reader = VectorReader(settings.CHATBOT_VECTOR_DIR)
+    try:
+        return [doc_id for doc_id, _ in _reader.search(kind, query, limit)]
+    except Exception as e:
+        logger.error(f"Chatbot vector search failed: {e}", exc_info=True)
+        return []
@@ -1,23 +1,51 @@
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
-from .services import initialize_gemini
-from .utils import retrieve_relevant_context
-from .constants import WEBSITE_OVERVIEW, GENERAL_QUERIES_INFO
+import json
+import time
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from .limits import Admission, Rejected
+from .metrics import arecord_answer, arecord_failure
+from .services import agenerate_response, stream_response
+from .utils import build_prompt, retrieve_relevant_context
+import logging
 # Create your views here.
 
+logger = logging.getLogger(__name__)
 
-class ChatbotView(APIView):
+
+def read_message(request):
+    """The message of a JSON body, or of a form encoded or multipart one like DRF's request.data accepted"""
+    if request.content_type != "application/json":
+        return request.POST.get('message')
+    try:
+        return json.loads(request.body or b"{}").get('message')
+    except (ValueError, AttributeError):
+        return None
+
+
+def rejected_response(rejection):
+    response = JsonResponse({"error": rejection.message}, status=rejection.status)
+    response["Retry-After"] = str(rejection.retry_after)
+    return response
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ChatbotView(View):
     """
         Chatbot API view for handling user queries using the Gemini AI model.
 
-        This endpoint accepts user messages via a POST request, retrieves relevant context 
-        from the database using the `retrieve_relevant_context()` function, and sends a prompt 
-        to the Gemini AI model for generating a response. The generated response is then returned 
-        to the user.
+        This endpoint accepts user messages as JSON {"message": ...}, or as a form field, via a POST request,
+        retrieves relevant context from the database using the `retrieve_relevant_context()` function, and sends a prompt
+        to the configured LLM backend (Gemini by default) for generating a response. Answers are
+        cached per normalised question and context, see chatbot/services.py.
 
-        Attributes:
-        permission_classes (list): Allows unrestricted access to this API using `AllowAny`.
+        The view is async and open to everyone, like before. It is admitted through chatbot/limits.py: a client
+        over its rate limit gets a 429 and a full queue a 503, both with Retry-After, so chatbot load can't starve
+        the rest of the API. Cached answers are served without waiting for a generation slot. The model is called
+        on the chatbot's own thread pool.
     
         Methods:
             post(request):
@@ -25,35 +53,93 @@ class ChatbotView(APIView):
                 and returns the AI's response in JSON format.
     """
 
-    permission_classes = [AllowAny]
-    def post(self, request):
-        user_message = request.data.get('message')
-        
-        # Get relevant context from your database
-        context = retrieve_relevant_context(user_message)
-        
-        # Prepare prompt with all available information
-        prompt = f"""
-        You are an AI assistant for SkillBridge, an e-learning platform. 
-        
-        Here is an overview of the SkillBridge platform:
-        {WEBSITE_OVERVIEW}
-        
-        Your capabilities and how you should interact with users:
-        {GENERAL_QUERIES_INFO}
-        
-        Specific information related to the user's query:
-        {context}
-        
-        User question: {user_message}
-        
-        Please respond based on the information provided. If you don't find relevant information, 
-        respond with general advice based on the overview of SkillBridge and your capabilities.
-        Keep responses friendly, informative, and concise as mentioned in your instructions.
-        """
-        
-        # Get response from Gemini
-        model = initialize_gemini()
-        response = model.generate_content(prompt)
-        
-        return Response({"response": response.text})
\ No newline at end of file
+    async def post(self, request):
+        started = time.perf_counter()
+        user_message = read_message(request)
+        if not isinstance(user_message, str) or not user_message.strip():
+            return JsonResponse({"error": "A message is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        admission = Admission(request)
+        try:
+            await admission.check()
+            # Get relevant context from your database
+            context = await sync_to_async(retrieve_relevant_context)(user_message)
+
+            # Prepare prompt with all available information
+            prompt = build_prompt(user_message, context)
+
+            # Identical questions against the same context are answered from the cache, only a call to the model
+            # takes a generation slot
+            answer, cached = await agenerate_response(user_message, context, prompt, slot=admission)
+            elapsed = time.perf_counter() - started
+            await arecord_answer(elapsed, elapsed, cached=cached)
+            return JsonResponse({"response": answer})
+        except Rejected as rejection:
+            return rejected_response(rejection)
+        except Exception as e:
+            logger.error(f"Chatbot request failed: {e}", exc_info=True)
+            await arecord_failure()
+            return JsonResponse({"error": "The assistant is unavailable right now, please try again."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+def server_sent_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ChatbotStreamView(View):
+    """
+        Streaming variant of ChatbotView over server-sent events, served by the ASGI app without holding a worker
+        thread while the model generates. Takes the message as JSON {"message": ...} in a POST body or as
+        ?message= for EventSource clients. Emits "token" events with the text chunks, then one "done" event with
+        the time to first token, or an "error" event. Admitted like ChatbotView, the generation slot is held until
+        the stream ends.
+    """
+
+    async def get(self, request):
+        return await self.stream(request, request.GET.get('message'))
+
+    async def post(self, request):
+        return await self.stream(request, read_message(request))
+
+    async def stream(self, request, user_message):
+        if not isinstance(user_message, str) or not user_message.strip():
+            return JsonResponse({"error": "A message is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Rejected before the stream starts so the client gets the status code. The slot itself is taken inside
+        # the stream and only for a call to the model, the stream's cleanup is the only place that reliably gives
+        # it back
+        admission = Admission(request)
+        try:
+            await admission.check()
+        except Rejected as rejection:
+            return rejected_response(rejection)
+
+        response = StreamingHttpResponse(self.events(admission, user_message), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # Keep proxies from buffering the stream
+        return response
+
+    async def events(self, admission, user_message):
+        started = time.perf_counter()
+        ttft = None
+        cached = False
+        try:
+            context = await sync_to_async(retrieve_relevant_context)(user_message)
+            prompt = build_prompt(user_message, context)
+
+            async for chunk, cached in stream_response(user_message, context, prompt, slot=admission):
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                yield server_sent_event("token", {"text": chunk})
+
+            total = time.perf_counter() - started
+            ttft = total if ttft is None else ttft
+            await arecord_answer(ttft, total, streamed=True, cached=cached)
+            yield server_sent_event("done", {"cached": cached, "ttft_ms": round(ttft * 1000), "total_ms": round(total * 1000)})
+        except Rejected as rejection:
+            yield server_sent_event("error", {"error": rejection.message, "retry_after": rejection.retry_after})
+        except Exception as e:
+            logger.error(f"Chatbot stream failed: {e}", exc_info=True)
+            await arecord_failure()
+            yield server_sent_event("error", {"error": "The assistant is unavailable right now, please try again."})
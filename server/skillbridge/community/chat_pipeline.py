@@ -0,0 +1,117 @@
+import logging
+from django.db import transaction
+from base.streams import DEFAULT_STREAM_MAXLEN, ack, ensure_group, entry_sent_at, insert_new_rows, read_batch, record_drain, sent_at_field
+from .models import CommunityMember, Message
+
+logger = logging.getLogger(__name__)
+
+
+"""
+Write-behind persistence for community chat, the community counterpart of courses/chat_pipeline.py.
+CommunityChatConsumer broadcasts a message right away and appends it to COMMUNITY_STREAM; drain_community_stream()
+reads the stream through a consumer group, bulk inserts the Message rows and hands them to the notification
+fan-out. The client_id of every entry is unique per sender on Message, so redelivered entries are skipped, and the
+send time recorded in the entry becomes created_at.
+
+message_payload() is the chat_message event both the socket and the HTTP path broadcast, so clients get one shape.
+"""
+
+COMMUNITY_STREAM = "community_chat_messages"
+COMMUNITY_GROUP = "community_persistence"
+ENTRY_FIELDS = ("client_id", "community_id", "sender_id", "text")
+
+
+def build_entry(client_id, community_id, sender, text):
+    return {
+        "client_id": client_id,
+        "community_id": str(community_id),
+        "sender_id": str(sender.id),
+        "text": text,
+        "sent_at": sent_at_field(),
+    }
+
+
+def message_payload(sender, text, created_at, message_id=None, client_id=None):
+    """Message of a chat_message event. Socket messages aren't stored yet when broadcast, their id is None"""
+    return {
+        "id": message_id,
+        "client_id": client_id,
+        "text": text,
+        "sender": sender.id,
+        "created_at": created_at.isoformat(),
+        "sender_name": sender.get_full_name(),
+        "sender_profile_pic": sender.profile_pic_url.url if sender.profile_pic_url else None,
+    }
+
+
+def enqueue_message(client, entry):
+    """Works with both clients, with the asyncio client the returned coroutine has to be awaited"""
+    return client.xadd(COMMUNITY_STREAM, entry, maxlen=DEFAULT_STREAM_MAXLEN, approximate=True)
+
+
+def persist_entries(entries):
+    """Inserts the messages of a batch of stream entries, skipping stored ones and senders who left. Returns the new ids"""
+    by_key = {}
+    for entry_id, fields in entries:
+        if not all(key in fields for key in ENTRY_FIELDS):
+            # A malformed entry would otherwise be redelivered forever, it is acked with the rest of the batch
+            logger.error(f"Dropping malformed community stream entry {entry_id}: {fields}")
+            continue
+        by_key.setdefault((int(fields["sender_id"]), fields["client_id"]), fields)
+
+    existing = set(Message.objects.filter(
+        sender_id__in={sender_id for sender_id, _ in by_key},
+        client_id__in={client_id for _, client_id in by_key},
+    ).values_list("sender_id", "client_id"))
+    members = set(CommunityMember.objects.filter(
+        community_id__in={int(fields["community_id"]) for fields in by_key.values()},
+        user_id__in={sender_id for sender_id, _ in by_key},
+    ).values_list("community_id", "user_id"))
+
+    fresh = [
+        fields for key, fields in by_key.items()
+        if key not in existing and (int(fields["community_id"]), key[0]) in members
+    ]
+    if not fresh:
+        return []
+
+    with transaction.atomic():
+        inserted = insert_new_rows(Message, [
+            Message(
+                client_id=fields["client_id"],
+                community_id=int(fields["community_id"]),
+                sender_id=int(fields["sender_id"]),
+                text=fields["text"],
+                created_at=entry_sent_at(fields),
+            )
+            for fields in fresh
+        ])
+    # The rows a concurrent drain stored are fanned out by that drain
+    return [message.id for message in inserted]
+
+
+def drain_community_stream(client, consumer, batch_size=500, block_ms=None, max_batches=None):
+    """Persists stream entries batch by batch until the stream is empty or max_batches is reached"""
+    from .tasks import fan_out_community_message
+
+    ensure_group(client, COMMUNITY_STREAM, COMMUNITY_GROUP)
+    persisted = 0
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        entries = read_batch(client, COMMUNITY_STREAM, COMMUNITY_GROUP, consumer, count=batch_size, block_ms=block_ms)
+        if not entries:
+            break
+
+        message_ids = persist_entries(entries)
+        # Only ack once the rows are committed, a crash before this point leaves the entries pending for a retry
+        ack(client, COMMUNITY_STREAM, COMMUNITY_GROUP, [entry_id for entry_id, _ in entries])
+
+        for message_id in message_ids:
+            fan_out_community_message.delay(message_id)
+
+        persisted += len(message_ids)
+        batches += 1
+
+    record_drain(client, COMMUNITY_STREAM, COMMUNITY_GROUP, persisted)
+    return persisted
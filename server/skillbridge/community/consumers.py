@@ -1,59 +1,37 @@
 import json
-import redis
 from channels.generic.websocket import AsyncWebsocketConsumer
-from .models import CommunityMember, Community
+from .membership import MEMBER, get_membership
 from asgiref.sync import sync_to_async
 import asyncio
-from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.tokens import AccessToken
-from django.contrib.auth.models import AnonymousUser
+from base.presence import HEARTBEAT_INTERVAL, RoomPresence
+from base.redis_client import get_async_redis
+from base.streams import entry_sent_at, make_client_id
+from .chat_pipeline import build_entry, enqueue_message, message_payload
+import logging
 
 
+logger = logging.getLogger(__name__)
 User = get_user_model()
-redis_client =  redis.StrictRedis(host="redis", port=6379, db=0, decode_responses=True)
 
 class CommunityChatConsumer(AsyncWebsocketConsumer):
 
     async def connect(self):
-
-        query_string = self.scope["query_string"].decode()
-        query_params = dict(qc.split("=") for qc in query_string.split("&") if "=" in qc)
-        token = query_params.get("token", None)
-
-        if token:
-            try:
-                access_token = AccessToken(token)
-                self.scope["user"] = await database_sync_to_async(User.objects.get)(id=access_token["user_id"])
-
-            except Exception:
-                self.scope["user"] = AnonymousUser()
-
+        # scope["user"] is resolved from ?token= by users.middleware.JWTAuthMiddleware
         if not self.scope["user"].is_authenticated:
             await self.close(code=4001)
             return
         
         self.community_id = self.scope['url_route']['kwargs']['community_id']
-        self.room_group_name = f"chat_{self.community_id}"
-
-        try:
-            community = await Community.objects.aget(id=self.community_id)
-            is_member = await CommunityMember.objects.filter(
-                user = self.scope["user"],
-                community = community
-            ).aexists()
+        self.room_group_name = f"community_chat_{self.community_id}"
 
-            if not is_member:
-                await self.close(code=4003)
-                return
-            
-        except Community.DoesNotExist:
+        membership = await get_membership(self.community_id, self.scope["user"].id)
+        if membership is None:
             await self.close(code=4004)
             return
-        
-        """Tracking online users in redis"""
-        user_id = str(self.scope["user"].id)
-        redis_client.sadd(f"community_online_{self.community_id}", user_id)
+        if membership != MEMBER:
+            await self.close(code=4003)
+            return
         
         """Adding user to the websocket channel group"""
         await self.channel_layer.group_add(
@@ -62,65 +40,83 @@ class CommunityChatConsumer(AsyncWebsocketConsumer):
         )
         await self.accept()
 
-        """Notifying all members about online users"""
-        await self.broadcast_online_users()
+        """Tracking online users through heartbeated presence, see base/presence.py"""
+        self.presence = RoomPresence("community", self.community_id, self.room_group_name)
+        user_id = str(self.scope["user"].id)
+        came_online = await self.presence.join(user_id, self.channel_name, name=self.scope["user"].first_name or "")
+        self.online_users = await self.presence.online()
+        await self.send_online_users()
+        if came_online:
+            await self.presence.schedule_broadcast(user_id)
+        self.heartbeat_task = asyncio.create_task(self.heartbeat())
 
     async def disconnect(self, close_code):
+        if hasattr(self, "presence"):
+            self.heartbeat_task.cancel()
+            user_id = str(self.scope["user"].id)
+            if await self.presence.leave(user_id, self.channel_name):
+                await self.presence.schedule_broadcast(user_id)
+
         if hasattr(self, "room_group_name"):
             await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
-        """Removing users from online list in redis"""
+    async def heartbeat(self):
         user_id = str(self.scope["user"].id)
-        redis_client.srem(f"community_online_{self.community_id}", user_id)
-
-        await asyncio.sleep(0.2)
-        await self.broadcast_online_users()
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                if not await self.presence.heartbeat(user_id, self.channel_name):
+                    # Swept while this worker was stalled, register again
+                    if await self.presence.join(user_id, self.channel_name, name=self.scope["user"].first_name or ""):
+                        await self.presence.schedule_broadcast(user_id)
+            except Exception as e:
+                logger.error(f"Presence heartbeat failed: {e}", exc_info=True)
 
     async def receive(self, text_data):
-        data = json.loads(text_data)
-        message = data.get('message')
-        sender = self.scope['user'].first_name if self.scope['user'].is_authenticated else "Anonymous"
-
-        if message:
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'chat_message',
-                    'message': message,
-                    'sender': sender
-                }
-        )
+        try:
+            data = json.loads(text_data)
+            message = data.get('message')
+
+            if message:
+                user = self.scope['user']
+                client_id = make_client_id(data.get("client_id"))
+                # Persisted in batches by drain_community_stream, see community/chat_pipeline.py
+                entry = build_entry(client_id, self.community_id, user, message)
+                await enqueue_message(get_async_redis(), entry)
+
+                await self.channel_layer.group_send(
+                    self.room_group_name,
+                    {
+                        'type': 'chat_message',
+                        'message': message_payload(user, message, entry_sent_at(entry), client_id=client_id),
+                    }
+                )
+        except Exception as e:
+            logger.error(f"WebSocket receive error: {e}", exc_info=True)
     
     async def chat_message(self, event):
-    # Send full message data with sender ID
+        """Same payload from the socket and the HTTP path, see message_payload()"""
         await self.send(text_data=json.dumps({
             "type": "chat_message",  # Include the type field
             "message": event["message"]
         }))
 
 
-    async def broadcast_online_users(self):
-        """Get list of online user id's from redis"""
-        online_user_ids = [str(uid) for uid in redis_client.smembers(f"community_online_{self.community_id}")]
-
-        """Fetching user details asynchronously"""
-        users = await database_sync_to_async(list)(
-            User.objects.filter(id__in=online_user_ids).values("id", "first_name")
-        )
-
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "online_users",
-                "users": users
-            }
-        )
+    async def presence_delta(self, event):
+        """Apply the users that came online or went offline since the last delta"""
+        if not hasattr(self, "online_users"):
+            return  # The snapshot taken in connect already includes this change
+        for user in event["joined"]:
+            self.online_users[user["id"]] = user["name"]
+        for user_id in event["left"]:
+            self.online_users.pop(user_id, None)
+        await self.send_online_users()
 
-    async def online_users(self, event):
-        """Send online users list to the WebSocket client"""
+    async def send_online_users(self):
+        """Send online users list to the WebSocket client, built from this socket's local copy"""
         await self.send(text_data=json.dumps(
             {
                 "type": "online_users",
-                "users": event["users"]
+                "users": [{"id": int(user_id), "first_name": name} for user_id, name in self.online_users.items()]
             }
-        ))
\ No newline at end of file
+        ))
@@ -0,0 +1,38 @@
+from channels.db import database_sync_to_async
+from django.core.cache import cache
+from .models import Community, CommunityMember
+
+
+"""Cached community membership checks for the chat consumer, kept fresh by the CommunityMember signal handlers"""
+
+MEMBERSHIP_TIMEOUT = 60 * 5
+MEMBER = "member"
+NOT_MEMBER = "not_member"
+
+
+def membership_key(community_id, user_id):
+    return f"community_member_{community_id}_{user_id}"
+
+
+def invalidate_membership(community_id, user_id):
+    cache.delete(membership_key(community_id, user_id))
+
+
+def _load_membership(community_id, user_id):
+    if CommunityMember.objects.filter(community_id=community_id, user_id=user_id).exists():
+        return MEMBER
+    if Community.objects.filter(id=community_id).exists():
+        return NOT_MEMBER
+    return None
+
+
+async def get_membership(community_id, user_id):
+    """Returns MEMBER, NOT_MEMBER, or None when the community doesn't exist"""
+    key = membership_key(community_id, user_id)
+    status = await cache.aget(key)
+    if status is None:
+        status = await database_sync_to_async(_load_membership)(community_id, user_id)
+        if status is None:
+            return None
+        await cache.aset(key, status, MEMBERSHIP_TIMEOUT)
+    return status
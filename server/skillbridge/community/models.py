@@ -1,8 +1,12 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
+from base.search import weighted_vector
 import cloudinary
 import cloudinary.uploader
 import cloudinary.models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 
 User = get_user_model()
 
@@ -19,6 +23,17 @@ class Community(models.Model):
     members = models.ManyToManyField(User, related_name="joined_communities", through="CommunityMember")
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='community_search_vector_idx'),
+            GinIndex(fields=['title'], name='community_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
+
+    @staticmethod
+    def build_search_vector():
+        return weighted_vector(('title', 'A'), ('description', 'B'))
 
     def __str__(self):
         return self.title
@@ -40,4 +55,13 @@ class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     community = models.ForeignKey(Community, on_delete=models.CASCADE, related_name="messages")
     text = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(default=timezone.now)  # Send time, socket messages are inserted after the fact
+    client_id = models.CharField(max_length=64, null=True, blank=True)  # Idempotency key of the stream entry, per sender
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['community', 'created_at', 'id'], name='community_message_history_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['sender', 'client_id'], name='community_message_sender_client_id_uniq'),
+        ]
@@ -0,0 +1,17 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from base.search import refresh_search_vector
+from .models import Community, CommunityMember
+from .membership import invalidate_membership
+
+
+@receiver(post_save, sender=Community)
+def refresh_community_search_vector(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not {"title", "description"} & set(update_fields):
+        return
+    refresh_search_vector(Community, instance.pk, Community.build_search_vector())
+
+
+@receiver([post_save, post_delete], sender=CommunityMember)
+def invalidate_cached_membership(sender, instance, **kwargs):
+    invalidate_membership(instance.community_id, instance.user_id)
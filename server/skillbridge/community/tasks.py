@@ -1,28 +1,52 @@
+import logging
+import socket
+from itertools import islice
 from celery import shared_task
-import redis
-import json
-from .models import Message, Community
-from django.contrib.auth import get_user_model
+from .models import Message, CommunityMember
+from .chat_pipeline import drain_community_stream
+from users.notifications import notify_many, push_notifications
+from base.redis_client import get_redis
 
-User = get_user_model()
-redis_client =  redis.StrictRedis(host="redis", port=6379, db=0, decode_responses=True)
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_CHUNK_SIZE = 1000
 
 @shared_task
-def sync_messages_to_db():
+def sync_messages_to_db(batch_size=500, max_batches=20):
+    """Persists community chat messages sent over the socket, read from the stream through a consumer group"""
+    persisted = drain_community_stream(get_redis(), f"celery-{socket.gethostname()}", batch_size=batch_size, max_batches=max_batches)
+    if persisted:
+        logger.info(f"Persisted {persisted} community message(s) from the stream")
+    return persisted
+
 
-    for key in redis_client.keys("community_chat_*"):
-        community_id = key.split("_")[-1]
-        messages = redis_client.lrange(key, 0, -1)
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
 
-        for message in messages:
-            data = json.loads(message)
-            sender = User.objects.get(id=data["sender_id"])
-            community = Community.objects.get(id=data["community_id"])
 
-            Message.objects.create(
-                sender=sender,
-                community=community,
-                text=data["text"]
-            )
+@shared_task
+def fan_out_community_message(message_id):
+    """Notifies every other member of a community message and pushes the notifications, chunk by chunk"""
+    message = Message.objects.select_related("community", "sender").filter(id=message_id).first()
+    if message is None:
+        return 0
+
+    community = message.community
+    text = f"New message in {community.title} from {message.sender.get_full_name()}"
+    thread_key = f"community_{community.id}"
+    member_ids = (
+        CommunityMember.objects.filter(community=community)
+        .exclude(user_id=message.sender_id)
+        .values_list("user_id", flat=True)
+        .order_by("id")
+    )
 
-        redis_client.delete(key)
\ No newline at end of file
+    delivered = 0
+    for user_ids in _chunks(member_ids.iterator(chunk_size=NOTIFICATION_CHUNK_SIZE), NOTIFICATION_CHUNK_SIZE):
+        # Members with an unread notification for this community get it bumped instead of a new row
+        notifications = notify_many("message", [(user_id, text, thread_key) for user_id in user_ids])
+        push_notifications(notifications)
+        delivered += len(user_ids)
+    return delivered
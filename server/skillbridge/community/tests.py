@@ -1,3 +1,117 @@
-from django.test import TestCase
+import asyncio
+from unittest import mock
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from base import presence
+from base.redis_client import get_async_redis
+from base.testing import isolated_services, make_user
+from users.middleware import JWTAuthMiddlewareStack
+from .chat_pipeline import COMMUNITY_STREAM, build_entry, persist_entries
+from .models import Community, CommunityMember, Message
+from . import routing
 
-# Create your tests here.
+
+def make_community(creator, *members):
+    community = Community.objects.create(creator=creator, title="Python learners")
+    for user in (creator, *members):
+        CommunityMember.objects.create(community=community, user=user)
+    return community
+
+
+@isolated_services
+class CommunityChatPipelineTests(TestCase):
+
+    def setUp(self):
+        self.alice = make_user("alice@example.com", role="tutor")
+        self.bob = make_user("bob@example.com")
+        self.community = make_community(self.alice, self.bob)
+
+    def entry(self, sender, client_id, text):
+        return f"{len(text)}-0", build_entry(client_id, self.community.id, sender, text)
+
+    def test_client_ids_are_scoped_to_the_sender(self):
+        message_ids = persist_entries([self.entry(self.alice, "1", "from alice"), self.entry(self.bob, "1", "from bob")])
+        self.assertEqual(len(message_ids), 2)
+        self.assertEqual(set(Message.objects.values_list("text", flat=True)), {"from alice", "from bob"})
+
+    def test_redelivered_entries_are_skipped(self):
+        entry = self.entry(self.bob, "abc", "hello")
+        self.assertEqual(len(persist_entries([entry])), 1)
+        self.assertEqual(persist_entries([entry]), [])
+        self.assertEqual(Message.objects.count(), 1)
+
+    def test_entries_stored_by_a_concurrent_drain_are_not_returned(self):
+        entry = self.entry(self.bob, "abc", "hello")
+        persist_entries([entry])
+
+        # The existence check misses the row, as it does when another drain stores it right after
+        filter_messages = Message.objects.filter
+        calls = iter([Message.objects.none()])
+
+        def existence_check(*args, **kwargs):
+            queryset = next(calls, None)
+            return filter_messages(*args, **kwargs) if queryset is None else queryset
+
+        with mock.patch.object(Message.objects, "filter", existence_check):
+            message_ids = persist_entries([entry, self.entry(self.bob, "def", "again")])
+        self.assertEqual(message_ids, [Message.objects.get(client_id="def").id])
+
+    def test_messages_of_non_members_are_dropped(self):
+        outsider = make_user("eve@example.com")
+        self.assertEqual(persist_entries([self.entry(outsider, "x", "spam")]), [])
+
+
+@isolated_services
+class CommunityChatBroadcastTests(TransactionTestCase):
+    """Socket and HTTP messages reach the room as the same chat_message event"""
+
+    def setUp(self):
+        self.alice = make_user("alice@example.com", role="tutor")
+        self.bob = make_user("bob@example.com")
+        self.community = make_community(self.alice, self.bob)
+        self.application = JWTAuthMiddlewareStack(URLRouter(routing.websocket_urlpatterns))
+
+    async def receive_chat_message(self, communicator):
+        while True:
+            event = await communicator.receive_json_from(timeout=2)
+            if event["type"] == "chat_message":
+                return event["message"]
+
+    def post_message(self, text):
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        with mock.patch("community.views.fan_out_community_message"):
+            return client.post("/api/community/messages/", {"community": self.community.id, "text": text}, format="json")
+
+    async def test_socket_and_http_messages_have_the_same_shape(self):
+        communicator = WebsocketCommunicator(
+            self.application, f"/ws/community/{self.community.id}/?token={AccessToken.for_user(self.alice)}"
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        client = get_async_redis()
+        try:
+            await communicator.send_json_to({"message": "over the socket", "client_id": "socket-1"})
+            over_socket = await self.receive_chat_message(communicator)
+
+            response = await sync_to_async(self.post_message)("over http")
+            self.assertEqual(response.status_code, 201)
+            over_http = await self.receive_chat_message(communicator)
+        finally:
+            entries = [entry_id for entry_id, fields in await client.xrange(COMMUNITY_STREAM)
+                       if fields["client_id"] == "socket-1" and fields["sender_id"] == str(self.alice.id)]
+            if entries:
+                await client.xdel(COMMUNITY_STREAM, *entries)
+            await communicator.disconnect()
+            await asyncio.gather(*presence._pending_flushes)
+
+        self.assertEqual(set(over_socket), set(over_http))
+        self.assertEqual((over_socket["sender"], over_socket["text"], over_socket["id"]), (self.alice.id, "over the socket", None))
+        self.assertEqual(over_socket["client_id"], "socket-1")
+        self.assertEqual((over_http["sender"], over_http["text"]), (self.bob.id, "over http"))
+        self.assertIsNotNone(over_http["id"])
+        self.assertEqual(len(entries), 1)
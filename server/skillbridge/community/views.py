@@ -1,4 +1,3 @@
-import redis
 import json
 import logging
 from django.shortcuts import render
@@ -13,13 +12,15 @@ from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
-from users.models import Notification
-from base.custom_pagination import CustomPagination
-from django.db.models import  Q
+from base.custom_pagination import CustomPagination, MessageHistoryPagination
+from base.search import ranked_search
+from base.redis_client import get_redis
+from django.db import transaction
+from .tasks import fan_out_community_message
+from .chat_pipeline import message_payload
 
 # Create your views here.
 
-redis_client = redis.StrictRedis(host="redis", port=6379, db=0, decode_responses=True)
 logger = logging.getLogger(__name__)
 
 class CommunityViewSet(ModelViewSet):
@@ -40,9 +41,7 @@ class CommunityViewSet(ModelViewSet):
             search = self.request.query_params.get('search')
 
             if search:
-                queryset = queryset.filter(
-                    Q(title__icontains=search)
-                )
+                queryset = ranked_search(queryset, search, "search_vector", ["title"], ["title"])
             return queryset
         except Community.DoesNotExist:
              return Response({"error": "Community not found."}, status=status.HTTP_404_NOT_FOUND)
@@ -131,14 +130,16 @@ class MessageViewSet(ModelViewSet):
     queryset = Message.objects.all()
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = MessageHistoryPagination
+    keyset_ordering = ('created_at', 'id')
 
     def get_queryset(self):
         try:
-            queryset = super().get_queryset()
+            queryset = super().get_queryset().select_related("sender")
             community_id = self.request.query_params.get('community')
             if community_id:
                 queryset = queryset.filter(community=community_id)
-            return queryset.order_by('created_at')
+            return queryset.order_by('created_at', 'id')
         except Message.DoesNotExist:
              return Response({"error": "Messages not found."}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
@@ -152,36 +153,13 @@ class MessageViewSet(ModelViewSet):
                 raise PermissionError("You are not a member of this community.")
             message = serializer.save(sender=self.request.user)
             
-            try:
-                members = CommunityMember.objects.filter(community=community).exclude(user=self.request.user)
-                message_data = MessageSerializer(message).data
+            message_data = MessageSerializer(message).data
 
-                notifications = [
-                    Notification(user=member.user, notification_type="message", message=f"New message in {community.title} from {self.request.user.get_full_name()}")
-                    for member in members
-                ]
+            # Member notifications are created and pushed by a worker so the sender isn't kept waiting
+            transaction.on_commit(lambda: fan_out_community_message.delay(message.id))
 
-                Notification.objects.bulk_create(notifications)
-            except Exception as e:
-                logger.error(f"Notification creation failed for community '{community.title}': {e}", exc_info=True)
-                return Response({"detail": "Failed to send notifications. Please try again."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-            try:
-                channel_layer = get_channel_layer()
-                for member in members:
-                    async_to_sync(channel_layer.group_send)(
-                    f"notifications_{member.user.id}",
-                    {
-                        "type": "send.notification",
-                        "message": f"New message in {community.title}",
-                        "notification_type": "message"
-                    }
-                )
-            except Exception as e:
-                logger.error(f"WebSocket notification failed for community '{community.title}': {e}", exc_info=True)
-            
             try:
-                redis_client.publish(
+                get_redis().publish(
                     f"community_{community.id}", 
                     json.dumps(message_data)
                 )
@@ -190,17 +168,12 @@ class MessageViewSet(ModelViewSet):
 
             try:
                 async_to_sync(get_channel_layer().group_send)(
-                    f"chat_{community.id}",
+                    f"community_chat_{community.id}",
                     {
                         "type": "chat.message",
-                        "message": {
-                            "id": message.id,
-                            "text": message.text,
-                            "sender": message.sender.id,
-                            "created_at": message.created_at.isoformat(),
-                            "sender_name": message.sender.get_full_name(),
-                            "sender_profile_pic": message.sender.profile_pic_url.url if message.sender.profile_pic_url else None
-                        }
+                        "message": message_payload(
+                            message.sender, message.text, message.created_at, message.id, message.client_id
+                        ),
                     }
                 )
             except Exception as e:
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Course,Category,Module,Purchase,Review,CourseTradeModel,Comment,ModuleCompletion, ChatMessage, ChatRoom
+from .models import Course,Category,Module,Purchase,Review,CourseTradeModel,Comment,ModuleCompletion, ChatMessage, ChatRoom, CourseStats
 
 # Register your models here.
 
@@ -12,4 +12,5 @@ admin.site.register(CourseTradeModel)
 admin.site.register(Comment)
 admin.site.register(ModuleCompletion)
 admin.site.register(ChatRoom)
-admin.site.register(ChatMessage)
\ No newline at end of file
+admin.site.register(ChatMessage)
+admin.site.register(CourseStats)
\ No newline at end of file
@@ -0,0 +1,118 @@
+import logging
+from django.db import transaction
+from base.streams import DEFAULT_STREAM_MAXLEN, ack, ensure_group, entry_sent_at, insert_new_rows, read_batch, record_drain, sent_at_field
+from users.notifications import notify_many, push_notifications
+from .models import ChatMessage, ChatRoom
+
+logger = logging.getLogger(__name__)
+
+
+"""
+Write-behind persistence for private chat. PrivateChatConsumer broadcasts a message right away and appends it
+to CHAT_STREAM; drain_chat_stream() reads the stream through a consumer group and bulk inserts the ChatMessage
+and Notification rows. The client_id of every entry is unique per sender on ChatMessage, so redelivered entries
+are skipped, and the send time recorded in the entry becomes created_at.
+"""
+
+CHAT_STREAM = "private_chat_messages"
+CHAT_GROUP = "chat_persistence"
+ENTRY_FIELDS = ("client_id", "chat_room_id", "sender_id", "sender_name", "recipient_id", "text")
+
+
+def build_entry(client_id, chat_room_id, sender, recipient_id, text):
+    return {
+        "client_id": client_id,
+        "chat_room_id": str(chat_room_id),
+        "sender_id": str(sender.id),
+        "sender_name": sender.get_full_name(),
+        "recipient_id": str(recipient_id),
+        "text": text,
+        "sent_at": sent_at_field(),
+    }
+
+
+def enqueue_message(client, entry):
+    """Works with both clients, with the asyncio client the returned coroutine has to be awaited"""
+    return client.xadd(CHAT_STREAM, entry, maxlen=DEFAULT_STREAM_MAXLEN, approximate=True)
+
+
+def persist_entries(entries):
+    """
+    Inserts the messages and notifications of a batch of stream entries, skipping ones already stored.
+    Returns the number of new messages and the notifications to push
+    """
+    by_key = {}
+    for entry_id, fields in entries:
+        if not all(key in fields for key in ENTRY_FIELDS):
+            # A malformed entry would otherwise be redelivered forever, it is acked with the rest of the batch
+            logger.error(f"Dropping malformed chat stream entry {entry_id}: {fields}")
+            continue
+        by_key.setdefault((int(fields["sender_id"]), fields["client_id"]), fields)
+
+    existing = set(ChatMessage.objects.filter(
+        sender_id__in={sender_id for sender_id, _ in by_key},
+        client_id__in={client_id for _, client_id in by_key},
+    ).values_list("sender_id", "client_id"))
+    room_ids = set(ChatRoom.objects.filter(
+        id__in={int(fields["chat_room_id"]) for fields in by_key.values()}
+    ).values_list("id", flat=True))
+
+    fresh = [
+        fields for key, fields in by_key.items()
+        if key not in existing and int(fields["chat_room_id"]) in room_ids
+    ]
+    if not fresh:
+        return 0, []
+
+    with transaction.atomic():
+        inserted = insert_new_rows(ChatMessage, [
+            ChatMessage(
+                client_id=fields["client_id"],
+                chat_room_id=int(fields["chat_room_id"]),
+                sender_id=int(fields["sender_id"]),
+                text=fields["text"],
+                created_at=entry_sent_at(fields),
+            )
+            for fields in fresh
+        ])
+        # Only the rows inserted here notify, a concurrent drain notified for the others
+        inserted = {(message.sender_id, message.client_id) for message in inserted}
+        fresh = [fields for fields in fresh if (int(fields["sender_id"]), fields["client_id"]) in inserted]
+        # Consecutive messages from the same sender collapse into one unread notification per room
+        notifications = notify_many("message", [
+            (
+                int(fields["recipient_id"]),
+                f"New message from {fields['sender_name']}",
+                f"chat_room_{fields['chat_room_id']}_{fields['sender_id']}",
+            )
+            for fields in fresh
+        ])
+    return len(fresh), notifications
+
+
+def drain_chat_stream(client, consumer, batch_size=500, block_ms=None, max_batches=None):
+    """Persists stream entries batch by batch until the stream is empty or max_batches is reached"""
+    ensure_group(client, CHAT_STREAM, CHAT_GROUP)
+    persisted = 0
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        entries = read_batch(client, CHAT_STREAM, CHAT_GROUP, consumer, count=batch_size, block_ms=block_ms)
+        if not entries:
+            break
+
+        saved, notifications = persist_entries(entries)
+        # Only ack once the rows are committed, a crash before this point leaves the entries pending for a retry
+        ack(client, CHAT_STREAM, CHAT_GROUP, [entry_id for entry_id, _ in entries])
+
+        if notifications:
+            try:
+                push_notifications(notifications)
+            except Exception as e:
+                logger.error(f"Failed to push chat notifications: {e}", exc_info=True)
+
+        persisted += saved
+        batches += 1
+
+    record_drain(client, CHAT_STREAM, CHAT_GROUP, persisted)
+    return persisted
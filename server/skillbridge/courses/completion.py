@@ -0,0 +1,57 @@
+from django.core.cache import cache
+from django.db import transaction
+from .models import Module, Purchase
+
+
+"""
+Redis cache in front of Purchase.completed_module_ids, so a module list needs one lookup per course. Reads never
+write: purchases from before the array existed are backfilled by rebuild_module_completions (and by
+mark_completed under its row lock), until then they read as nothing completed.
+"""
+
+COMPLETION_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def completion_cache_key(user_id, course_id):
+    return f"course_completion_{user_id}_{course_id}"
+
+
+def cache_completed_module_ids(purchase):
+    cache.set(
+        completion_cache_key(purchase.user_id, purchase.course_id),
+        purchase.completed_module_ids,
+        timeout=COMPLETION_CACHE_TIMEOUT
+    )
+
+
+def invalidate_completed_module_ids(purchases):
+    cache.delete_many([completion_cache_key(purchase.user_id, purchase.course_id) for purchase in purchases])
+
+
+def get_completed_module_ids(user_id, course_id):
+    """Returns the set of completed module ids, empty when the course is not purchased"""
+    module_ids = cache.get(completion_cache_key(user_id, course_id))
+    if module_ids is None:
+        purchase = Purchase.objects.filter(user_id=user_id, course_id=course_id).only(
+            "id", "user_id", "course_id", "completed_module_ids"
+        ).first()
+        if purchase is None:
+            return set()
+        module_ids = purchase.completed_module_ids
+        cache_completed_module_ids(purchase)
+    return set(module_ids)
+
+
+def remove_module_from_completions(course_id, module_id):
+    """Prunes a module that left the course from its purchases' arrays and recomputes their progress"""
+    total_modules = Module.objects.filter(course_id=course_id).count()
+    with transaction.atomic():
+        changed = [
+            purchase for purchase in Purchase.objects.select_for_update().filter(
+                course_id=course_id, completed_module_ids__contains=[module_id]
+            )
+            if purchase.remove_completed_module(module_id, total_modules)
+        ]
+    if changed:
+        invalidate_completed_module_ids(changed)
+    return len(changed)
@@ -1,37 +1,23 @@
 import json
-import redis
 import asyncio
 from channels.generic.websocket import AsyncWebsocketConsumer
-from asgiref.sync import sync_to_async, async_to_sync
-from channels.db import database_sync_to_async
-from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.tokens import AccessToken
-from .models import ChatMessage, ChatRoom
-from users.models import Notification
-from channels.layers import get_channel_layer
+from .rooms import get_chat_room_members
+from .chat_pipeline import build_entry, enqueue_message
 import logging
+from base.presence import HEARTBEAT_INTERVAL, RoomPresence
+from base.redis_client import get_async_redis
+from base.streams import make_client_id
 
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
-redis_client = redis.StrictRedis(host="redis", port=6379, db=0, decode_responses=True)
 
 
 class PrivateChatConsumer(AsyncWebsocketConsumer):
     
     async def connect(self):
-        query_string = self.scope["query_string"].decode()
-        query_params = dict(qc.split("=") for qc in query_string.split("&") if "=" in qc)
-        token = query_params.get("token", None)
-
-        if token:
-            try:
-                access_token = AccessToken(token)
-                self.scope["user"] = await sync_to_async(User.objects.get)(id=access_token["user_id"])
-            except Exception:
-                self.scope["user"] = AnonymousUser()
-
+        # scope["user"] is resolved from ?token= by users.middleware.JWTAuthMiddleware
         if not self.scope["user"].is_authenticated:
             await self.close(code=4001)
             return
@@ -39,14 +25,15 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
         self.chat_room_id = self.scope['url_route']['kwargs']['chat_room_id']
         self.room_group_name = f"chat_{self.chat_room_id}"
 
-        try:
-            chat_room = await sync_to_async(lambda: ChatRoom.objects.select_related("student", "tutor").get(id=self.chat_room_id))()
-            if self.scope["user"] not in [chat_room.student, chat_room.tutor]:
-                await self.close(code=4003)
-                return
-        except ChatRoom.DoesNotExist:
+        members = await get_chat_room_members(self.chat_room_id)
+        if members is None:
             await self.close(code=4004)
             return
+        student_id, tutor_id = members
+        if self.scope["user"].id not in members:
+            await self.close(code=4003)
+            return
+        self.recipient_id = tutor_id if self.scope["user"].id == student_id else student_id
         
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -54,52 +41,43 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
         )
         await self.accept()
 
-        # Track user connection count in Redis
-        await sync_to_async(redis_client.hincrby)(
-            f"chat_room_{self.chat_room_id}_online_users",
-            self.scope["user"].id,
-            1
-        )
-
-        await self.send_presence_update()
+        self.presence = RoomPresence("private_chat", self.chat_room_id, self.room_group_name)
+        user_id = str(self.scope["user"].id)
+        came_online = await self.presence.join(user_id, self.channel_name)
+        self.online_user_ids = set(await self.presence.online())
+        await self.send_presence()
+        if came_online:
+            await self.presence.schedule_broadcast(user_id)
+        self.heartbeat_task = asyncio.create_task(self.heartbeat())
 
     async def disconnect(self, close_code):
-        if hasattr(self, "room_group_name"):
+        if hasattr(self, "presence"):
+            self.heartbeat_task.cancel()
             user_id = str(self.scope["user"].id)
+            if await self.presence.leave(user_id, self.channel_name):
+                await self.presence.schedule_broadcast(user_id)
 
-            current_count = await sync_to_async(redis_client.hincrby)(
-                f"chat_room_{self.chat_room_id}_online_users",
-                user_id,
-                -1
-            )
-            
-            if current_count <= 0:
-                await sync_to_async(redis_client.hdel)(
-                    f"chat_room_{self.chat_room_id}_online_users",
-                    user_id
-            )
-
-            # Send updated presence info
-            await asyncio.sleep(0.2)
-            await self.send_presence_update()
-            
+        if hasattr(self, "room_group_name"):
             await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
-    async def send_presence_update(self):
-        """Helper to send current online users to group"""
-        online_users = await sync_to_async(redis_client.hgetall)(
-            f"chat_room_{self.chat_room_id}_online_users"
-        )
-        online_user_ids = [uid for uid, cnt in online_users.items() if int(cnt) > 0]
-
-        
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "presence.update",
-                "online_user_ids": online_user_ids
-            }
-        )
+    async def heartbeat(self):
+        user_id = str(self.scope["user"].id)
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                if not await self.presence.heartbeat(user_id, self.channel_name):
+                    # Swept while this worker was stalled, register again
+                    if await self.presence.join(user_id, self.channel_name):
+                        await self.presence.schedule_broadcast(user_id)
+            except Exception as e:
+                logger.error(f"Presence heartbeat failed: {e}", exc_info=True)
+
+    async def send_presence(self):
+        """Clients still get the full list of online user ids, built from this socket's local copy"""
+        await self.send(text_data=json.dumps({
+            "type": "presence",
+            "online_user_ids": sorted(self.online_user_ids)
+        }))
 
     async def receive(self, text_data):
         try:
@@ -109,69 +87,42 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
             if message:
                 user = self.scope["user"]
 
-                message_data = {
-                    "sender_id": user.id,
-                    "chat_room_id": self.chat_room_id,
-                    "text": message
-                }
-
-                redis_client.lpush(f"private_chat_{self.chat_room_id}", json.dumps(message_data))
+                client_id = make_client_id(data.get("client_id"))
+                entry = build_entry(client_id, self.chat_room_id, user, self.recipient_id, message)
 
-                await self.save_message(user.id, message, self.chat_room_id)
+                # Persisted in batches by drain_chat_stream, see courses/chat_pipeline.py
+                await enqueue_message(get_async_redis(), entry)
 
                 await self.channel_layer.group_send(
                     self.room_group_name,
                     {
                         "type": "chat_message",
                         "message": message,
+                        "client_id": client_id,
                         "sender_id": user.id,
                         "sender_name": user.get_full_name(),
-                        "sender_profile_pic": user.profile_pic_url.url
+                        "sender_profile_pic": user.profile_pic_url.url if user.profile_pic_url else None
                     }
                 )
         except Exception as e:
            logger.error(f"WebSocket receive error: {e}", exc_info=True)
 
-    @database_sync_to_async
-    def save_message(self, sender_id, message, chat_room_id):
-        sender = User.objects.get(id=sender_id)
-        chat_room = ChatRoom.objects.get(id=chat_room_id)
-
-        recipient = chat_room.tutor if sender == chat_room.student else chat_room.student
-
-        ChatMessage.objects.create(sender=sender, text=message, chat_room=chat_room)
-
-        notification = Notification.objects.create(
-            user=recipient,
-            notification_type = "message",
-            message = f"New message from {sender.get_full_name()}",
-        )
-
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"notifications_{recipient.id}",
-            {
-                "type": "send.notification",
-                "message": notification.message,
-                "notification_type": "message"
-            }
-        )
-
 
     async def chat_message(self, event):
         await self.send(text_data=json.dumps({
             "type": "chat_message",
             "message": event["message"],
+            "client_id": event.get("client_id"),
             "sender_id": event["sender_id"],
             "sender_name": event["sender_name"],
             "sender_profile_pic": event["sender_profile_pic"]
         }))
 
-    # Add presence handler
-    async def presence_update(self, event):
-        """Handle presence updates"""
-        await self.send(text_data=json.dumps({
-            "type": "presence",
-            "online_user_ids": event["online_user_ids"]
-        }))
-
+    async def presence_delta(self, event):
+        """Apply the users that came online or went offline since the last delta"""
+        if not hasattr(self, "online_user_ids"):
+            return  # The snapshot taken in connect already includes this change
+        for user in event["joined"]:
+            self.online_user_ids.add(user["id"])
+        self.online_user_ids.difference_update(event["left"])
+        await self.send_presence()
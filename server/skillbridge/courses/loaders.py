@@ -0,0 +1,69 @@
+from django.db.models import Count, Q
+from .models import CourseStats, CourseTradeModel, Purchase, Review
+
+
+class CourseUserContext:
+    """
+    Per-request lookups for the user specific CourseSerializer fields.
+    Loads purchases, pending trades and review counts for a whole page of courses in a fixed
+    number of queries, so the serializer method fields become dictionary lookups.
+    """
+
+    def __init__(self, user, course_ids):
+        self.course_ids = set(course_ids)
+        self.user = user if user is not None and user.is_authenticated else None
+        self.purchases = {}
+        self.trading_course_ids = set()
+        self.review_counts = {}
+        self.completed_modules = {}
+
+        if not self.course_ids:
+            return
+
+        self.review_counts = self._load_review_counts()
+        if self.user is None:
+            return
+
+        self.purchases = {
+            purchase.course_id: purchase
+            for purchase in Purchase.objects.filter(user=self.user, course_id__in=self.course_ids)
+        }
+
+        trades = CourseTradeModel.objects.filter(
+            Q(requested_course_id__in=self.course_ids) | Q(offered_course_id__in=self.course_ids),
+            Q(accepter=self.user) | Q(requester=self.user),
+            status="pending"
+        ).values_list("requested_course_id", "offered_course_id")
+        for requested_course_id, offered_course_id in trades:
+            self.trading_course_ids.update((requested_course_id, offered_course_id))
+
+    def _load_review_counts(self):
+        counts = dict(
+            CourseStats.objects.filter(course_id__in=self.course_ids).values_list("course_id", "total_reviews")
+        )
+        missing = self.course_ids - counts.keys()
+        if missing:
+            # Courses created before CourseStats existed, count them directly until the stats are rebuilt
+            counts.update(
+                Review.objects.filter(course_id__in=missing).values("course_id")
+                .annotate(total=Count("id")).values_list("course_id", "total")
+            )
+        return counts
+
+    def covers(self, course_id):
+        return course_id in self.course_ids
+
+    def get_purchase(self, course_id):
+        return self.purchases.get(course_id)
+
+    def get_completed_module_ids(self, course_id):
+        if course_id not in self.completed_modules:
+            purchase = self.purchases.get(course_id)
+            self.completed_modules[course_id] = set(purchase.completed_module_ids) if purchase else set()
+        return self.completed_modules[course_id]
+
+    def is_under_trade(self, course_id):
+        return course_id in self.trading_course_ids
+
+    def get_review_count(self, course_id):
+        return self.review_counts.get(course_id, 0)
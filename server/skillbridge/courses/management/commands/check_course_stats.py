@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from courses.stats import find_stats_drift, rebuild_course_stats
+
+
+class Command(BaseCommand):
+    help = 'Compare CourseStats against the source tables and report (or fix) any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rebuild the stats of every drifted course')
+
+    def handle(self, *args, **options):
+        drifted = set()
+        for course_id, field, stored, live in find_stats_drift():
+            drifted.add(course_id)
+            if field == 'missing':
+                self.stdout.write(self.style.WARNING(f'Course {course_id}: stats row missing'))
+            else:
+                self.stdout.write(self.style.WARNING(f'Course {course_id}: {field} is {stored}, expected {live}'))
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('Course stats are consistent.'))
+            return
+
+        if options['fix']:
+            rebuild_course_stats(sorted(drifted))
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {len(drifted)} course(s).'))
+        else:
+            self.stdout.write(self.style.ERROR(f'{len(drifted)} course(s) drifted. Re-run with --fix to repair.'))
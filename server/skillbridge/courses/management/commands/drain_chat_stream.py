@@ -0,0 +1,28 @@
+import socket
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from courses.chat_pipeline import drain_chat_stream
+from base.redis_client import get_redis
+
+
+class Command(BaseCommand):
+    help = 'Persist private chat messages from the Redis stream in batches (runs until stopped unless --once)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--block-ms', type=int, default=1000, help='How long a read waits for new entries')
+        parser.add_argument('--consumer', default=f'writer-{socket.gethostname()}', help='Consumer name within the group')
+        parser.add_argument('--once', action='store_true', help='Drain what is in the stream and exit')
+
+    def handle(self, *args, **options):
+        client = get_redis()
+
+        if options['once']:
+            persisted = drain_chat_stream(client, options['consumer'], batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Persisted {persisted} chat message(s).'))
+            return
+
+        self.stdout.write(f"Chat writer {options['consumer']} started")
+        while True:
+            close_old_connections()
+            drain_chat_stream(client, options['consumer'], batch_size=options['batch_size'], block_ms=options['block_ms'])
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from courses.stats import rebuild_course_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized CourseStats rows from modules, purchases and reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='course_ids', help='Only rebuild the given course id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = rebuild_course_stats(options['course_ids'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {written} course(s).'))
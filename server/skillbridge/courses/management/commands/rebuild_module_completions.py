@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from courses.completion import invalidate_completed_module_ids
+from courses.models import Purchase
+
+
+class Command(BaseCommand):
+    help = 'Rebuild Purchase.completed_module_ids and progress from the ModuleCompletion rows'
+
+    def handle(self, *args, **options):
+        rebuilt = 0
+        for purchase in Purchase.objects.select_related('course', 'user').iterator(chunk_size=500):
+            purchase.update_progress()
+            invalidate_completed_module_ids([purchase])
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt completion state for {rebuilt} purchase(s).'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from courses.models import Course
+from community.models import Community
+from tutor.models import TutorProfile
+
+
+class Command(BaseCommand):
+    help = 'Recompute the full-text search vectors for courses, communities and tutors'
+
+    def handle(self, *args, **options):
+        courses = Course.objects.update(search_vector=Course.build_search_vector())
+        communities = Community.objects.update(search_vector=Community.build_search_vector())
+
+        tutors = 0
+        for tutor_profile in TutorProfile.objects.select_related('user').iterator(chunk_size=500):
+            TutorProfile.objects.filter(pk=tutor_profile.pk).update(search_vector=tutor_profile.build_search_vector())
+            tutors += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {courses} course(s), {communities} communitie(s) and {tutors} tutor(s).'
+        ))
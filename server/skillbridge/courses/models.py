@@ -1,12 +1,17 @@
+import bisect
 from django.db import models
+from django.utils import timezone
 from django.utils.text import slugify
-from base.base_models import BaseModel
+from base.base_models import BaseModel, TrackedFieldsMixin
+from base.search import weighted_vector
 from tutor.models import TutorProfile
 import cloudinary
 import cloudinary.uploader
 import cloudinary.models
 from django.contrib.auth import get_user_model
 from django.db.models import Avg
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 
 User = get_user_model()
 
@@ -60,6 +65,7 @@ class Course(BaseModel):
     is_active = models.BooleanField(default=True)
     rating = models.FloatField(default=0.0)
     stripe_price_id = models.CharField(max_length=100, null=True, blank=True)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -72,18 +78,45 @@ class Course(BaseModel):
             self.slug = slug
         super().save(*args, **kwargs)
     
+    @staticmethod
+    def build_search_vector():
+        return weighted_vector(('title', 'A'), ('description', 'B'))
+
     def update_rating(self):
+        """Full recount, the review signal handlers keep the rating current incrementally"""
         self.rating = self.reviews.aggregate(Avg('rating'))['rating__avg'] or 0.0
-        self.save()
+        Course.objects.filter(pk=self.pk).update(rating=self.rating)
 
     def __str__(self):
         return self.title
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='course_search_vector_idx'),
+            GinIndex(fields=['title'], name='course_title_trgm_idx', opclasses=['gin_trgm_ops']),
+            models.Index(fields=['-created_at', '-id'], name='course_keyset_idx'),
+        ]
+
+
+class CourseStats(models.Model):
+    """Denormalized per-course counters kept in sync by the signal handlers in courses/signals.py"""
+
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    total_modules = models.PositiveIntegerField(default=0)
+    total_duration = models.PositiveIntegerField(default=0)
+    total_purchases = models.PositiveIntegerField(default=0)
+    total_reviews = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    average_rating = models.FloatField(default=0.0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Stats for {self.course.title}"
 
     
-class Module(BaseModel):
+class Module(TrackedFieldsMixin, BaseModel):
+    tracked_fields = ("course_id", "duration")
 
     course =  models.ForeignKey(Course, on_delete=models.CASCADE, related_name='modules')
     title = models.CharField(max_length=150, null=True, blank=True)
@@ -111,7 +144,9 @@ class ModuleCompletion(BaseModel):
     def __str__(self):
         return f"{self.user.first_name} completed {self.module.title}"
 
-class Purchase(BaseModel):
+class Purchase(TrackedFieldsMixin, BaseModel):
+    tracked_fields = ("course_id", "status")
+
     PURCHASE_TYPE_CHOICES = (
         ('Payment', 'payment'),
         ('Trade', 'trade')
@@ -124,24 +159,56 @@ class Purchase(BaseModel):
     progress = models.FloatField(default=0.0, null=True, blank=True)  # Store progression percentage (0-100)
     completed = models.BooleanField(default=False)  # Mark if the course is completed
     purchased_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)  # Track purchase date
+    completed_module_ids = models.JSONField(default=list, blank=True)  # Sorted ids of the completed modules
 
     class Meta:
          unique_together = ('user', 'course')
 
-    def update_progress(self):
-        total_modules = self.course.modules.count()
-        completed_modules = ModuleCompletion.objects.filter(user=self.user, module__course=self.course).count()
-
+    def _set_progress(self, total_modules):
         if total_modules > 0:
-            self.progress = (completed_modules/total_modules) * 100
+            # Clamped in case the array briefly holds a module that is being deleted
+            self.progress = min(len(self.completed_module_ids) / total_modules * 100, 100)
             self.completed = self.progress == 100
-            self.save()
+
+    def update_progress(self):
+        """Full recount from ModuleCompletion, used to backfill or repair completed_module_ids"""
+        self.completed_module_ids = sorted(
+            ModuleCompletion.objects.filter(user=self.user, module__course=self.course).values_list('module_id', flat=True)
+        )
+        self._set_progress(self.course.modules.count())
+        self.save()
+
+    def needs_completion_backfill(self):
+        """Purchases made before completed_module_ids existed have progress but an empty array"""
+        return not self.completed_module_ids and bool(self.progress)
+
+    def remove_completed_module(self, module_id, total_modules):
+        """Takes a deleted or moved module out of the completion array. Returns False if it wasn't there"""
+        if module_id not in self.completed_module_ids:
+            return False
+        self.completed_module_ids.remove(module_id)
+        self._set_progress(total_modules)
+        self.save(update_fields=['completed_module_ids', 'progress', 'completed', 'updated_at'])
+        return True
+
+    def mark_module_completed(self, module_id, total_modules):
+        """Adds a module to the completion array and updates progress without recounting. Returns False if already there"""
+        index = bisect.bisect_left(self.completed_module_ids, module_id)
+        if index < len(self.completed_module_ids) and self.completed_module_ids[index] == module_id:
+            return False
+
+        self.completed_module_ids.insert(index, module_id)
+        self._set_progress(total_modules)
+        self.save(update_fields=['completed_module_ids', 'progress', 'completed', 'updated_at'])
+        return True
 
     def __str__(self):
 
         return f"{self.user.first_name} purchased {self.course.title}"
     
-class Review(models.Model):
+class Review(TrackedFieldsMixin, models.Model):
+    tracked_fields = ("course_id", "rating")
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="reviews")
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name="reviews")
     rating = models.PositiveIntegerField(default=1, choices=[(i,i) for i in range(1,6)])
@@ -189,6 +256,8 @@ class ChatRoom(models.Model):
     tutor = models.ForeignKey(User, on_delete=models.CASCADE, related_name="tutor_chats")
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name="course_chats")
     created_at = models.DateTimeField(auto_now_add=True)
+    student_last_read_id = models.PositiveBigIntegerField(default=0)  # Newest message id the student has seen
+    tutor_last_read_id = models.PositiveBigIntegerField(default=0)
 
     class Meta:
         unique_together = ('student', 'tutor', 'course')
@@ -200,6 +269,14 @@ class ChatMessage(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     chat_room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name="messages")
     text = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now)  # Send time, messages are inserted after the fact
+    client_id = models.CharField(max_length=64, null=True, blank=True)  # Idempotency key of the stream entry, per sender
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['chat_room', 'created_at', 'id'], name='chat_message_history_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['sender', 'client_id'], name='chat_message_sender_client_id_uniq'),
+        ]
 
-    
\ No newline at end of file
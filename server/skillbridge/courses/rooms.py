@@ -0,0 +1,74 @@
+from channels.db import database_sync_to_async
+from django.core.cache import cache
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, JSONObject
+from .models import ChatMessage, ChatRoom
+
+
+"""
+Cached participant lookups for private chat rooms, a room's student and tutor never change after creation,
+and the inbox queries built on the per participant read markers
+"""
+
+CHAT_ROOM_MEMBERS_TIMEOUT = 60 * 10
+
+
+def chat_room_members_key(chat_room_id):
+    return f"chat_room_members_{chat_room_id}"
+
+
+def invalidate_chat_room_members(chat_room_id):
+    cache.delete(chat_room_members_key(chat_room_id))
+
+
+async def get_chat_room_members(chat_room_id):
+    """Returns (student_id, tutor_id), or None when the room doesn't exist"""
+    key = chat_room_members_key(chat_room_id)
+    members = await cache.aget(key)
+    if members is None:
+        members = await database_sync_to_async(
+            lambda: ChatRoom.objects.filter(id=chat_room_id).values_list("student_id", "tutor_id").first()
+        )()
+        if members is None:
+            return None
+        await cache.aset(key, members, CHAT_ROOM_MEMBERS_TIMEOUT)
+    return tuple(members)
+
+
+def inbox_queryset(user):
+    """
+    The user's rooms with the counterpart, the latest message, the unread count and the time of the last activity.
+    Each room is one row, the message columns come from correlated subqueries on chat_message_history_idx
+    """
+    messages = ChatMessage.objects.filter(chat_room=OuterRef("pk"))
+    latest = messages.order_by("-created_at", "-id")
+    last_read = Case(
+        When(student_id=user.id, then=F("student_last_read_id")),
+        default=F("tutor_last_read_id"),
+    )
+    unread = (
+        messages.filter(id__gt=OuterRef("my_last_read_id")).exclude(sender_id=user.id)
+        .order_by().values("chat_room").annotate(total=Count("id")).values("total")
+    )
+
+    return (
+        ChatRoom.objects.filter(Q(student_id=user.id) | Q(tutor_id=user.id))
+        .select_related("student", "tutor", "course")
+        .annotate(
+            my_last_read_id=last_read,
+            last_message=Subquery(latest.values(
+                json=JSONObject(id="id", text="text", sender="sender_id", created_at="created_at")
+            )[:1]),
+            last_activity_at=Coalesce(Subquery(latest.values("created_at")[:1]), F("created_at")),
+            unread_count=Coalesce(Subquery(unread), Value(0)),
+        )
+    )
+
+
+def mark_chat_room_read(chat_room, user, message_id=None):
+    """Moves the user's read marker up to message_id, or to the newest stored message. It never moves back"""
+    if message_id is None:
+        message_id = chat_room.messages.order_by("-id").values_list("id", flat=True).first() or 0
+
+    field = "student_last_read_id" if chat_room.student_id == user.id else "tutor_last_read_id"
+    return ChatRoom.objects.filter(pk=chat_room.pk, **{f"{field}__lt": message_id}).update(**{field: message_id})
@@ -1,11 +1,13 @@
 from rest_framework import serializers
-from .models import Module,Course,Category, Review, Comment, CourseTradeModel, ModuleCompletion, Purchase, ChatRoom, ChatMessage
+from .models import Module,Course,Category, Review, Comment, CourseTradeModel, ChatRoom, ChatMessage
 from tutor.models import TutorProfile
 from django.contrib.auth import get_user_model
 from cloudinary.utils import cloudinary_url
 import cloudinary.uploader
-from django.db.models import Q
+from django.db import models
 from cloudinary.uploader import upload as cloudinary_upload
+from .loaders import CourseUserContext
+from .completion import get_completed_module_ids
 
 User = get_user_model()
 
@@ -35,8 +37,19 @@ class ModuleSerializer(serializers.ModelSerializer):
         """Check if the module is completed for the authenticated user"""
         user = self.context.get('request').user
         if user.is_authenticated:
-            return ModuleCompletion.objects.filter(user=user, module=obj).exists()
+            return obj.id in self._completed_module_ids(user, obj.course_id)
         return False
+
+    def _completed_module_ids(self, user, course_id):
+        """One lookup per course, shared by every module serialized with the same context"""
+        user_context = self.context.get("course_user_context")
+        if user_context is not None and user_context.covers(course_id):
+            return user_context.get_completed_module_ids(course_id)
+
+        completed = self.context.setdefault("completed_module_ids", {})
+        if course_id not in completed:
+            completed[course_id] = get_completed_module_ids(user.id, course_id)
+        return completed[course_id]
     
     def get_tasks(self, obj):
         if obj.tasks:
@@ -94,6 +107,16 @@ class CourseTutorSerializer(serializers.ModelSerializer):
         fields = ['id', 'first_name', 'last_name', 'profile_pic', "user_id"]
 
 
+"""Builds the per-user lookups for the whole page once before the courses are serialized"""
+class CourseListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        courses = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        request = self.context.get("request")
+        self.context["course_user_context"] = CourseUserContext(getattr(request, "user", None), [course.pk for course in courses])
+        return super().to_representation(courses)
+
+
 """Serializer for Course, Made the ModuleSerializer Read only field"""
 class CourseSerializer(serializers.ModelSerializer):
     modules = ModuleSerializer(many=True, read_only=True)
@@ -116,43 +139,42 @@ class CourseSerializer(serializers.ModelSerializer):
         fields = ['id', 'tutor', 'category', 'slug', 'title', 'description', 'thumbnail', 
                   'total_enrollment', 'status', 'skill_level', 'price', 'is_active', 
                   'rating', 'modules', 'total_modules', 'total_duration', 'total_purchases','total_reviews', 'is_under_trade', 'progress', 'completed',  'category_details']
-        
-    def get_is_under_trade(self, obj):
+        list_serializer_class = CourseListSerializer
+
+    def _is_authenticated(self):
         request = self.context.get("request")
+        return bool(request and request.user.is_authenticated)
+
+    def _user_context(self, obj):
+        """Page level lookups built by CourseListSerializer, or a single course one when serializing one object"""
+        user_context = self.context.get("course_user_context")
+        if user_context is None or not user_context.covers(obj.pk):
+            request = self.context.get("request")
+            user_context = CourseUserContext(getattr(request, "user", None), [obj.pk])
+            self.context["course_user_context"] = user_context
+        return user_context
         
-        if not request or not request.user.is_authenticated or request.user.is_anonymous:
+    def get_is_under_trade(self, obj):
+        if not self._is_authenticated():
             return False
-        return CourseTradeModel.objects.filter(
-            Q(requested_course=obj) | Q(offered_course=obj),
-            Q(accepter=request.user) | Q(requester=request.user),
-            status = "pending"
-        ).exists()
+        return self._user_context(obj).is_under_trade(obj.pk)
     
     def get_progress(self, obj):
         """Returns the progress percentage of the course  for the authenticated user"""
-        request = self.context.get("request")
-        if not request or not request.user.is_authenticated or request.user.is_anonymous:
+        if not self._is_authenticated():
             return False
-        try:
-            purchase = Purchase.objects.get(user=request.user, course=obj)
-            return purchase.progress
-        except Purchase.DoesNotExist:
-            return None
+        purchase = self._user_context(obj).get_purchase(obj.pk)
+        return purchase.progress if purchase else None
         
     def get_completed(self, obj):
         """Returns the completion status of the course for the authenticated user"""
-        request = self.context.get("request")
-        if not request or not request.user.is_authenticated or request.user.is_anonymous:
+        if not self._is_authenticated():
             return False
-        
-        try:
-            purchase = Purchase.objects.get(user=request.user, course=obj)
-            return purchase.completed
-        except Purchase.DoesNotExist:
-            return None
+        purchase = self._user_context(obj).get_purchase(obj.pk)
+        return purchase.completed if purchase else None
         
     def get_total_reviews(self, obj):
-        return obj.reviews.count()
+        return self._user_context(obj).get_review_count(obj.pk)
 
 """Serializer to include user first name and profile pic to the review"""
 class UserSerializer(serializers.ModelSerializer):
@@ -172,11 +194,8 @@ class ReviewSerializer(serializers.ModelSerializer):
         read_only_fields = ['user', 'course', 'created_at']
 
     def create(self, validated_data):
-        review = Review.objects.create(**validated_data)
-        course = validated_data['course']
-        course.update_rating()
-
-        return review
+        # CourseStats and Course.rating are updated by the post_save handler in courses/signals.py
+        return Review.objects.create(**validated_data)
     
 
 """Serializer for comments"""
@@ -295,6 +314,23 @@ class ChatRoomSerializer(serializers.ModelSerializer):
         model = ChatRoom
         fields = ['id', 'student', 'tutor', 'course', 'course_title']
 
+"""Inbox row, expects the annotations of courses.rooms.inbox_queryset and the requesting user in the context"""
+class ChatInboxSerializer(serializers.ModelSerializer):
+    course_title = serializers.CharField(source="course.title", read_only=True)
+    counterpart = serializers.SerializerMethodField()
+    last_message = serializers.JSONField(read_only=True)
+    last_activity_at = serializers.DateTimeField(read_only=True)
+    unread_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = ChatRoom
+        fields = ['id', 'course', 'course_title', 'counterpart', 'last_message', 'last_activity_at', 'unread_count']
+
+    def get_counterpart(self, obj):
+        user = self.context["request"].user
+        counterpart = obj.tutor if obj.student_id == user.id else obj.student
+        return UserSerializer(counterpart).data
+
 class ChatMessageSerializer(serializers.ModelSerializer):
     sender_name = serializers.CharField(source="sender.get_full_name", read_only=True)
     sender_profile_pic = serializers.SerializerMethodField()
@@ -0,0 +1,136 @@
+from django.db.models.signals import post_save, post_delete
+from base.search import refresh_search_vector
+from base.response_cache import invalidate_tags
+from django.dispatch import receiver
+from .completion import remove_module_from_completions
+from .models import Category, ChatRoom, Course, CourseStats, Module, Purchase, Review
+from .rooms import invalidate_chat_room_members
+from .stats import COMPLETED_PURCHASE_STATUS, apply_stats_delta, rebuild_course_stats, sync_course_rating
+
+
+@receiver(post_save, sender=Course)
+def create_course_stats(sender, instance, created, **kwargs):
+    if created:
+        CourseStats.objects.get_or_create(course=instance)
+
+
+@receiver(post_save, sender=Course)
+def refresh_course_search_vector(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not {"title", "description"} & set(update_fields):
+        return
+    refresh_search_vector(Course, instance.pk, Course.build_search_vector())
+
+
+@receiver(post_save, sender=Module)
+def module_saved(sender, instance, created, **kwargs):
+    duration = instance.duration or 0
+
+    if created:
+        apply_stats_delta(instance.course_id, total_modules=1, total_duration=duration)
+    elif not instance.has_loaded_value("duration"):
+        # Instance was not loaded from the database, so there is no baseline to diff against
+        rebuild_course_stats([instance.course_id])
+    else:
+        previous_course_id = instance.get_loaded_value("course_id", instance.course_id)
+        previous_duration = instance.get_loaded_value("duration") or 0
+        if previous_course_id != instance.course_id:
+            apply_stats_delta(previous_course_id, total_modules=-1, total_duration=-previous_duration)
+            apply_stats_delta(instance.course_id, total_modules=1, total_duration=duration)
+            remove_module_from_completions(previous_course_id, instance.id)
+        else:
+            apply_stats_delta(instance.course_id, total_duration=duration - previous_duration)
+
+    instance.snapshot_tracked_fields()
+
+
+@receiver(post_delete, sender=Module)
+def module_deleted(sender, instance, **kwargs):
+    apply_stats_delta(instance.course_id, total_modules=-1, total_duration=-(instance.duration or 0))
+    # ModuleCompletion rows cascade, the purchases' arrays have to be pruned by hand
+    remove_module_from_completions(instance.course_id, instance.id)
+
+
+def _is_counted(status):
+    return 1 if status == COMPLETED_PURCHASE_STATUS else 0
+
+
+def invalidate_purchase_responses():
+    # Course payloads show the purchase count and top rated tutors their number of students
+    invalidate_tags("courses", "tutors")
+
+
+@receiver(post_save, sender=Purchase)
+def purchase_saved(sender, instance, created, **kwargs):
+    if created:
+        apply_stats_delta(instance.course_id, total_purchases=_is_counted(instance.status))
+        invalidate_purchase_responses()
+    elif not instance.has_loaded_value("status"):
+        rebuild_course_stats([instance.course_id])
+        invalidate_purchase_responses()
+    else:
+        previous_course_id = instance.get_loaded_value("course_id", instance.course_id)
+        previous_status = instance.get_loaded_value("status")
+        previous = _is_counted(previous_status)
+        if previous_course_id != instance.course_id:
+            apply_stats_delta(previous_course_id, total_purchases=-previous)
+            apply_stats_delta(instance.course_id, total_purchases=_is_counted(instance.status))
+            invalidate_purchase_responses()
+        else:
+            apply_stats_delta(instance.course_id, total_purchases=_is_counted(instance.status) - previous)
+            # Progress updates leave the cached payloads as they are
+            if previous_status != instance.status:
+                invalidate_purchase_responses()
+
+    instance.snapshot_tracked_fields()
+
+
+@receiver(post_delete, sender=Purchase)
+def purchase_deleted(sender, instance, **kwargs):
+    apply_stats_delta(instance.course_id, total_purchases=-_is_counted(instance.status))
+    invalidate_purchase_responses()
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, **kwargs):
+    if created:
+        apply_stats_delta(instance.course_id, total_reviews=1, rating_sum=instance.rating)
+    elif not instance.has_loaded_value("rating"):
+        rebuild_course_stats([instance.course_id])
+    else:
+        previous_course_id = instance.get_loaded_value("course_id", instance.course_id)
+        previous_rating = instance.get_loaded_value("rating")
+        if previous_course_id != instance.course_id:
+            apply_stats_delta(previous_course_id, total_reviews=-1, rating_sum=-previous_rating)
+            apply_stats_delta(instance.course_id, total_reviews=1, rating_sum=instance.rating)
+            sync_course_rating([previous_course_id])
+        elif previous_rating == instance.rating:
+            return
+        else:
+            apply_stats_delta(instance.course_id, rating_sum=instance.rating - previous_rating)
+
+    sync_course_rating([instance.course_id])
+    instance.snapshot_tracked_fields()
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    apply_stats_delta(instance.course_id, total_reviews=-1, rating_sum=-instance.rating)
+    sync_course_rating([instance.course_id])
+
+
+@receiver([post_save, post_delete], sender=Course)
+@receiver([post_save, post_delete], sender=Module)
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_course_responses(sender, **kwargs):
+    invalidate_tags("courses")
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_responses(sender, **kwargs):
+    # Course payloads embed the category, so they go too
+    invalidate_tags("categories", "courses")
+
+
+@receiver(post_delete, sender=ChatRoom)
+def invalidate_chat_room(sender, instance, **kwargs):
+    invalidate_chat_room_members(instance.id)
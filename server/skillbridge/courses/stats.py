@@ -0,0 +1,114 @@
+from django.db.models import Count, Sum, F, Value, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Coalesce
+from base.expressions import running_average
+from .models import Course, CourseStats, Module, Purchase, Review
+
+
+COMPLETED_PURCHASE_STATUS = "completed"
+STATS_FIELDS = ["total_modules", "total_duration", "total_purchases", "total_reviews", "rating_sum"]
+
+
+def with_course_stats(queryset, all_purchases=False):
+    """
+    Annotates a course queryset with the denormalized counters used by CourseSerializer. total_purchases counts
+    completed purchases, all_purchases counts every purchase instead with a subquery per course, which is what the
+    purchased courses list has always shown
+    """
+    if all_purchases:
+        total_purchases = _course_aggregate(Purchase.objects.all(), Count("pk"))
+    else:
+        total_purchases = Coalesce(F("stats__total_purchases"), Value(0))
+    return queryset.annotate(
+        total_modules=Coalesce(F("stats__total_modules"), Value(0)),
+        total_duration=Coalesce(F("stats__total_duration"), Value(0)),
+        total_purchases=total_purchases,
+    )
+
+
+def apply_stats_delta(course_id, **deltas):
+    """
+    Shifts the counters of a single stats row in one UPDATE using F() expressions. A course without a stats row
+    (created before CourseStats existed) gets one built from the source tables instead, which already include the
+    write being counted
+    """
+    updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if not course_id or not updates:
+        return
+
+    if "total_reviews" in updates or "rating_sum" in updates:
+        updates["average_rating"] = running_average(
+            "rating_sum", "total_reviews", deltas.get("rating_sum", 0), deltas.get("total_reviews", 0)
+        )
+
+    if not CourseStats.objects.filter(course_id=course_id).update(**updates):
+        rebuild_course_stats([course_id])
+
+
+def sync_course_rating(course_ids):
+    """Copies the stats average onto Course.rating in a single UPDATE, without a full save()"""
+    average = CourseStats.objects.filter(course_id=OuterRef("pk")).values("average_rating")[:1]
+    return Course.objects.filter(pk__in=course_ids, stats__isnull=False).update(rating=Subquery(average))
+
+
+def _course_aggregate(queryset, aggregate):
+    subquery = queryset.filter(course=OuterRef("pk")).order_by().values("course").annotate(value=aggregate).values("value")[:1]
+    return Coalesce(Subquery(subquery, output_field=IntegerField()), Value(0))
+
+
+def annotate_live_stats(queryset):
+    """Computes the counters from the source tables, one correlated subquery per counter"""
+    return queryset.annotate(
+        live_total_modules=_course_aggregate(Module.objects.all(), Count("pk")),
+        live_total_duration=_course_aggregate(Module.objects.all(), Sum("duration")),
+        live_total_purchases=_course_aggregate(Purchase.objects.filter(status=COMPLETED_PURCHASE_STATUS), Count("pk")),
+        live_total_reviews=_course_aggregate(Review.objects.all(), Count("pk")),
+        live_rating_sum=_course_aggregate(Review.objects.all(), Sum("rating")),
+    )
+
+
+def _stats_from_live(course):
+    stats = CourseStats(course_id=course.pk, **{field: getattr(course, f"live_{field}") for field in STATS_FIELDS})
+    stats.average_rating = stats.rating_sum / stats.total_reviews if stats.total_reviews else 0.0
+    return stats
+
+
+def rebuild_course_stats(course_ids=None, batch_size=1000):
+    """Recomputes stats rows from scratch, creating any that are missing. Returns the number of rows written"""
+    queryset = Course.objects.all()
+    if course_ids is not None:
+        queryset = queryset.filter(pk__in=course_ids)
+
+    written = 0
+    batch = []
+    for course in annotate_live_stats(queryset.order_by("pk")).iterator(chunk_size=batch_size):
+        batch.append(_stats_from_live(course))
+        if len(batch) >= batch_size:
+            written += _upsert_stats(batch)
+            batch = []
+    if batch:
+        written += _upsert_stats(batch)
+    return written
+
+
+def _upsert_stats(batch):
+    CourseStats.objects.bulk_create(
+        batch,
+        update_conflicts=True,
+        unique_fields=["course"],
+        update_fields=STATS_FIELDS + ["average_rating"],
+    )
+    return len(batch)
+
+
+def find_stats_drift(batch_size=1000):
+    """Yields (course_id, field, stored, live) for every counter that disagrees with the source tables"""
+    queryset = annotate_live_stats(Course.objects.select_related("stats").order_by("pk"))
+    for course in queryset.iterator(chunk_size=batch_size):
+        stats = getattr(course, "stats", None)
+        if stats is None:
+            yield course.pk, "missing", None, None
+            continue
+        for field in STATS_FIELDS:
+            stored, live = getattr(stats, field), getattr(course, f"live_{field}")
+            if stored != live:
+                yield course.pk, field, stored, live
@@ -1 +1,38 @@
+import logging
+import socket
+from celery import shared_task
+from django.db.models import F
+from .models import Course
+from .stats import find_stats_drift, rebuild_course_stats, sync_course_rating
+from .chat_pipeline import drain_chat_stream
+from base.redis_client import get_redis
 
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def reconcile_course_ratings():
+    """Recomputes review counters that drifted from the reviews table and realigns Course.rating"""
+    drifted = {
+        course_id for course_id, field, _, _ in find_stats_drift()
+        if field in ("missing", "total_reviews", "rating_sum")
+    }
+    if drifted:
+        logger.warning(f"Course rating drift detected on {len(drifted)} course(s): {sorted(drifted)[:20]}")
+        rebuild_course_stats(sorted(drifted))
+
+    stale_ids = list(Course.objects.exclude(rating=F("stats__average_rating")).filter(stats__isnull=False).values_list("id", flat=True))
+    if stale_ids:
+        logger.warning(f"Course.rating out of step with stats on {len(stale_ids)} course(s)")
+        sync_course_rating(stale_ids)
+
+    return {"drifted_stats": len(drifted), "stale_ratings": len(stale_ids)}
+
+
+@shared_task
+def persist_chat_messages(batch_size=500, max_batches=20):
+    """Safety net for the chat writer process, drains whatever it left in the private chat stream"""
+    persisted = drain_chat_stream(get_redis(), f"celery-{socket.gethostname()}", batch_size=batch_size, max_batches=max_batches)
+    if persisted:
+        logger.info(f"Persisted {persisted} chat message(s) from the stream")
+    return persisted
@@ -1,3 +1,351 @@
-from django.test import TestCase
+import asyncio
+from io import StringIO
+from unittest import mock
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from datetime import datetime, timezone
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from base import presence
+from base.response_cache import get_tag_versions
+from base.testing import isolated_services, make_user
+from base.redis_client import get_async_redis
+from tutor.models import TutorProfile
+from users.middleware import JWTAuthMiddlewareStack
+from users.models import Notification
+from .chat_pipeline import CHAT_STREAM, build_entry, persist_entries
+from .completion import get_completed_module_ids
+from .stats import find_stats_drift
+from .models import ChatMessage, ChatRoom, Course, CourseStats, Module, ModuleCompletion, Purchase, Review
+from . import routing
 
-# Create your tests here.
+User = get_user_model()
+
+
+def make_course(tutor_email="tutor@example.com", title="Django for beginners"):
+    profile = TutorProfile.objects.create(user=make_user(tutor_email, role="tutor", last_name="Tutor"))
+    return Course.objects.create(tutor=profile, title=title, status="Approved")
+
+
+@isolated_services
+class PrivateChatConsumerTests(TransactionTestCase):
+    """The consumer enqueues to the chat stream in Redis, see base/testing.py"""
+
+    def setUp(self):
+        course = make_course()
+        self.student = make_user("student@example.com")
+        self.room = ChatRoom.objects.create(student=self.student, tutor=course.tutor.user, course=course)
+        self.application = JWTAuthMiddlewareStack(URLRouter(routing.websocket_urlpatterns))
+
+    async def receive_of_type(self, communicator, message_type):
+        while True:
+            message = await communicator.receive_json_from(timeout=2)
+            if message["type"] == message_type:
+                return message
+
+    async def test_message_is_broadcast_and_enqueued(self):
+        token = AccessToken.for_user(self.student)
+        communicator = WebsocketCommunicator(self.application, f"/ws/chat/{self.room.id}/?token={token}")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await communicator.send_json_to({"message": "Hello there", "client_id": "first-message"})
+        echoed = await self.receive_of_type(communicator, "chat_message")
+        self.assertEqual(echoed["message"], "Hello there")
+        self.assertEqual(echoed["sender_id"], self.student.id)
+
+        client = get_async_redis()
+        entries = [
+            (entry_id, fields) for entry_id, fields in await client.xrange(CHAT_STREAM)
+            if fields["client_id"] == echoed["client_id"]
+        ]
+        try:
+            self.assertEqual(len(entries), 1)
+            self.assertEqual(entries[0][1]["text"], "Hello there")
+            self.assertEqual(entries[0][1]["chat_room_id"], str(self.room.id))
+            self.assertEqual(entries[0][1]["sender_id"], str(self.student.id))
+        finally:
+            if entries:
+                await client.xdel(CHAT_STREAM, *[entry_id for entry_id, _ in entries])
+            await communicator.disconnect()
+            await asyncio.gather(*presence._pending_flushes)
+
+    async def test_outsider_is_rejected(self):
+        outsider = await User.objects.acreate(email="outsider@example.com", role="student")
+        communicator = WebsocketCommunicator(
+            self.application, f"/ws/chat/{self.room.id}/?token={AccessToken.for_user(outsider)}"
+        )
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4003)
+
+
+@isolated_services
+class PrivateChatPipelineTests(TestCase):
+
+    def setUp(self):
+        course = make_course()
+        self.tutor = course.tutor.user
+        self.student = make_user("student@example.com")
+        self.room = ChatRoom.objects.create(student=self.student, tutor=self.tutor, course=course)
+
+    def entry(self, sender, recipient, client_id, text, sent_at=None):
+        fields = build_entry(client_id, self.room.id, sender, recipient.id, text)
+        if sent_at is not None:
+            fields["sent_at"] = str(sent_at)
+        return f"{len(text)}-0", fields
+
+    def test_client_ids_are_scoped_to_the_sender(self):
+        saved, _ = persist_entries([
+            self.entry(self.student, self.tutor, "1", "from the student"),
+            self.entry(self.tutor, self.student, "1", "from the tutor"),
+        ])
+        self.assertEqual(saved, 2)
+        self.assertEqual(
+            set(ChatMessage.objects.values_list("sender_id", "text")),
+            {(self.student.id, "from the student"), (self.tutor.id, "from the tutor")},
+        )
+
+    def test_redelivered_entries_are_skipped(self):
+        entry = self.entry(self.student, self.tutor, "abc", "hello")
+        self.assertEqual(persist_entries([entry])[0], 1)
+        self.assertEqual(persist_entries([entry, entry])[0], 0)
+        self.assertEqual(ChatMessage.objects.count(), 1)
+
+    def test_entries_stored_by_a_concurrent_drain_do_not_notify_again(self):
+        entry = self.entry(self.student, self.tutor, "abc", "hello")
+        persist_entries([entry])
+        notification = Notification.objects.get(user=self.tutor)
+
+        # The existence check misses the row, as it does when another drain stores it right after
+        filter_messages = ChatMessage.objects.filter
+        calls = iter([ChatMessage.objects.none()])
+
+        def existence_check(*args, **kwargs):
+            queryset = next(calls, None)
+            return filter_messages(*args, **kwargs) if queryset is None else queryset
+
+        with mock.patch.object(ChatMessage.objects, "filter", existence_check):
+            self.assertEqual(persist_entries([entry, self.entry(self.student, self.tutor, "def", "again")])[0], 1)
+        notification.refresh_from_db()
+        self.assertEqual(notification.count, 2)
+        self.assertEqual(ChatMessage.objects.count(), 2)
+
+    def test_created_at_is_the_send_time(self):
+        persist_entries([
+            self.entry(self.student, self.tutor, "late", "sent second", sent_at=1700000060.5),
+            self.entry(self.student, self.tutor, "early", "sent first", sent_at=1700000000.25),
+        ])
+        history = list(ChatMessage.objects.order_by("created_at", "id").values_list("text", "created_at"))
+        self.assertEqual([text for text, _ in history], ["sent first", "sent second"])
+        self.assertEqual(history[0][1], datetime.fromtimestamp(1700000000.25, tz=timezone.utc))
+
+
+@isolated_services
+class ModuleCompletionTests(TestCase):
+
+    def setUp(self):
+        self.course = make_course()
+        self.modules = [Module.objects.create(course=self.course, title=f"Module {n}") for n in range(3)]
+        self.student = make_user("student@example.com")
+        self.purchase = Purchase.objects.create(user=self.student, course=self.course, status="completed")
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def complete(self, module):
+        return self.client.patch(f"/api/courses/modules/{module.id}/mark_completed/")
+
+    def test_deleting_a_completed_module_prunes_it(self):
+        for module in self.modules[:2]:
+            self.assertEqual(self.complete(module).status_code, 200)
+        self.assertEqual(get_completed_module_ids(self.student.id, self.course.id), {m.id for m in self.modules[:2]})
+
+        self.modules[0].delete()
+        self.purchase.refresh_from_db()
+        self.assertEqual(self.purchase.completed_module_ids, [self.modules[1].id])
+        self.assertEqual(self.purchase.progress, 50)
+        self.assertEqual(get_completed_module_ids(self.student.id, self.course.id), {self.modules[1].id})
+
+    def test_progress_stays_within_100(self):
+        for module in self.modules:
+            self.complete(module)
+        self.modules[2].delete()
+        self.purchase.refresh_from_db()
+        self.assertEqual(self.purchase.progress, 100)
+        self.assertTrue(self.purchase.completed)
+        self.assertEqual(len(self.purchase.completed_module_ids), 2)
+
+    def test_reads_do_not_backfill(self):
+        ModuleCompletion.objects.create(user=self.student, module=self.modules[0])
+        Purchase.objects.filter(pk=self.purchase.pk).update(progress=33.3, completed_module_ids=[])
+
+        self.assertEqual(get_completed_module_ids(self.student.id, self.course.id), set())
+        self.purchase.refresh_from_db()
+        self.assertEqual(self.purchase.completed_module_ids, [])
+
+        call_command("rebuild_module_completions", stdout=StringIO())
+        self.purchase.refresh_from_db()
+        self.assertEqual(self.purchase.completed_module_ids, [self.modules[0].id])
+        # The rebuild drops the cached empty array
+        self.assertEqual(get_completed_module_ids(self.student.id, self.course.id), {self.modules[0].id})
+
+
+@isolated_services
+class CourseStatsTests(TestCase):
+
+    def setUp(self):
+        self.course = make_course()
+
+    def test_missing_stats_row_is_built_on_the_next_write(self):
+        Module.objects.create(course=self.course, title="Intro", duration=30)
+        CourseStats.objects.filter(course=self.course).delete()
+
+        Review.objects.create(user=make_user("student@example.com"), course=self.course, rating=4)
+        stats = CourseStats.objects.get(course=self.course)
+        self.assertEqual((stats.total_modules, stats.total_duration), (1, 30))
+        self.assertEqual((stats.total_reviews, stats.rating_sum, stats.average_rating), (1, 4, 4.0))
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.rating, 4.0)
+
+    def stats(self, course):
+        return CourseStats.objects.get(course=course)
+
+    def test_moving_a_purchase_moves_its_count(self):
+        other = Course.objects.create(tutor=self.course.tutor, title="Flask for beginners")
+        purchase = Purchase.objects.create(user=make_user("student@example.com"), course=self.course, status="completed")
+        purchase = Purchase.objects.get(pk=purchase.pk)
+        purchase.course = other
+        purchase.save()
+        self.assertEqual((self.stats(self.course).total_purchases, self.stats(other).total_purchases), (0, 1))
+
+    def test_moving_a_review_moves_its_rating(self):
+        other = Course.objects.create(tutor=self.course.tutor, title="Flask for beginners")
+        Review.objects.create(user=make_user("first@example.com"), course=self.course, rating=2)
+        review = Review.objects.create(user=make_user("second@example.com"), course=self.course, rating=4)
+        review = Review.objects.get(pk=review.pk)
+        review.course = other
+        review.rating = 5
+        review.save()
+
+        stats, other_stats = self.stats(self.course), self.stats(other)
+        self.assertEqual((stats.total_reviews, stats.rating_sum, stats.average_rating), (1, 2, 2.0))
+        self.assertEqual((other_stats.total_reviews, other_stats.rating_sum, other_stats.average_rating), (1, 5, 5.0))
+        self.course.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.course.rating, other.rating), (2.0, 5.0))
+        self.assertFalse(list(find_stats_drift()))
+
+    def test_purchased_courses_count_every_purchase(self):
+        student = make_user("student@example.com")
+        Purchase.objects.create(user=student, course=self.course, status="completed")
+        Purchase.objects.create(user=make_user("pending@example.com"), course=self.course, status="pending")
+        self.assertEqual(self.stats(self.course).total_purchases, 1)
+
+        client = APIClient()
+        client.force_authenticate(student)
+        response = client.get("/api/courses/purchased-courses/")
+        self.assertEqual([course["total_purchases"] for course in response.json()["results"]], [2])
+
+
+@isolated_services
+class ResponseCacheInvalidationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.course = make_course()
+        self.tutor = self.course.tutor.user
+        self.student = make_user("student@example.com")
+
+    def versions(self):
+        return get_tag_versions(["courses", "tutors"])
+
+    def assertBumps(self, write, bumped=True):
+        before = self.versions()
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        after = self.versions()
+        self.assertEqual([a != b for a, b in zip(before, after)], [bumped, bumped])
+
+    def test_purchase_writes_bump_courses_and_tutors(self):
+        self.assertBumps(lambda: Purchase.objects.create(user=self.student, course=self.course, status="pending"))
+        purchase = Purchase.objects.get(user=self.student)
+
+        def complete():
+            purchase.status = "completed"
+            purchase.save()
+        self.assertBumps(complete)
+
+        def progress():
+            purchase.progress = 50.0
+            purchase.save(update_fields=["progress"])
+        self.assertBumps(progress, bumped=False)
+
+        self.assertBumps(purchase.delete)
+
+    def test_tutor_saves_bump_only_for_shown_fields(self):
+        self.assertBumps(lambda: self.tutor.save(update_fields=["last_login"]), bumped=False)
+
+        def rename():
+            self.tutor.first_name = "Renamed"
+            self.tutor.save(update_fields=["first_name"])
+        self.assertBumps(rename)
+        self.assertBumps(self.tutor.save)
+
+
+@isolated_services
+class CourseListTests(TestCase):
+
+    def setUp(self):
+        tutor = make_course().tutor
+        for n in range(3):
+            Course.objects.create(tutor=tutor, title=f"Course {n}", status="Approved")
+        self.client = APIClient()
+
+    def test_limit_applies_in_page_mode(self):
+        response = self.client.get("/api/courses/course/", {"limit": 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 2)
+
+    def test_cursor_pages_newest_first(self):
+        response = self.client.get("/api/courses/course/", {"pagination": "cursor", "page_size": 3})
+        self.assertEqual(response.status_code, 200)
+        titles = [course["title"] for course in response.json()["results"]]
+        self.assertEqual(titles, ["Course 2", "Course 1", "Course 0"])
+
+    def test_cursor_rejects_limit_and_search(self):
+        for params in ({"limit": 2}, {"search": "course"}):
+            response = self.client.get("/api/courses/course/", {"pagination": "cursor", **params})
+            self.assertEqual(response.status_code, 400, params)
+
+
+
+@isolated_services
+class CourseListQueryTests(TestCase):
+    """Serializing a page must not cost queries per course, see CourseListSerializer"""
+
+    def setUp(self):
+        self.tutor = make_course().tutor
+        self.student = make_user("student@example.com")
+        self.client = APIClient()
+
+    def add_courses(self, total):
+        while Course.objects.count() < total:
+            course = Course.objects.create(tutor=self.tutor, title=f"Course {Course.objects.count()}", status="Approved")
+            Module.objects.create(course=course, title="Intro", duration=10)
+            Review.objects.create(user=make_user(f"reviewer{course.id}@example.com"), course=course, rating=4)
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        # count, courses with stats, modules, review counts, plus the student's purchases and trades
+        for total in (3, 9):
+            self.add_courses(total)
+            for user, queries in ((None, 4), (self.student, 6)):
+                with self.subTest(courses=total, user=user):
+                    cache.clear()
+                    self.client.force_authenticate(user)
+                    with self.assertNumQueries(queries):
+                        response = self.client.get("/api/courses/course/")
+                    self.assertEqual(len(response.json()["results"]), total)
@@ -1,6 +1,6 @@
 from django.urls import path,include
 from rest_framework.routers import DefaultRouter
-from .views import CategoryViewSet,CourseViewSet,ModuleViewSet,CreateCheckoutSession,StripeWebhookView,VerifyPurchase,PurchasedCoursesViewSet,ReviewViewSet,CommentViewSet, CourseTradeViewSet, GetChatRoomAPIView, GetChatMessageAPIView, GetChatRoomByIdAPIView, GetUserChatRoomsAPIView
+from .views import CategoryViewSet,CourseViewSet,ModuleViewSet,CreateCheckoutSession,StripeWebhookView,VerifyPurchase,PurchasedCoursesViewSet,ReviewViewSet,CommentViewSet, CourseTradeViewSet, GetChatRoomAPIView, GetChatMessageAPIView, GetChatRoomByIdAPIView, GetUserChatRoomsAPIView, ChatInboxAPIView, MarkChatRoomReadAPIView
 
 """Created a router and resgistered the CategoryViewSet, CourseViewSet"""
 router = DefaultRouter()
@@ -21,4 +21,6 @@ urlpatterns = [
     path('chat-room/', GetChatRoomAPIView.as_view(), name='get-chat-room'),
     path('chat-room/<int:chat_room_id>/', GetChatRoomByIdAPIView.as_view(), name='get-chat-room-by-id'),
     path('chat-room/messages/', GetChatMessageAPIView.as_view(), name='get-chat-room-messages'),
+    path('chat-inbox/', ChatInboxAPIView.as_view(), name='chat-inbox'),
+    path('chat-room/<int:chat_room_id>/read/', MarkChatRoomReadAPIView.as_view(), name='mark-chat-room-read'),
 ]
\ No newline at end of file
@@ -9,26 +9,27 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny,IsAuthenticated,IsAdminUser
 from rest_framework.parsers import MultiPartParser, FormParser
-from .serializers import CourseSerializer ,CategorySerialzier, ModuleSerializer, ReviewSerializer, CommentSerializer, CourseTradeCreateSerializer, CourseTradeRequestSerializer, ChatRoomSerializer, ChatMessageSerializer
-from .models import Category,Course,Module,Purchase,Review,Comment,CourseTradeModel,ModuleCompletion,ChatRoom, ChatMessage
+from .serializers import CourseSerializer ,CategorySerialzier, ModuleSerializer, ReviewSerializer, CommentSerializer, CourseTradeCreateSerializer, CourseTradeRequestSerializer, ChatRoomSerializer, ChatMessageSerializer, ChatInboxSerializer
+from .models import Category,Course,CourseStats,Module,Purchase,Review,Comment,CourseTradeModel,ModuleCompletion,ChatRoom, ChatMessage
+from .stats import with_course_stats
+from .completion import cache_completed_module_ids
+from base.search import ranked_search
+from base.response_cache import cache_public_response
 from rest_framework.exceptions import ValidationError
 from rest_framework.viewsets import ModelViewSet,ReadOnlyModelViewSet
 from rest_framework.exceptions import NotFound
-from base.custom_pagination import CustomPagination
+from base.custom_pagination import CustomPagination, CursorEnabledPagination, KeysetPagination, MessageHistoryPagination, InboxPagination, wants_keyset
+from .rooms import inbox_queryset, mark_chat_room_read
 from base.constants import TUTOR_SHARE_PERCENT, ADMIN_SHARE_PERCENT
-from django.db.models import Count, Sum, Q, Value
-from django.db.models.functions import Coalesce
+from django.db.models import Q
 import stripe
-from django.utils import timezone
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import IntegrityError, transaction
 from decimal import Decimal
 from wallet.models import Wallet, Transaction
 from rest_framework.decorators import action
-from users.models import Notification
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+from users.notifications import notify
 import traceback
 import logging
 
@@ -43,7 +44,7 @@ class CourseViewSet(ModelViewSet):
     queryset = Course.objects.all()
     serializer_class = CourseSerializer
     parser_classes = [MultiPartParser, FormParser]
-    pagination_class = CustomPagination
+    pagination_class = CursorEnabledPagination
 
     def get_permissions(self):
         try:
@@ -62,14 +63,20 @@ class CourseViewSet(ModelViewSet):
             return context
         except Exception as e:
             raise APIException(f"Error in get_serializer_context: {str(e)}")
+
+    @cache_public_response("course_list", tags=["courses"])
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_public_response("course_detail", tags=["courses"])
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     
     def get_queryset(self):
         try:
-            queryset = (Course.objects.annotate(
-                total_modules = Count("modules", distinct=True),
-                total_duration = Coalesce(Sum("modules__duration", distinct=True), Value(0)),
-                total_purchases = Count("purchases", filter=Q(purchases__status="completed"), distinct=True)
-            ).select_related("tutor__user"))
+            queryset = with_course_stats(
+                Course.objects.select_related("tutor__user", "category").prefetch_related("modules")
+            )
 
             tutor_id = self.request.query_params.get('tutor_id')
             status = self.request.query_params.get('status')
@@ -95,24 +102,32 @@ class CourseViewSet(ModelViewSet):
                 # if not queryset.exists():
                 #     raise NotFound({"detail: No courses found with this category"})
 
-            if limit:
-                try:
-                    limit = int(limit)
-                    queryset = queryset[:limit]
-                except ValueError:
-                    pass  # Ignore invalid limit values
-
             if search:
-                queryset = queryset.filter(
-                    Q(title__icontains=search)
-                )
+                queryset = ranked_search(queryset, search, "search_vector", ["title"], ["title"])
 
             if self.request.user.is_authenticated:
                 queryset = queryset.exclude(id__in=Purchase.objects.filter(user=self.request.user).values('course'))
                 if self.request.user.role == "tutor":
                     queryset = queryset.exclude(tutor__user=self.request.user)
 
+            if wants_keyset(self.request, KeysetPagination):
+                # The cursor orders on created_at, id and pages the results itself
+                if search:
+                    raise ValidationError({"detail": "Search results are ranked, page them by page number instead of a cursor."})
+                if limit:
+                    raise ValidationError({"detail": "limit can't be combined with cursor pagination, use page_size."})
+
+            # Slicing has to come last, a sliced queryset can no longer be filtered
+            if limit:
+                try:
+                    limit = int(limit)
+                    queryset = queryset[:limit]
+                except ValueError:
+                    pass  # Ignore invalid limit values
+
             return queryset
+        except (NotFound, ValidationError):
+            raise
         except DatabaseError as e:
             raise APIException(f"Database error: {str(e)}")
         except Exception as e:
@@ -120,11 +135,9 @@ class CourseViewSet(ModelViewSet):
     
     def get_object(self):
         try:
-            queryset = Course.objects.annotate(
-            total_modules=Count("modules", distinct=True),
-            total_duration=Coalesce(Sum("modules__duration", distinct=True), Value(0)),
-            total_purchases=Count("purchases", filter=Q(purchases__status="completed"), distinct=True)
-            ).select_related("tutor__user")
+            queryset = with_course_stats(
+                Course.objects.select_related("tutor__user", "category").prefetch_related("modules")
+            )
 
             return get_object_or_404(queryset, pk=self.kwargs['pk'])
         except Http404:
@@ -164,11 +177,11 @@ class PurchasedCoursesViewSet(ReadOnlyModelViewSet):
      def get_queryset(self):
          try:
             purchased_courses = Purchase.objects.filter(user=self.request.user).values('course')
-            queryset = (Course.objects.filter(id__in=purchased_courses).annotate(
-                total_modules=Count("modules", distinct=True),
-                total_duration=Coalesce(Sum("modules__duration", distinct=True), Value(0)),
-                total_purchases=Count("purchases", distinct=True)
-                ).select_related("tutor__user"))
+            queryset = with_course_stats(
+                Course.objects.filter(id__in=purchased_courses)
+                .select_related("tutor__user", "category").prefetch_related("modules"),
+                all_purchases=True,
+            )
             
             category_id = self.request.query_params.get('category_id')
             search = self.request.query_params.get('search')
@@ -179,9 +192,7 @@ class PurchasedCoursesViewSet(ReadOnlyModelViewSet):
                 #     raise NotFound({"detail: No courses found with this category"})
                 
             if search:
-                queryset = queryset.filter(
-                    Q(title__icontains=search)
-                )
+                queryset = ranked_search(queryset, search, "search_vector", ["title"], ["title"])
             
             return queryset
          
@@ -245,19 +256,28 @@ class ModuleViewSet(ModelViewSet):
             user = request.user
 
             try:
-                purchase = Purchase.objects.get(user=user, course=module.course)
-            except Purchase.DoesNotExist:
-                return Response({"error": "You have not purchased this course."}, status=status.HTTP_403_FORBIDDEN)
-            
-            if ModuleCompletion.objects.filter(user=user, module=module).exists():
-                return Response({"message": "Module already marked as completed."}, status=status.HTTP_400_BAD_REQUEST)
-            
-            try:
-                ModuleCompletion.objects.create(user=user, module=module)
-                purchase.update_progress()
+                with transaction.atomic():
+                    # Row lock so concurrent completions of the same course don't overwrite each other's array
+                    try:
+                        purchase = Purchase.objects.select_for_update().get(user=user, course_id=module.course_id)
+                    except Purchase.DoesNotExist:
+                        return Response({"error": "You have not purchased this course."}, status=status.HTTP_403_FORBIDDEN)
+
+                    if purchase.needs_completion_backfill():
+                        purchase.update_progress()
+                    total_modules = CourseStats.objects.filter(course_id=module.course_id).values_list("total_modules", flat=True).first()
+                    if total_modules is None:
+                        total_modules = Module.objects.filter(course_id=module.course_id).count()
+
+                    if not purchase.mark_module_completed(module.id, total_modules):
+                        return Response({"message": "Module already marked as completed."}, status=status.HTTP_400_BAD_REQUEST)
+
+                    ModuleCompletion.objects.get_or_create(user=user, module=module)
             except Exception as e:
                 return Response({"error": f"Failed to mark completion: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+            cache_completed_module_ids(purchase)
+
             return Response({"message": "Module marked as completed."}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -278,6 +298,10 @@ class CategoryViewSet(ModelViewSet):
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    @cache_public_response("category_list", tags=["categories"])
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def create(self, request, *args, **kwargs):
         try:
             if Category.objects.filter(name=request.data.get('name')).exists():
@@ -597,21 +621,10 @@ class CourseTradeViewSet(ModelViewSet):
             accepter = requested_course.tutor.user
             serializer.save(requester=self.request.user, accepter=accepter)
 
-            notification = Notification.objects.create(
-                user = accepter,
-                notification_type = "trade_request",
-                message=f"You received a new trade request from {self.request.user.get_full_name()}.",
-                created_at=timezone.now()  # Explicit timestamp
-            )
-
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"notifications_{accepter.id}",
-                {
-                    "type": "send.notification",
-                    "message": notification.message,
-                    "notification_type": "trade_request"
-                }
+            notify(
+                accepter.id,
+                "trade_request",
+                f"You received a new trade request from {self.request.user.get_full_name()}.",
             )
         except Exception as e:
             raise APIException(f"An error occurred while creating the trade request. : {str(e)}")
@@ -705,6 +718,43 @@ class GetUserChatRoomsAPIView(APIView):
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             
         
+"""Inbox of the requesting user, every room with its counterpart, latest message and unread count, newest activity first"""
+class ChatInboxAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            paginator = InboxPagination()
+            page = paginator.paginate_queryset(inbox_queryset(request.user), request, view=self)
+            serializer = ChatInboxSerializer(page, many=True, context={"request": request})
+            return paginator.get_paginated_response(serializer.data)
+        except (NotFound, ValidationError):
+            raise
+        except Exception as e:
+            logger.error(f"Error occurred: {e}\nTraceback: {traceback.format_exc()}")
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class MarkChatRoomReadAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, chat_room_id):
+        try:
+            chat_room = get_object_or_404(ChatRoom, id=chat_room_id)
+            if request.user.id not in (chat_room.student_id, chat_room.tutor_id):
+                return Response({'error': 'You are not a participant of this chat room'}, status=status.HTTP_403_FORBIDDEN)
+
+            message_id = request.data.get("message_id")
+            mark_chat_room_read(chat_room, request.user, int(message_id) if message_id else None)
+            return Response({'message': 'Chat room marked as read'}, status=status.HTTP_200_OK)
+        except Http404:
+            return Response({'error': 'Chat room not found'}, status=status.HTTP_404_NOT_FOUND)
+        except (TypeError, ValueError):
+            return Response({'error': 'message_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 class GetChatMessageAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -716,11 +766,24 @@ class GetChatMessageAPIView(APIView):
         
         try:
             chat_room = get_object_or_404(ChatRoom, id=chat_room_id)
-            messages = ChatMessage.objects.filter(chat_room=chat_room)
+            messages = ChatMessage.objects.filter(chat_room=chat_room).select_related("sender").order_by("created_at", "id")
+
+            # Loading the newest messages counts as reading the room, paging back through history doesn't
+            if request.user.id in (chat_room.student_id, chat_room.tutor_id) and not request.query_params.get("before"):
+                mark_chat_room_read(chat_room, request.user)
+
+            # ?before=<id> / ?after=<id> / ?pagination=window return a window of the history, otherwise the full list
+            paginator = MessageHistoryPagination()
+            page = paginator.paginate_queryset(messages, request, view=self)
+            if page is not None:
+                return paginator.get_paginated_response(ChatMessageSerializer(page, many=True).data)
 
             serializer = ChatMessageSerializer(messages, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
+        except (Http404, NotFound, ValidationError):
+            raise
+
         except Exception as e:
             logger.error(f"Error occurred: {e}\nTraceback: {traceback.format_exc()}")
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
@@ -1,5 +1,5 @@
 from django.urls import path,include
-from .views import AdminLoginView,AdminLogoutView,AdminDetailsView,AdminTutorViewSet,UpdateUserStatusView,AdminStudentViewSet,AdminDashboardSummaryView,GlobalSummaryView, AdminEarningsOverviewView
+from .views import AdminLoginView,AdminLogoutView,AdminDetailsView,AdminTutorViewSet,UpdateUserStatusView,AdminStudentViewSet,AdminDashboardSummaryView,GlobalSummaryView, AdminEarningsOverviewView, ResponseCacheMetricsView, StreamMetricsView, ChatbotMetricsView
 from rest_framework.routers import DefaultRouter
 
 router = DefaultRouter()
@@ -14,5 +14,8 @@ urlpatterns = [
     path('global-summary/', GlobalSummaryView.as_view(), name='global_summary'),
     path('dashboard-summary/', AdminDashboardSummaryView.as_view(), name='dashboard_summary'),
     path('earnings-overview/', AdminEarningsOverviewView.as_view(), name='earnings_overview'),
+    path('cache-metrics/', ResponseCacheMetricsView.as_view(), name='cache_metrics'),
+    path('stream-metrics/', StreamMetricsView.as_view(), name='stream_metrics'),
+    path('chatbot-metrics/', ChatbotMetricsView.as_view(), name='chatbot_metrics'),
     path('users/<int:id>/', UpdateUserStatusView.as_view(), name="update_user_status"),
 ]
@@ -18,9 +18,16 @@ from base.custom_pagination import CustomPagination
 from django.shortcuts import get_object_or_404
 from django.db.models import  Q, Value, F, CharField
 from django.db.models.functions import Concat
-from wallet.models import Wallet, Transaction
+from base.search import ranked_search
+from base.response_cache import cache_public_response, get_cache_metrics, CACHED_ENDPOINTS
+from wallet.models import Wallet
+from wallet.earnings import earnings_chart
 from django.db.models import Sum
-from django.utils import timezone
+from base.redis_client import get_redis
+from base.streams import get_stream_metrics
+from courses.chat_pipeline import CHAT_STREAM
+from community.chat_pipeline import COMMUNITY_STREAM
+from chatbot.metrics import get_chatbot_metrics
 
 
 # Create your views here.
@@ -86,8 +93,10 @@ class AdminTutorViewSet(ModelViewSet):
                 )
 
             if search:
-                queryset = queryset.filter(
-                Q(full_name__icontains=search) | Q(tutor_profile__cur_job_role__icontains=search)
+                queryset = ranked_search(
+                    queryset, search, "tutor_profile__search_vector",
+                    ["first_name", "last_name", "tutor_profile__cur_job_role"],
+                    ["full_name", "tutor_profile__cur_job_role"],
                 )
 
             if active_status is not None:
@@ -238,6 +247,7 @@ class AdminDashboardSummaryView(APIView):
 class GlobalSummaryView(APIView):
     permission_classes = [AllowAny]
 
+    @cache_public_response("global_summary", tags=["users", "courses"], anonymous_only=False)
     def get(self, request):
         try:
             data = {
@@ -249,6 +259,36 @@ class GlobalSummaryView(APIView):
         except Exception as e:
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+"""Hit, miss and stale counts of the public response cache"""
+class ResponseCacheMetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            return Response(get_cache_metrics(CACHED_ENDPOINTS))
+        except Exception as e:
+            return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+"""Lag, pending entries and persisted counts of the chat persistence streams"""
+class StreamMetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            return Response(get_stream_metrics(get_redis(), [CHAT_STREAM, COMMUNITY_STREAM]))
+        except Exception as e:
+            return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+"""Time to first token and total latency percentiles of chatbot answers, with the admission queue depth and rejections"""
+class ChatbotMetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            return Response(get_chatbot_metrics())
+        except Exception as e:
+            return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 class AdminEarningsOverviewView(APIView):
     permission_classes = [IsAdminUser]
 
@@ -261,137 +301,8 @@ class AdminEarningsOverviewView(APIView):
            except Wallet.DoesNotExist:
                return Response({"error": "Wallet not found"}, status=status.HTTP_400_BAD_REQUEST)
            
-           admin_transactions = Transaction.objects.filter(wallet=admin_wallet, transaction_type="credit")
-
-           all_transactions = Transaction.objects.filter(transaction_type="credit")
-
-           today = timezone.now()
-
-           if timeframe == "day":
-               start_date = today - timezone.timedelta(days=1)
-               admin_transactions = admin_transactions.filter(created_at__gte=start_date)
-               all_transactions = all_transactions.filter(created_at__gte=start_date)
-
-               # Create empty chart data structure
-               chart_data = [
-                    {"name": "12AM", "adminEarnings": 0.0, "totalSales": 0.0},
-                    {"name": "4AM", "adminEarnings": 0.0, "totalSales": 0.0},
-                    {"name": "8AM", "adminEarnings": 0.0, "totalSales": 0.0},
-                    {"name": "12PM", "adminEarnings": 0.0, "totalSales": 0.0},
-                    {"name": "4PM", "adminEarnings": 0.0, "totalSales": 0.0},
-                    {"name": "8PM", "adminEarnings": 0.0, "totalSales": 0.0}
-                ]
-               
-               # Process admin transactions
-               for transaction in admin_transactions:
-                    hour = transaction.created_at.hour
-                    amount = float(transaction.amount)
-                    
-                    # Assign to the correct time period
-                    if 0 <= hour < 4:
-                        chart_data[0]["adminEarnings"] += amount
-                    elif 4 <= hour < 8:
-                        chart_data[1]["adminEarnings"] += amount
-                    elif 8 <= hour < 12:
-                        chart_data[2]["adminEarnings"] += amount
-                    elif 12 <= hour < 16:
-                        chart_data[3]["adminEarnings"] += amount
-                    elif 16 <= hour < 20:
-                        chart_data[4]["adminEarnings"] += amount
-                    else:  # 20 <= hour < 24
-                        chart_data[5]["adminEarnings"] += amount
-                
-               # Process all transactions (total sales)
-               for transaction in all_transactions:
-                    hour = transaction.created_at.hour
-                    amount = float(transaction.amount)
-                    
-                    # Assign to the correct time period
-                    if 0 <= hour < 4:
-                        chart_data[0]["totalSales"] += amount
-                    elif 4 <= hour < 8:
-                        chart_data[1]["totalSales"] += amount
-                    elif 8 <= hour < 12:
-                        chart_data[2]["totalSales"] += amount
-                    elif 12 <= hour < 16:
-                        chart_data[3]["totalSales"] += amount
-                    elif 16 <= hour < 20:
-                        chart_data[4]["totalSales"] += amount
-                    else:  # 20 <= hour < 24
-                        chart_data[5]["totalSales"] += amount
-           elif timeframe == "week":
-                # Last 7 days
-                start_date = today - timezone.timedelta(days=6)
-                admin_transactions = admin_transactions.filter(created_at__gte=start_date)
-                all_transactions = all_transactions.filter(created_at__gte=start_date)
-                
-                chart_data = [
-                    {"name": "Mon", "adminEarnings": 0.0, "totalSales": 0.0},
-                    {"name": "Tue", "adminEarnings": 0.0, "totalSales": 0.0},
-                    {"name": "Wed", "adminEarnings": 0.0, "totalSales": 0.0},
-                    {"name": "Thu", "adminEarnings": 0.0, "totalSales": 0.0},
-                    {"name": "Fri", "adminEarnings": 0.0, "totalSales": 0.0},
-                    {"name": "Sat", "adminEarnings": 0.0, "totalSales": 0.0},
-                    {"name": "Sun", "adminEarnings": 0.0, "totalSales": 0.0}
-                ]
-                
-                # Process admin transactions
-                for transaction in admin_transactions:
-                    day_idx = transaction.created_at.weekday()
-                    chart_data[day_idx]["adminEarnings"] += float(transaction.amount)
-                
-                # Process all transactions
-                for transaction in all_transactions:
-                    day_idx = transaction.created_at.weekday()
-                    chart_data[day_idx]["totalSales"] += float(transaction.amount)
-                
-           elif timeframe == "month":
-                # Last 4 weeks
-                start_date = today - timezone.timedelta(weeks=4)
-                admin_transactions = admin_transactions.filter(created_at__gte=start_date)
-                all_transactions = all_transactions.filter(created_at__gte=start_date)
-                
-                chart_data = [
-                    {"name": "Week 1", "adminEarnings": 0.0, "totalSales": 0.0},
-                    {"name": "Week 2", "adminEarnings": 0.0, "totalSales": 0.0},
-                    {"name": "Week 3", "adminEarnings": 0.0, "totalSales": 0.0},
-                    {"name": "Week 4", "adminEarnings": 0.0, "totalSales": 0.0}
-                ]
-                
-                # Process admin transactions
-                for transaction in admin_transactions:
-                    days_ago = (today - transaction.created_at).days
-                    week_idx = min(3, days_ago // 7)
-                    chart_data[week_idx]["adminEarnings"] += float(transaction.amount)
-                
-                # Process all transactions
-                for transaction in all_transactions:
-                    days_ago = (today - transaction.created_at).days
-                    week_idx = min(3, days_ago // 7)
-                    chart_data[week_idx]["totalSales"] += float(transaction.amount)
-                
-           elif timeframe == "year":
-                # Last 12 months
-                start_date = (today - timezone.timedelta(days=365)).replace(day=1)
-                admin_transactions = admin_transactions.filter(created_at__gte=start_date)
-                all_transactions = all_transactions.filter(created_at__gte=start_date)
-                
-                months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", 
-                        "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
-                
-                chart_data = [{"name": month, "adminEarnings": 0.0, "totalSales": 0.0} for month in months]
-                
-                # Process admin transactions
-                for transaction in admin_transactions:
-                    month_idx = transaction.created_at.month - 1
-                    chart_data[month_idx]["adminEarnings"] += float(transaction.amount)
-                
-                # Process all transactions
-                for transaction in all_transactions:
-                    month_idx = transaction.created_at.month - 1
-                    chart_data[month_idx]["totalSales"] += float(transaction.amount)
-                
-           else:
+           chart_data = earnings_chart(timeframe, {"adminEarnings": admin_wallet.id, "totalSales": None})
+           if chart_data is None:
                 return Response({"error": "Invalid timeframe"}, status=400)
 
            return Response({"chart_data": chart_data})
\ No newline at end of file
@@ -11,14 +11,17 @@ import os
 
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
 
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'skillbridge.settings')
 
+django_asgi_app = get_asgi_application()
+
+from users.middleware import JWTAuthMiddlewareStack
+
 application = ProtocolTypeRouter({
-    "http":get_asgi_application(),
-    "websocket":AuthMiddlewareStack(
+    "http":django_asgi_app,
+    "websocket":JWTAuthMiddlewareStack(
         URLRouter(
             __import__('community.routing').routing.websocket_urlpatterns +
             __import__('users.routing').routing.websocket_urlpatterns +
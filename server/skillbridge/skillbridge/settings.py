@@ -80,6 +80,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'channels',
     'django_celery_beat',
     'users',
@@ -141,11 +142,14 @@ TEMPLATES = [
 WSGI_APPLICATION = 'skillbridge.wsgi.application'
 ASGI_APPLICATION = 'skillbridge.asgi.application'
 
+REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 50))
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
-            "hosts": [("redis", 6379)],
+            "hosts": [REDIS_URL],
         },
     },
 }
@@ -153,17 +157,65 @@ CHANNEL_LAYERS = {
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
-        'LOCATION': 'redis://redis:6379/0',
+        'LOCATION': REDIS_URL,
     }
 }
 
-CELERY_BROKER_URL = 'redis://redis:6379/0'
+CELERY_BROKER_URL = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', 50))
+
+CHATBOT_VECTOR_DIR = os.getenv('CHATBOT_VECTOR_DIR', str(BASE_DIR / 'var' / 'chatbot_vectors'))
+# Hash buckets per vector. Fewer buckets mean more terms colliding, the matrix takes rows * dim * 4 bytes
+CHATBOT_VECTOR_DIM = int(os.getenv('CHATBOT_VECTOR_DIM', 4096))
+
+NOTIFICATION_READ_RETENTION_DAYS = int(os.getenv('NOTIFICATION_READ_RETENTION_DAYS', 30))
+NOTIFICATION_UNREAD_RETENTION_DAYS = int(os.getenv('NOTIFICATION_UNREAD_RETENTION_DAYS', 180))
+
+CELERY_BEAT_SCHEDULE = {
+    'reconcile-course-ratings': {
+        'task': 'courses.tasks.reconcile_course_ratings',
+        'schedule': timedelta(hours=6),
+    },
+    'reconcile-tutor-ratings': {
+        'task': 'tutor.tasks.reconcile_tutor_ratings',
+        'schedule': timedelta(hours=6),
+    },
+    'purge-old-notifications': {
+        'task': 'users.tasks.purge_old_notifications',
+        'schedule': timedelta(days=1),
+    },
+    'sweep-presence': {
+        'task': 'users.tasks.sweep_presence',
+        'schedule': timedelta(seconds=30),
+    },
+    'persist-chat-messages': {
+        'task': 'courses.tasks.persist_chat_messages',
+        'schedule': timedelta(seconds=30),
+    },
+    'persist-community-messages': {
+        'task': 'community.tasks.sync_messages_to_db',
+        'schedule': timedelta(seconds=10),
+    },
+    'refresh-chatbot-vectors': {
+        'task': 'chatbot.tasks.refresh_chatbot_vectors',
+        'schedule': timedelta(minutes=1),
+    },
+    'rebuild-chatbot-vectors': {
+        'task': 'chatbot.tasks.rebuild_chatbot_vectors',
+        'schedule': timedelta(days=1),
+    },
+    'rebuild-recent-earnings-rollups': {
+        'task': 'wallet.tasks.rebuild_recent_earnings_rollups',
+        'schedule': timedelta(hours=1),
+    },
+}
+
 
 
 # Database
@@ -266,6 +318,22 @@ STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')
 
 GEMINI_API_KEY=os.getenv('GEMINI_API_KEY')
 
+CHATBOT_BACKEND = os.getenv('CHATBOT_BACKEND', 'chatbot.services.GeminiBackend')
+CHATBOT_MODEL = os.getenv('CHATBOT_MODEL', 'gemini-1.5-flash')
+CHATBOT_FAKE_DELAY = float(os.getenv('CHATBOT_FAKE_DELAY', 0))
+CHATBOT_FAKE_TOKEN_DELAY = float(os.getenv('CHATBOT_FAKE_TOKEN_DELAY', 0))
+CHATBOT_RESPONSE_CACHE_TTL = int(os.getenv('CHATBOT_RESPONSE_CACHE_TTL', 60 * 60))
+CHATBOT_GENERATION_TIMEOUT = int(os.getenv('CHATBOT_GENERATION_TIMEOUT', 60))
+# Seconds a failed generation is remembered, so requests coalesced behind it fail fast instead of retrying in turn
+CHATBOT_FAILURE_CACHE_TTL = int(os.getenv('CHATBOT_FAILURE_CACHE_TTL', 10))
+# Per process: generations running at once, requests allowed to wait for a slot and for how long
+CHATBOT_MAX_CONCURRENCY = int(os.getenv('CHATBOT_MAX_CONCURRENCY', 4))
+CHATBOT_MAX_QUEUE = int(os.getenv('CHATBOT_MAX_QUEUE', 16))
+CHATBOT_QUEUE_TIMEOUT = float(os.getenv('CHATBOT_QUEUE_TIMEOUT', 10))
+# Per client (IP address): chatbot requests allowed per window of seconds
+CHATBOT_RATE_LIMIT = int(os.getenv('CHATBOT_RATE_LIMIT', 10))
+CHATBOT_RATE_WINDOW = int(os.getenv('CHATBOT_RATE_WINDOW', 60))
+
 AUTH_USER_MODEL = 'users.User'
 
 
@@ -12,6 +12,7 @@ from datetime import timedelta
 from courses.models import Course
 from tutor.models import TutorProfile
 from .serializers import TopRatedTutorsSerializer, TopRatedCoursesSerializer
+from base.response_cache import cache_public_response
 
 
 # Create your views here.
@@ -55,6 +56,7 @@ class StudentDashboardSummaryAPIView(APIView):
 class TopRatedCoursesAPIView(APIView):
     permission_classes = [AllowAny]
 
+    @cache_public_response("top_rated_courses", tags=["courses"], anonymous_only=False)
     def get(self, request):
         try:
             top_courses = Course.objects.all().order_by('-rating')[:3]  # Order by highest-rated courses
@@ -66,6 +68,7 @@ class TopRatedCoursesAPIView(APIView):
 class TopRatedTutorsAPIView(APIView):
     permission_classes = [AllowAny]
 
+    @cache_public_response("top_rated_tutors", tags=["tutors"], anonymous_only=False)
     def get(self, request):
         try:
             top_tutors = TutorProfile.objects.all().order_by('-rating')[:3]  # Order by highest-rated tutors
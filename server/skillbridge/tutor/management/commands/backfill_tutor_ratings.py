@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from tutor.tasks import reconcile_tutor_ratings
+
+
+class Command(BaseCommand):
+    help = 'Fill TutorProfile rating_sum, rating_count and rating from the tutor reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        result = reconcile_tutor_ratings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Backfilled ratings of {result["drifted"]} tutor(s).'))
@@ -1,8 +1,14 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.db.models import Value
+from base.search import weighted_vector
+from base.base_models import TrackedFieldsMixin
+from base.expressions import running_average
 import cloudinary
 import cloudinary.uploader
 import cloudinary.models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 
 User = get_user_model()
 
@@ -14,14 +20,42 @@ class TutorProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="tutor_profile")
     resume_url = cloudinary.models.CloudinaryField(resource_type='raw', blank=True, null=True)
     rating = models.FloatField(default=0.0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
     is_verified = models.BooleanField(default=False)
     cur_job_role = models.CharField(max_length=200, default="Not Specified")
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='tutor_search_vector_idx'),
+            GinIndex(fields=['cur_job_role'], name='tutor_job_role_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
+
+    def build_search_vector(self):
+        # The name lives on User, so the vector is built from values rather than column references
+        return weighted_vector((Value(self.user.get_full_name()), 'A'), (Value(self.cur_job_role or ''), 'B'))
+
+    @classmethod
+    def apply_rating_delta(cls, tutor_id, count_delta, sum_delta):
+        """Shifts the running sum/count and the average in one UPDATE, no aggregate over the reviews"""
+        if not count_delta and not sum_delta:
+            return
+        cls.objects.filter(pk=tutor_id).update(
+            rating_sum=models.F('rating_sum') + sum_delta,
+            rating_count=models.F('rating_count') + count_delta,
+            rating=running_average('rating_sum', 'rating_count', sum_delta, count_delta),
+        )
 
     def update_rating(self):
-        reviews = self.reviews.all() 
-        avg_rating = reviews.aggregate(models.Avg('rating'))['rating__avg']
-        self.rating = avg_rating if avg_rating else 0
-        self.save()
+        """Full recount, used by the reconciliation task"""
+        totals = self.reviews.aggregate(total=models.Sum('rating'), count=models.Count('id'))
+        self.rating_sum = totals['total'] or 0
+        self.rating_count = totals['count']
+        self.rating = self.rating_sum / self.rating_count if self.rating_count else 0
+        TutorProfile.objects.filter(pk=self.pk).update(
+            rating=self.rating, rating_sum=self.rating_sum, rating_count=self.rating_count
+        )
 
     def __str__(self):
         return self.user.email
@@ -45,7 +79,9 @@ class TutorWorkExperience(models.Model):
     def __str__(self):
         return f"{self.job_role} at {self.company}"
     
-class TutorReview(models.Model):
+class TutorReview(TrackedFieldsMixin, models.Model):
+    tracked_fields = ("tutor_id", "rating")
+
     tutor = models.ForeignKey(TutorProfile, on_delete=models.CASCADE, related_name="reviews")
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="tutor_reviews")
     rating = models.PositiveIntegerField()
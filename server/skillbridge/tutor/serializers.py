@@ -108,8 +108,5 @@ class TutorReviewSerializer(serializers.ModelSerializer):
         read_only_fields = ['user', 'tutor', 'created_at']
 
     def create(self, validated_data):
-        review = TutorReview.objects.create(**validated_data)
-        tutor = validated_data['tutor']
-        tutor.update_rating()
-
-        return review
\ No newline at end of file
+        # The running rating is updated by the post_save handler in tutor/signals.py
+        return TutorReview.objects.create(**validated_data)
\ No newline at end of file
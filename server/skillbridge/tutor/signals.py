@@ -0,0 +1,48 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.contrib.auth import get_user_model
+from base.search import refresh_search_vector
+from base.response_cache import invalidate_tags
+from .models import TutorProfile, TutorReview
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=TutorProfile)
+def refresh_tutor_search_vector(sender, instance, **kwargs):
+    refresh_search_vector(TutorProfile, instance.pk, instance.build_search_vector())
+
+
+@receiver(post_save, sender=User)
+def refresh_tutor_name_in_search_vector(sender, instance, created, update_fields=None, **kwargs):
+    """Tutor names live on User, so renaming a tutor has to refresh the profile's vector too"""
+    if created or instance.role != "tutor":
+        return
+    if update_fields and not {"first_name", "last_name"} & set(update_fields):
+        return
+    tutor_profile = TutorProfile.objects.filter(user=instance).first()
+    if tutor_profile:
+        tutor_profile.user = instance
+        refresh_search_vector(TutorProfile, tutor_profile.pk, tutor_profile.build_search_vector())
+
+
+@receiver(post_save, sender=TutorReview)
+def tutor_review_saved(sender, instance, created, **kwargs):
+    if created:
+        TutorProfile.apply_rating_delta(instance.tutor_id, 1, instance.rating)
+    elif not instance.has_loaded_value("rating"):
+        instance.tutor.update_rating()
+    else:
+        TutorProfile.apply_rating_delta(instance.tutor_id, 0, instance.rating - instance.get_loaded_value("rating"))
+    instance.snapshot_tracked_fields()
+
+
+@receiver(post_delete, sender=TutorReview)
+def tutor_review_deleted(sender, instance, **kwargs):
+    TutorProfile.apply_rating_delta(instance.tutor_id, -1, -instance.rating)
+
+
+@receiver([post_save, post_delete], sender=TutorProfile)
+@receiver([post_save, post_delete], sender=TutorReview)
+def invalidate_tutor_responses(sender, **kwargs):
+    invalidate_tags("tutors")
@@ -0,0 +1,39 @@
+import logging
+from celery import shared_task
+from django.db.models import Count, OuterRef, Subquery, Sum, Value, IntegerField
+from django.db.models.functions import Coalesce
+from .models import TutorProfile, TutorReview
+
+logger = logging.getLogger(__name__)
+
+
+def _review_aggregate(aggregate):
+    subquery = (
+        TutorReview.objects.filter(tutor=OuterRef("pk")).order_by().values("tutor")
+        .annotate(value=aggregate).values("value")[:1]
+    )
+    return Coalesce(Subquery(subquery, output_field=IntegerField()), Value(0))
+
+
+@shared_task
+def reconcile_tutor_ratings(batch_size=500):
+    """Recomputes the running rating of every tutor in bulk and fixes the rows that drifted"""
+    tutors = TutorProfile.objects.annotate(
+        live_rating_sum=_review_aggregate(Sum("rating")),
+        live_rating_count=_review_aggregate(Count("pk")),
+    ).only("id", "rating", "rating_sum", "rating_count").order_by("pk")
+
+    drifted = []
+    for tutor in tutors.iterator(chunk_size=batch_size):
+        live_rating = tutor.live_rating_sum / tutor.live_rating_count if tutor.live_rating_count else 0.0
+        if (tutor.rating_sum, tutor.rating_count) != (tutor.live_rating_sum, tutor.live_rating_count) or abs(tutor.rating - live_rating) > 1e-9:
+            tutor.rating_sum = tutor.live_rating_sum
+            tutor.rating_count = tutor.live_rating_count
+            tutor.rating = live_rating
+            drifted.append(tutor)
+
+    if drifted:
+        logger.warning(f"Tutor rating drift detected on {len(drifted)} tutor(s): {[tutor.id for tutor in drifted[:20]]}")
+        TutorProfile.objects.bulk_update(drifted, ["rating", "rating_sum", "rating_count"], batch_size=batch_size)
+
+    return {"drifted": len(drifted)}
@@ -1,3 +1,81 @@
+from io import StringIO
+from django.core.management import call_command
 from django.test import TestCase
+from rest_framework.test import APIClient
+from base.testing import isolated_services, make_user
+from courses.models import Course, Purchase
+from wallet.models import Transaction, Wallet
+from .models import TutorProfile, TutorReview
+from .views import PurchaseDetailsView
 
-# Create your tests here.
+
+@isolated_services
+class TutorRatingTests(TestCase):
+
+    def setUp(self):
+        self.tutor = TutorProfile.objects.create(user=make_user("tutor@example.com", role="tutor"))
+
+    def review(self, email, rating):
+        return TutorReview.objects.create(tutor=self.tutor, user=make_user(email), rating=rating, review="Good")
+
+    def test_reviews_keep_the_running_rating(self):
+        first = self.review("first@example.com", 5)
+        self.review("second@example.com", 2)
+        first.rating = 3
+        first.save()
+        self.tutor.refresh_from_db()
+        self.assertEqual((self.tutor.rating_sum, self.tutor.rating_count, self.tutor.rating), (5, 2, 2.5))
+
+    def test_backfill_fills_counters_of_existing_reviews(self):
+        self.review("first@example.com", 5)
+        self.review("second@example.com", 4)
+        # Profiles from before the running counters existed: average set, counters at their defaults
+        TutorProfile.objects.filter(pk=self.tutor.pk).update(rating=4.5, rating_sum=0, rating_count=0)
+
+        call_command("backfill_tutor_ratings", stdout=StringIO())
+        self.tutor.refresh_from_db()
+        self.assertEqual((self.tutor.rating_sum, self.tutor.rating_count, self.tutor.rating), (9, 2, 4.5))
+
+        self.review("third@example.com", 1)
+        self.tutor.refresh_from_db()
+        self.assertEqual((self.tutor.rating_sum, self.tutor.rating_count), (10, 3))
+        self.assertAlmostEqual(self.tutor.rating, 10 / 3)
+
+
+
+
+@isolated_services
+class PurchaseDetailsQueryTests(TestCase):
+    """Wallet check, tutor profile and one query for the purchases, however many rows are returned"""
+
+    def setUp(self):
+        self.tutor = TutorProfile.objects.create(user=make_user("tutor@example.com", role="tutor"))
+        wallet = Wallet.objects.create(user=self.tutor.user)
+        course = Course.objects.create(tutor=self.tutor, title="Django for beginners", status="Approved", price=100)
+        for n in range(12):
+            purchase = Purchase.objects.create(user=make_user(f"student{n}@example.com"), course=course, status="completed")
+            Transaction.objects.create(wallet=wallet, purchase=purchase, amount=80, transaction_type="credit")
+        self.client = APIClient()
+        self.client.force_authenticate(self.tutor.user)
+
+    def get(self, params):
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/tutor/purchase-details/", params)
+            content = b"".join(response.streaming_content) if response.streaming else response.content
+        self.assertEqual(response.status_code, 200)
+        return response, content
+
+    def test_query_count_is_constant_across_page_sizes(self):
+        for page_size in (2, 10):
+            with self.subTest(page_size=page_size):
+                response, _ = self.get({"pagination": "cursor", "page_size": page_size})
+                self.assertEqual(len(response.json()["results"]), page_size)
+                self.assertEqual(response.json()["results"][0]["credited_amount"], 80.0)
+        response, _ = self.get({})
+        self.assertEqual(len(response.json()["purchases"]), 12)
+
+    def test_csv_export_streams_in_one_query(self):
+        _, content = self.get({"export": "csv"})
+        rows = content.decode().strip().splitlines()
+        self.assertEqual(rows[0], ",".join(PurchaseDetailsView.csv_columns))
+        self.assertEqual(len(rows), 13)
@@ -10,7 +10,12 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from courses.models import Course, Purchase
 from wallet.models import Wallet, Transaction
-from django.db.models import Sum, Count, Q
+from wallet.earnings import earnings_chart
+from django.db.models import Sum, Count, Q, OuterRef, Subquery, Value, DecimalField
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from base.custom_pagination import OptionalKeysetPagination
+import csv
 from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, TruncYear, TruncHour
 from datetime import timedelta
 from django.utils import timezone
@@ -112,103 +117,8 @@ class EarningsOverviewView(APIView):
             return Response({"error": "Wallet not found"}, status=400)
         
         try:
-            # Get credit transactions for this wallet
-            transactions = Transaction.objects.filter(wallet=wallet, transaction_type="credit")
-            
-            # Get the current date
-            today = timezone.now()
-            
-            # Filter transactions based on timeframe
-            if timeframe == "day":
-                # Last 24 hours data divided by 6 periods
-                start_date = today - timezone.timedelta(days=1)
-                transactions = transactions.filter(created_at__gte=start_date)
-                
-                # Create empty chart data structure
-                chart_data = [
-                    {"name": "12AM", "earnings": 0.0},
-                    {"name": "4AM", "earnings": 0.0},
-                    {"name": "8AM", "earnings": 0.0},
-                    {"name": "12PM", "earnings": 0.0},
-                    {"name": "4PM", "earnings": 0.0},
-                    {"name": "8PM", "earnings": 0.0}
-                ]
-                
-                # Process each transaction individually to ensure correct time assignment
-                for transaction in transactions:
-                    hour = transaction.created_at.hour
-                    amount = float(transaction.amount)
-                    
-                    # Assign to the correct time period
-                    if 0 <= hour < 4:
-                        chart_data[0]["earnings"] += amount
-                    elif 4 <= hour < 8:
-                        chart_data[1]["earnings"] += amount
-                    elif 8 <= hour < 12:
-                        chart_data[2]["earnings"] += amount
-                    elif 12 <= hour < 16:
-                        chart_data[3]["earnings"] += amount
-                    elif 16 <= hour < 20:
-                        chart_data[4]["earnings"] += amount
-                    else:  # 20 <= hour < 24
-                        chart_data[5]["earnings"] += amount
-                    
-                    
-                    
-            elif timeframe == "week":
-                # Last 7 days
-                start_date = today - timezone.timedelta(days=6)
-                transactions = transactions.filter(created_at__gte=start_date)
-                
-                chart_data = [
-                    {"name": "Mon", "earnings": 0.0},
-                    {"name": "Tue", "earnings": 0.0},
-                    {"name": "Wed", "earnings": 0.0},
-                    {"name": "Thu", "earnings": 0.0},
-                    {"name": "Fri", "earnings": 0.0},
-                    {"name": "Sat", "earnings": 0.0},
-                    {"name": "Sun", "earnings": 0.0}
-                ]
-                
-                for transaction in transactions:
-                    # Get the day of week (0 = Monday, 6 = Sunday)
-                    day_idx = transaction.created_at.weekday()
-                    chart_data[day_idx]["earnings"] += float(transaction.amount)
-                    
-            elif timeframe == "month":
-                # Last 4 weeks
-                start_date = today - timezone.timedelta(weeks=4)
-                transactions = transactions.filter(created_at__gte=start_date)
-                
-                chart_data = [
-                    {"name": "Week 1", "earnings": 0.0},
-                    {"name": "Week 2", "earnings": 0.0},
-                    {"name": "Week 3", "earnings": 0.0},
-                    {"name": "Week 4", "earnings": 0.0}
-                ]
-                
-                for transaction in transactions:
-                    # Calculate which week this transaction belongs to
-                    days_ago = (today - transaction.created_at).days
-                    week_idx = min(3, days_ago // 7)
-                    chart_data[week_idx]["earnings"] += float(transaction.amount)
-                    
-            elif timeframe == "year":
-                # Last 12 months
-                start_date = (today - timezone.timedelta(days=365)).replace(day=1)
-                transactions = transactions.filter(created_at__gte=start_date)
-                
-                months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", 
-                        "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
-                
-                chart_data = [{"name": month, "earnings": 0.0} for month in months]
-                
-                for transaction in transactions:
-                    # Get the month index (0 = Jan, 11 = Dec)
-                    month_idx = transaction.created_at.month - 1
-                    chart_data[month_idx]["earnings"] += float(transaction.amount)
-                    
-            else:
+            chart_data = earnings_chart(timeframe, {"earnings": wallet.id})
+            if chart_data is None:
                 return Response({"error": "Invalid timeframe"}, status=400)
 
             return Response({"chart_data": chart_data})
@@ -217,8 +127,67 @@ class EarningsOverviewView(APIView):
             return Response({"error": "An unexpected error occurred", "details": str(e)}, status=500)
     
 
+"""Pseudo buffer for csv.writer, hands each written row back so it can be streamed"""
+class Echo:
+    def write(self, value):
+        return value
+
+
+"""
+Purchases of the tutor's courses (all purchases for admins) with the amount credited to the request user's wallet.
+The credited amount comes from a subquery, so the whole listing is a single query. Returns a plain list by default,
+keyset pages with ?pagination=cursor, and streams a CSV file with ?export=csv
+"""
 class PurchaseDetailsView(APIView):
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('-created_at', '-id')
+    csv_columns = ["course_name", "user_name", "purchase_date", "purchase_type", "course_price", "credited_amount", "opposite_share"]
+
+    def get_purchases(self, user, start_date):
+        # Get purchases where the request user is the tutor
+        purchases_queryset = Purchase.objects.filter(created_at__gte=start_date)
+        if not user.is_superuser:
+            tutor_profile = TutorProfile.objects.get(user=user)
+            purchases_queryset = purchases_queryset.filter(course__tutor=tutor_profile)
+
+        credited = Transaction.objects.filter(
+            purchase=OuterRef('pk'),
+            transaction_type="credit",
+            wallet__user=user  # Filters transactions for the user's wallet
+        ).values('purchase').annotate(total=Sum('amount')).values('total')
+
+        return purchases_queryset.annotate(
+            credited_amount=Coalesce(Subquery(credited), Value(Decimal("0.00")), output_field=DecimalField(max_digits=10, decimal_places=2))
+        ).values(
+            'id', 'created_at', 'purchase_type', 'credited_amount',
+            'course__title', 'course__price', 'user__first_name', 'user__last_name',
+        ).order_by(*self.keyset_ordering)
+
+    def format_purchase(self, purchase):
+        course_price = float(purchase["course__price"]) if purchase["course__price"] is not None else 0.0
+        credited_amount = purchase["credited_amount"]
+        opposite_share = round(Decimal(course_price) - Decimal(credited_amount), 2)
+        return {
+            "course_name": purchase["course__title"] or "N/A",
+            "user_name": f"{purchase['user__first_name'] or ''} {purchase['user__last_name'] or ''}".strip(),
+            "purchase_date": purchase["created_at"].strftime("%Y-%m-%d %H:%M:%S"),
+            "purchase_type": purchase["purchase_type"],  # "trade" or "payment"
+            "course_price": course_price,
+            "credited_amount": credited_amount,
+            "opposite_share": opposite_share if purchase["purchase_type"] == "Payment" else 0
+        }
+
+    def stream_csv(self, purchases, timeframe):
+        writer = csv.DictWriter(Echo(), fieldnames=self.csv_columns)
+
+        def rows():
+            yield writer.writeheader()
+            for purchase in purchases.iterator(chunk_size=2000):
+                yield writer.writerow(self.format_purchase(purchase))
+
+        response = StreamingHttpResponse(rows(), content_type="text/csv")
+        response["Content-Disposition"] = f'attachment; filename="purchases-{timeframe}.csv"'
+        return response
 
     def get(self, request):
         try:
@@ -241,44 +210,20 @@ class PurchaseDetailsView(APIView):
             else:
                 return Response({"error": "Invalid timeframe"}, status=400)
 
-            # Get purchases where the request user is the tutor
-            if user.is_superuser:
-                purchases_queryset = Purchase.objects.filter(
-                    created_at__gte=start_date,
-                ).select_related('course', 'user')
-            else:
-                tutor_profile = TutorProfile.objects.get(user=user)
-                purchases_queryset = Purchase.objects.filter(
-                    created_at__gte=start_date,
-                    course__tutor=tutor_profile  # Ensures we get purchases where the request user is the tutor
-                ).select_related('course', 'user')
-
-            # Format detailed purchase data
-            purchases = []
-            for purchase in purchases_queryset:
-                course_name = purchase.course.title if purchase.course else "N/A"
-                user_name = purchase.user.get_full_name() if purchase.user else "N/A"
-                course_price = float(purchase.course.price) if purchase.course else 0.0
-                user_wallet = Wallet.objects.get(user=user) 
-                credited_amount = Transaction.objects.filter(
-                    purchase=purchase, 
-                    transaction_type="credit", 
-                    wallet=user_wallet  # Filters transactions for the user's wallet
-                ).aggregate(Sum('amount'))['amount__sum'] or 0.0
-                opposite_share = round(Decimal(course_price) - Decimal(credited_amount), 2)
-
-                purchase_data = {
-                    "course_name": course_name,
-                    "user_name": user_name,
-                    "purchase_date": purchase.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-                    "purchase_type": purchase.purchase_type,  # "trade" or "payment"
-                    "course_price": course_price,
-                    "credited_amount": credited_amount,
-                    "opposite_share":opposite_share if purchase.purchase_type == "Payment" else 0
-                }
-                purchases.append(purchase_data)
-
-            return Response({"purchases": purchases})
+            if not Wallet.objects.filter(user=user).exists():
+                raise Wallet.DoesNotExist
+
+            purchases_queryset = self.get_purchases(user, start_date)
+
+            if request.query_params.get('export') == 'csv':
+                return self.stream_csv(purchases_queryset, timeframe)
+
+            paginator = OptionalKeysetPagination()
+            page = paginator.paginate_queryset(purchases_queryset, request, view=self)
+            if page is not None:
+                return paginator.get_paginated_response([self.format_purchase(purchase) for purchase in page])
+
+            return Response({"purchases": [self.format_purchase(purchase) for purchase in purchases_queryset]})
         
         except TutorProfile.DoesNotExist:
             return Response({"error": "Tutor profile not found"}, status=404)
@@ -287,4 +232,4 @@ class PurchaseDetailsView(APIView):
         except Purchase.DoesNotExist:
             return Response({"error": "Purchase not found"}, status=404)
         except Exception as e:
-            return Response({"error": str(e)}, status=500)
\ No newline at end of file
+            return Response({"error": str(e)}, status=500)
@@ -0,0 +1,94 @@
+import asyncio
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from base import redis_client
+from base.ws_loadtest import SCENARIOS, cleanup, run_scenario, shortfalls
+from courses.chat_pipeline import CHAT_STREAM
+from community.chat_pipeline import COMMUNITY_STREAM
+
+
+class Command(BaseCommand):
+    help = 'Drive the chat and notification consumers with simulated WebSocket clients and report latency and memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', choices=SCENARIOS + ('all',), default='all')
+        parser.add_argument('--clients', type=int, default=1000, help='Simulated sockets per scenario')
+        parser.add_argument('--room-size', type=int, default=50, help='Members per community room')
+        parser.add_argument('--senders', type=int, default=1, help='Members sending in every room')
+        parser.add_argument('--messages', type=int, default=10, help='Messages per sender')
+        parser.add_argument('--concurrency', type=int, default=200, help='Connects in flight at once')
+        parser.add_argument('--timeout', type=float, default=10.0, help='Seconds a socket may stay quiet')
+        parser.add_argument('--redis-url', default='redis://localhost:6379/15', help='Scratch Redis for presence and streams')
+        parser.add_argument('--channel-layer', choices=('memory', 'redis'), default='memory')
+        parser.add_argument('--trace-memory', action='store_true', help='Measure bytes per connection with tracemalloc (slower)')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        if options['redis_url'] == settings.REDIS_URL:
+            raise CommandError('Point --redis-url at a scratch Redis database, the run writes presence keys and stream entries')
+
+        if options['channel_layer'] == 'memory':
+            channel_layers = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer", "CONFIG": {"capacity": 100000}}}
+        else:
+            # Every simulated socket shares this process's inbox, the default capacity of 100 would drop most frames
+            channel_layers = {"default": {"BACKEND": "channels_redis.core.RedisChannelLayer", "CONFIG": {"hosts": [options['redis_url']], "capacity": 100000}}}
+
+        scenarios = SCENARIOS if options['scenario'] == 'all' else (options['scenario'],)
+        overrides = override_settings(
+            REDIS_URL=options['redis_url'],
+            CHANNEL_LAYERS=channel_layers,
+            # Synthetic users and rooms are primed into a local cache, so the consumers never reach the database
+            CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "OPTIONS": {"MAX_ENTRIES": 1000000}}},
+        )
+
+        results = []
+        with overrides:
+            redis_client.reset_pools()
+            from skillbridge.asgi import application
+
+            async def run_all():
+                # One loop for every scenario, the Redis channel layer's locks can't move between loops
+                for scenario in scenarios:
+                    results.append(await run_scenario(
+                        application, scenario, options['clients'],
+                        room_size=options['room_size'], senders=options['senders'], messages=options['messages'],
+                        concurrency=options['concurrency'], timeout=options['timeout'], trace_memory=options['trace_memory'],
+                    ))
+
+            try:
+                asyncio.run(run_all())
+            finally:
+                client = redis_client.get_redis()
+                cleanup(client, options['clients'])
+                client.delete(CHAT_STREAM, COMMUNITY_STREAM)
+                redis_client.reset_pools()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            for result in results:
+                self.write_result(result)
+
+        # A consumer that drops messages would otherwise look like a fast one
+        failures = [f"{result['scenario']}: {problem}" for result in results for problem in shortfalls(result)]
+        if failures:
+            raise CommandError("The run lost traffic, the numbers above don't measure a working system:\n  " + "\n  ".join(failures))
+
+    def write_result(self, result):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{result['scenario']}: {result['clients']} clients in {result['rooms']} room(s)"))
+        self.stdout.write(f"  connected        {result['connected']}/{result['clients']} in {result['connect_seconds']}s")
+        self.stdout.write(f"  connect latency  {self.format_percentiles(result['connect_latency_ms'])}")
+        self.stdout.write(f"  delivered        {result['delivered']}/{result['expected_deliveries']} in {result['fan_out_seconds']}s")
+        self.stdout.write(f"  fan-out latency  {self.format_percentiles(result['fan_out_latency_ms'])}")
+        memory = result['memory']
+        line = f"  memory           max RSS +{memory['max_rss_delta_kb']} KB"
+        if 'traced_bytes_per_connection' in memory:
+            line += f", {memory['traced_bytes_per_connection']} B traced per connection"
+        self.stdout.write(line)
+
+    def format_percentiles(self, stats):
+        if not stats['count']:
+            return "n/a"
+        return f"p50 {stats['p50']}ms  p90 {stats['p90']}ms  p99 {stats['p99']}ms  max {stats['max']}ms"
@@ -0,0 +1,128 @@
+import logging
+import time
+from urllib.parse import parse_qs
+from cachetools import TTLCache
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from rest_framework_simplejwt.tokens import AccessToken
+from base.redis_client import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+
+"""
+WebSocket authentication from the ?token= query param. The token is validated once per handshake and the user
+is resolved from slim records cached in process for a few seconds and in Redis for a few minutes, so a reconnect
+storm after a deploy doesn't turn into one users query per socket. User saves drop the Redis copy and log the user
+in a Redis sorted set, which every process reads at most once a second to drop its own copy, so a blocked user
+can't open sockets on another worker until the local entry expires.
+"""
+
+SLIM_USER_FIELDS = ("id", "first_name", "last_name", "email", "role", "is_active", "is_staff", "is_superuser", "profile_pic_url")
+SLIM_USER_CACHE_TIMEOUT = 60 * 5
+LOCAL_USER_CACHE_TTL = 30
+INVALIDATIONS_KEY = "ws_slim_user_invalidations"
+# Longer than the local TTL, so a process that hasn't synced for longer only holds expired entries
+INVALIDATION_RETENTION = LOCAL_USER_CACHE_TTL * 2
+LOCAL_SYNC_INTERVAL = 1
+# Re-reads a few seconds of the log on every sync, dropping an entry twice is harmless
+SYNC_OVERLAP = 5
+
+_local_users = TTLCache(maxsize=10000, ttl=LOCAL_USER_CACHE_TTL)
+_local_synced_at = 0.0
+
+
+def slim_user_cache_key(user_id):
+    return f"ws_slim_user_{user_id}"
+
+
+def invalidate_slim_user(user_id):
+    _local_users.pop(user_id, None)
+    cache.delete(slim_user_cache_key(user_id))
+    now = time.time()
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        pipeline.zadd(INVALIDATIONS_KEY, {user_id: now})
+        pipeline.zremrangebyscore(INVALIDATIONS_KEY, "-inf", now - INVALIDATION_RETENTION)
+        pipeline.execute()
+    except Exception as e:
+        logger.warning(f"Failed to log the slim user invalidation of {user_id}: {e}")
+
+
+async def _sync_local_users():
+    """Drops the local copies of the users saved by any process since the last sync"""
+    global _local_synced_at
+    started = time.time()
+    if started - _local_synced_at < LOCAL_SYNC_INTERVAL:
+        return
+    try:
+        user_ids = await get_async_redis().zrangebyscore(INVALIDATIONS_KEY, _local_synced_at - SYNC_OVERLAP, "+inf")
+    except Exception as e:
+        # Without the log there is no telling which copies are stale
+        logger.warning(f"Slim user invalidation sync failed: {e}")
+        _local_users.clear()
+        return
+    for user_id in user_ids:
+        _local_users.pop(int(user_id), None)
+    _local_synced_at = started
+
+
+def _build_user(record):
+    """Unsaved User instance carrying only the fields the consumers read"""
+    values = dict(record)
+    values["profile_pic_url"] = User._meta.get_field("profile_pic_url").to_python(values["profile_pic_url"])
+    return User(**values)
+
+
+def _load_slim_user(user_id):
+    record = User.objects.filter(id=user_id).values(*SLIM_USER_FIELDS).first()
+    if record is None:
+        return None
+    record["profile_pic_url"] = User._meta.get_field("profile_pic_url").get_prep_value(record["profile_pic_url"])
+    return record
+
+
+async def get_slim_user(user_id):
+    await _sync_local_users()
+    record = _local_users.get(user_id)
+    if record is None:
+        key = slim_user_cache_key(user_id)
+        record = await cache.aget(key)
+        if record is None:
+            record = await database_sync_to_async(_load_slim_user)(user_id)
+            if record is None:
+                return None
+            await cache.aset(key, record, SLIM_USER_CACHE_TIMEOUT)
+        _local_users[user_id] = record
+    return _build_user(record)
+
+
+async def get_user_from_token(token):
+    try:
+        access_token = AccessToken(token)
+    except Exception:
+        return AnonymousUser()
+
+    user = await get_slim_user(access_token["user_id"])
+    if user is None or not user.is_active:
+        return AnonymousUser()
+    return user
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """Sets scope["user"] from ?token=, leaving a session authenticated user alone when there is no token"""
+
+    async def __call__(self, scope, receive, send):
+        token = parse_qs(scope.get("query_string", b"").decode()).get("token")
+        if token:
+            scope = dict(scope, user=await get_user_from_token(token[0]))
+        return await super().__call__(scope, receive, send)
+
+
+def JWTAuthMiddlewareStack(inner):
+    return AuthMiddlewareStack(JWTAuthMiddleware(inner))
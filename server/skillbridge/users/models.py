@@ -1,9 +1,11 @@
 from django.contrib.auth.models import AbstractBaseUser,BaseUserManager,PermissionsMixin
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.utils import timezone
 import cloudinary
 import cloudinary.uploader
 import cloudinary.models
+from django.contrib.postgres.indexes import GinIndex
 
 
 # Create your models here.
@@ -65,6 +67,12 @@ class User(AbstractBaseUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=['first_name'], name='user_first_name_trgm_idx', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['last_name'], name='user_last_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
+
     def __str__(self):
         return self.email
     
@@ -99,7 +107,23 @@ class Notification(models.Model):
     notification_type = models.CharField(max_length=20, choices=NOTIFICATION_TYPES)
     message = models.TextField()
     is_read = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True)  # Never bumped, lists are keyset paged on it
+    last_activity_at = models.DateTimeField(default=timezone.now)  # Time of the latest event the row stands for
+    thread_key = models.CharField(max_length=100, null=True, blank=True)  # Unread notifications of one thread collapse into a single row
+    count = models.PositiveIntegerField(default=1)  # How many events the row stands for
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'thread_key'],
+                condition=models.Q(is_read=False, thread_key__isnull=False),
+                name='unique_unread_notification_thread',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'is_read'], name='notification_user_read_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='notification_keyset_idx'),
+        ]
     
     def __str__(self):
         
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+from collections import Counter
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+from django.utils import timezone
+from base.redis_client import get_redis
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+
+"""
+Single entry point for creating notifications. Repeated notifications of one thread (e.g. every message of a chat)
+collapse into the thread's unread row, which gets its count bumped and its text and last_activity_at refreshed, so
+chat traffic no longer adds a row per message. created_at stays the time the row was opened, so collapsing never
+moves a row under an open keyset cursor. Unread counts are kept per user in Redis; a missing counter is rebuilt
+from the table on the next read, so counters are only adjusted when they exist.
+"""
+
+UNREAD_COUNT_TIMEOUT = 60 * 60 * 24
+
+# INCRBY that leaves a missing counter missing and never goes below zero
+ADJUST_UNREAD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+local value = redis.call('INCRBY', KEYS[1], ARGV[1])
+if value < 0 then
+    redis.call('SET', KEYS[1], 0)
+    value = 0
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return value
+"""
+
+
+def unread_count_key(user_id):
+    return f"notifications_unread_{user_id}"
+
+
+def adjust_unread_counts(deltas):
+    """Applies {user_id: delta} to the counters that exist"""
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    client = get_redis()
+    script = client.register_script(ADJUST_UNREAD_SCRIPT)
+    pipeline = client.pipeline(transaction=False)
+    for user_id, delta in deltas.items():
+        script(keys=[unread_count_key(user_id)], args=[delta, UNREAD_COUNT_TIMEOUT], client=pipeline)
+    pipeline.execute()
+
+
+def forget_unread_counts(user_ids):
+    if user_ids:
+        get_redis().delete(*[unread_count_key(user_id) for user_id in user_ids])
+
+
+def get_unread_count(user_id):
+    client = get_redis()
+    cached = client.get(unread_count_key(user_id))
+    if cached is not None:
+        return int(cached)
+    count = Notification.objects.filter(user_id=user_id, is_read=False).count()
+    # NX so a counter another request just adjusted isn't overwritten with an older count
+    client.set(unread_count_key(user_id), count, ex=UNREAD_COUNT_TIMEOUT, nx=True)
+    return count
+
+
+def _collapse_into(notification, count, message, now):
+    notification.count += count
+    notification.message = message
+    notification.last_activity_at = now
+
+
+def _open_thread(notification, now):
+    """
+    Inserts a thread row a concurrent writer may have opened since the unread rows were locked. On conflict the
+    existing row absorbs the events instead. Returns the row and whether it was inserted
+    """
+    lookup = {"user_id": notification.user_id, "thread_key": notification.thread_key, "is_read": False}
+    while True:
+        try:
+            with transaction.atomic():
+                notification.save(force_insert=True)
+            return notification, True
+        except IntegrityError:
+            existing = Notification.objects.select_for_update().filter(**lookup).first()
+            if existing is not None:
+                _collapse_into(existing, notification.count, notification.message, now)
+                existing.save(update_fields=["count", "message", "last_activity_at"])
+                return existing, False
+            # The conflicting row was marked read in the meantime, the thread can be opened again
+
+
+def notify_many(notification_type, items):
+    """
+    Creates notifications from (user_id, message, thread_key) items, thread_key may be None.
+    Returns the new and the collapsed rows, one per user and thread
+    """
+    now = timezone.now()
+    threaded = Counter()
+    latest_message = {}
+    standalone = []
+    for user_id, message, thread_key in items:
+        if thread_key is None:
+            standalone.append(Notification(
+                user_id=user_id, notification_type=notification_type, message=message, last_activity_at=now,
+            ))
+        else:
+            threaded[(user_id, thread_key)] += 1
+            latest_message[(user_id, thread_key)] = message
+
+    with transaction.atomic():
+        collapsed = []
+        if threaded:
+            unread = Notification.objects.select_for_update().filter(
+                is_read=False,
+                user_id__in={user_id for user_id, _ in threaded},
+                thread_key__in={thread_key for _, thread_key in threaded},
+            )
+            for notification in unread:
+                key = (notification.user_id, notification.thread_key)
+                if key in threaded:
+                    _collapse_into(notification, threaded.pop(key), latest_message[key], now)
+                    collapsed.append(notification)
+            Notification.objects.bulk_update(collapsed, ["count", "message", "last_activity_at"])
+
+        created = Notification.objects.bulk_create(standalone)
+        threads = [
+            Notification(
+                user_id=user_id, notification_type=notification_type, thread_key=thread_key,
+                message=latest_message[(user_id, thread_key)], count=count, last_activity_at=now,
+            )
+            for (user_id, thread_key), count in threaded.items()
+        ]
+        try:
+            with transaction.atomic():
+                created += Notification.objects.bulk_create(threads)
+        except IntegrityError:
+            # A concurrent writer opened one of the threads, settle them one at a time
+            for notification in threads:
+                notification.pk = None
+                notification, inserted = _open_thread(notification, now)
+                (created if inserted else collapsed).append(notification)
+
+        new_rows = Counter(notification.user_id for notification in created)
+        transaction.on_commit(lambda: adjust_unread_counts(new_rows))
+    return collapsed + created
+
+
+def notify(user_id, notification_type, message, thread_key=None, push=True):
+    notifications = notify_many(notification_type, [(user_id, message, thread_key)])
+    if push:
+        push_notifications(notifications)
+    return notifications[0] if notifications else None
+
+
+async def _send_notifications(notifications):
+    channel_layer = get_channel_layer()
+    results = await asyncio.gather(*(
+        channel_layer.group_send(
+            f"notifications_{notification.user_id}",
+            {
+                "type": "send.notification",
+                "message": notification.message,
+                "notification_type": notification.notification_type
+            }
+        )
+        for notification in notifications
+    ), return_exceptions=True)
+    return sum(1 for result in results if isinstance(result, Exception))
+
+
+def push_notifications(notifications):
+    """Pushes notifications to the users' sockets concurrently, returns how many sends failed"""
+    if not notifications:
+        return 0
+    failed = async_to_sync(_send_notifications)(notifications)
+    if failed:
+        logger.error(f"Failed to push {failed} of {len(notifications)} notification(s)")
+    return failed
+
+
+def purge_notifications(read_before, unread_before, batch_size=5000):
+    """Deletes read notifications older than read_before and unread ones older than unread_before"""
+    deleted = 0
+    for is_read, cutoff in ((True, read_before), (False, unread_before)):
+        while True:
+            # An unread thread row that is still collecting events is kept however old the row itself is
+            ids = list(
+                Notification.objects.filter(is_read=is_read, last_activity_at__lt=cutoff)
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            if not is_read:
+                affected = (
+                    Notification.objects.filter(id__in=ids)
+                    .values("user_id").annotate(rows=Count("id")).values_list("user_id", "rows")
+                )
+                adjust_unread_counts({user_id: -rows for user_id, rows in affected})
+            deleted += Notification.objects.filter(id__in=ids).delete()[0]
+    return deleted
@@ -186,7 +186,7 @@ class SkillSerializer(serializers.ModelSerializer):
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
-        fields = ['id', 'user', "notification_type", "message", "is_read", "created_at"]
+        fields = ['id', 'user', "notification_type", "message", "is_read", "created_at", "last_activity_at", "count"]
 
 
 class UserActivitySerializer(serializers.ModelSerializer):
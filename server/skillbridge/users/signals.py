@@ -0,0 +1,35 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from base.response_cache import invalidate_tags
+from .models import User
+from .middleware import invalidate_slim_user
+
+
+# User fields that show up in cached payloads, on the top rated tutors and in the tutor of every course
+TUTOR_DISPLAY_FIELDS = {"first_name", "last_name", "city", "profile_pic_url", "role", "is_active"}
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_responses(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields and "role" in update_fields):
+        # The global summary counts users by role
+        invalidate_tags("users")
+    if created or instance.role != "tutor":
+        return
+    if update_fields and not TUTOR_DISPLAY_FIELDS & set(update_fields):
+        # e.g. the last_login update on every login
+        return
+    invalidate_tags("tutors", "courses")
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_websocket_user(sender, instance, **kwargs):
+    # After commit, or another process could cache the old row again before the save lands
+    user_id = instance.id
+    transaction.on_commit(lambda: invalidate_slim_user(user_id))
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user_responses(sender, instance, **kwargs):
+    invalidate_tags("users", "tutors")
@@ -4,6 +4,9 @@ from django.core.cache import cache
 from django.core.mail import send_mail
 from django.conf import settings
 from celery import shared_task
+from base.presence import sweep_expired_presence
+from django.utils import timezone
+from .notifications import purge_notifications
 
 logger = logging.getLogger(__name__)
 
@@ -26,3 +29,24 @@ def sent_otp_email(email, subject):
             )
     except Exception as e:
         logger.error(f"Failed to send OTP to {email}: {e}", exc_info=True)
+
+
+@shared_task
+def sweep_presence():
+    """Expires WebSocket connections whose heartbeat stopped, e.g. after a daphne worker crashed"""
+    gone_offline = sweep_expired_presence()
+    if gone_offline:
+        logger.info(f"Presence sweep took {gone_offline} user(s) offline")
+    return gone_offline
+
+
+@shared_task
+def purge_old_notifications():
+    """Retention for the notifications table, read rows are kept for a shorter window than unread ones"""
+    now = timezone.now()
+    deleted = purge_notifications(
+        read_before=now - timezone.timedelta(days=settings.NOTIFICATION_READ_RETENTION_DAYS),
+        unread_before=now - timezone.timedelta(days=settings.NOTIFICATION_UNREAD_RETENTION_DAYS),
+    )
+    logger.info(f"Purged {deleted} old notification(s)")
+    return deleted
@@ -1,3 +1,106 @@
+import time
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.test import APIClient
+from base.redis_client import get_redis
+from base.testing import isolated_services, make_user
+from . import middleware
+from . import notifications as notifications_module
+from .models import Notification
+from .notifications import get_unread_count, notify, notify_many, unread_count_key
 
-# Create your tests here.
+
+@isolated_services
+class NotifyManyTests(TestCase):
+    """Unread counters live in the Redis of settings.REDIS_URL, see base/testing.py"""
+
+    def setUp(self):
+        self.user = make_user("student@example.com")
+        self.addCleanup(get_redis().delete, unread_count_key(self.user.id))
+
+    def send(self, message, thread_key="chat_1"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return notify(self.user.id, "message", message, thread_key=thread_key, push=False)
+
+    def test_thread_collapses_without_moving(self):
+        first = self.send("Hi")
+        self.assertEqual(get_unread_count(self.user.id), 1)
+
+        second = self.send("Are you there?")
+        self.assertEqual(second.pk, first.pk)
+        second.refresh_from_db()
+        self.assertEqual((second.count, second.message), (2, "Are you there?"))
+        self.assertEqual(second.created_at, first.created_at)
+        self.assertGreater(second.last_activity_at, first.last_activity_at)
+        self.assertEqual(get_unread_count(self.user.id), 1)
+
+    def test_concurrently_opened_thread_absorbs_the_events(self):
+        existing = self.send("Hi")
+        self.assertEqual(get_unread_count(self.user.id), 1)
+
+        # The lock query misses the row, as it does when another writer opens the thread right after it
+        select_for_update = Notification.objects.select_for_update
+        calls = iter([Notification.objects.none()])
+
+        def lock_query():
+            queryset = next(calls, None)
+            return select_for_update() if queryset is None else queryset
+
+        open_thread = mock.patch("users.notifications._open_thread", wraps=notifications_module._open_thread)
+        with mock.patch.object(Notification.objects, "select_for_update", lock_query), open_thread as open_thread:
+            with self.captureOnCommitCallbacks(execute=True):
+                notifications = notify_many("message", [(self.user.id, "One", "chat_1"), (self.user.id, "Two", "chat_1")])
+        open_thread.assert_called_once()
+
+        self.assertEqual([notification.pk for notification in notifications], [existing.pk])
+        existing.refresh_from_db()
+        self.assertEqual((existing.count, existing.message), (3, "Two"))
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(get_unread_count(self.user.id), 1)
+
+    def test_collapsing_does_not_reorder_an_open_cursor(self):
+        for thread in ("chat_1", "chat_2", "chat_3"):
+            self.send(f"Hello from {thread}", thread_key=thread)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        first_page = client.get("/api/notifications/", {"pagination": "cursor", "page_size": 2}).json()
+        self.send("Still there?", thread_key="chat_1")
+        second_page = client.get(first_page["next"]).json()
+
+        seen = [row["message"] for row in first_page["results"] + second_page["results"]]
+        self.assertEqual(seen, ["Hello from chat_3", "Hello from chat_2", "Still there?"])
+
+
+    def test_notifications_cannot_be_written_directly(self):
+        notification = self.send("Hi")
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        self.assertEqual(client.post("/api/notifications/", {"message": "Hi"}).status_code, 405)
+        response = client.patch(f"/api/notifications/{notification.pk}/", {"is_read": True})
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(get_unread_count(self.user.id), 1)
+
+@isolated_services
+class SlimUserCacheTests(TestCase):
+    """The invalidation log lives in the Redis of settings.REDIS_URL, see base/testing.py"""
+
+    def setUp(self):
+        self.user = make_user("student@example.com")
+        middleware._local_users.clear()
+        self.addCleanup(middleware._local_users.clear)
+
+    def test_saves_drop_the_local_copies_of_other_processes(self):
+        # Another process holds the copy it loaded before the save
+        stale = middleware._load_slim_user(self.user.id)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        middleware._local_users[self.user.id] = stale
+        middleware._local_synced_at = time.time() - middleware.LOCAL_SYNC_INTERVAL
+        cache.set(middleware.slim_user_cache_key(self.user.id), middleware._load_slim_user(self.user.id))
+
+        self.assertFalse(async_to_sync(middleware.get_slim_user)(self.user.id).is_active)
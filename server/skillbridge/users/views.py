@@ -25,11 +25,15 @@ from tutor.models import TutorProfile
 from users.models import User, Skill, Notification, UserActivity,Blog,Comment
 from google.auth.transport import requests as google_requests
 from google.oauth2 import id_token
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
+from rest_framework.mixins import DestroyModelMixin
 from rest_framework.decorators import action
-from base.custom_pagination import CustomPagination
+from base.custom_pagination import CustomPagination, OptionalKeysetPagination
 from django.conf import settings
 from base.custom_pagination import BlogPagination
+from base.timeseries import time_series
+from .notifications import adjust_unread_counts, forget_unread_counts, get_unread_count
+from django.db.models import Sum
 
 
 
@@ -256,19 +260,33 @@ class SkillListHandleView(APIView):
 
 
 
-class NotificationViewSet(ModelViewSet):
+class NotificationViewSet(DestroyModelMixin, ReadOnlyModelViewSet):
+    """
+    Notifications are only created through users/notifications.py and only marked read through the actions below,
+    which keep the unread counters and the one unread row per thread constraint in step
+    """
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
     queryset = Notification.objects.all()
+    pagination_class = OptionalKeysetPagination
 
     def get_queryset(self):
         return self.queryset.filter(user=self.request.user).order_by("-created_at")
     
     
+    @action(detail=False, methods=["GET"])
+    def unread_count(self, request):
+        try:
+            return Response({"unread_count": get_unread_count(request.user.id)}, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": "Failed to fetch unread count.", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
     @action(detail=False, methods=["POST"])
     def mark_all_as_read(self, request):
         try:
             updated_count = Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+            # Rebuilt from the table on the next read, so a notification created meanwhile isn't lost
+            forget_unread_counts([request.user.id])
             if updated_count == 0:
                 return Response({"message": "No unread notifications found."}, status=status.HTTP_200_OK)
             return Response({"message": f"{updated_count} notifications marked as read."}, status=status.HTTP_200_OK)
@@ -278,16 +296,23 @@ class NotificationViewSet(ModelViewSet):
     @action(detail=True, methods=["POST"])
     def mark_single_as_read(self, request, pk=None):
         try:
-            notification = Notification.objects.get(pk=pk, user=request.user)
-            if notification.is_read:
+            updated = Notification.objects.filter(pk=pk, user=request.user, is_read=False).update(is_read=True)
+            if not updated:
+                if not Notification.objects.filter(pk=pk, user=request.user).exists():
+                    raise Notification.DoesNotExist
                 return Response({"message": "Notification is already marked as read."}, status=status.HTTP_200_OK)
-            notification.is_read = True
-            notification.save()
+            adjust_unread_counts({request.user.id: -1})
             return Response({"message": "Notification marked as read"}, status=status.HTTP_200_OK)
         except Notification.DoesNotExist:
             return Response({"error": "Notification not found"}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({"error": "Failed to mark notification as read.", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def perform_destroy(self, instance):
+        was_unread = not instance.is_read
+        instance.delete()
+        if was_unread:
+            adjust_unread_counts({instance.user_id: -1})
         
     @action(detail=False, methods=["DELETE"])
     def delete_read_notifications(self, request):
@@ -344,8 +369,7 @@ class UserLearningActivityView(ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UserActivitySerializer
 
-    def get_queryset(self):
-        user = self.request.user
+    def get_start_date(self):
         time_period = self.request.query_params.get("period", "weekly")  # default to weekly
 
         today = now().date()
@@ -355,13 +379,19 @@ class UserLearningActivityView(ListAPIView):
             raise ValidationError({"error": "Invalid time period. Use 'daily', 'weekly', or 'monthly'."})
 
         if time_period == "daily":
-            start_date = today
+            return today
         elif time_period == "monthly":
-            start_date = today.replace(day=1)
+            return today.replace(day=1)
         else:  # default weekly
-            start_date = today - timedelta(days=7)
+            return today - timedelta(days=7)
+
+    def get_queryset(self):
+        return UserActivity.objects.filter(user=self.request.user)
 
-        return UserActivity.objects.filter(user=user, date__gte=start_date).order_by("date")
+    def list(self, request, *args, **kwargs):
+        """One entry per day of the period, days without activity come back with zero time spent"""
+        series = time_series(self.get_queryset(), "date", "day", self.get_start_date(), end=now().date(), value=Sum("time_spent"))
+        return Response([{"date": day, "time_spent": time_spent} for day, time_spent in series])
 
         
 class BlogViewSet(ModelViewSet):
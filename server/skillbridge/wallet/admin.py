@@ -1,7 +1,8 @@
 from django.contrib import admin
-from .models import Wallet,Transaction
+from .models import Wallet,Transaction,EarningsRollup
 
 # Register your models here.
 
 admin.site.register(Wallet)
-admin.site.register(Transaction)
\ No newline at end of file
+admin.site.register(Transaction)
+admin.site.register(EarningsRollup)
@@ -0,0 +1,160 @@
+from datetime import timezone as dt_timezone
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from .models import EarningsRollup, Transaction
+
+
+"""
+Earnings charts are served from EarningsRollup instead of scanning every credit transaction.
+Each credit adds its amount to the hour and day bucket of its wallet. Platform wide totals are summed over the
+wallets' buckets at read time, so concurrent checkouts never queue up on a shared row.
+Hourly buckets back the day/week/month charts, daily buckets back the year chart.
+"""
+
+HOUR = "hour"
+DAY = "day"
+GRANULARITIES = (HOUR, DAY)
+CREDIT = "credit"
+
+DAY_SLOTS = ["12AM", "4AM", "8AM", "12PM", "4PM", "8PM"]
+WEEK_SLOTS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+MONTH_SLOTS = ["Week 1", "Week 2", "Week 3", "Week 4"]
+YEAR_SLOTS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def truncate(value, granularity):
+    value = value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if granularity == DAY:
+        value = value.replace(hour=0)
+    return value
+
+
+def _increment(wallet_id, granularity, bucket, amount):
+    lookup = {"wallet_id": wallet_id, "granularity": granularity, "bucket": bucket}
+    changes = {"total": F("total") + amount, "transaction_count": F("transaction_count") + 1}
+
+    if EarningsRollup.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            EarningsRollup.objects.create(total=amount, transaction_count=1, **lookup)
+    except IntegrityError:
+        # Another insert created the bucket first
+        EarningsRollup.objects.filter(**lookup).update(**changes)
+
+
+def record_transaction(credit):
+    """Adds a credit transaction to its wallet's buckets"""
+    if credit.transaction_type != CREDIT:
+        return
+    for granularity in GRANULARITIES:
+        _increment(credit.wallet_id, granularity, truncate(credit.created_at, granularity), credit.amount)
+
+
+def _lock_rollups():
+    """
+    Holds off new increments until the current transaction commits, after waiting for the uncommitted ones.
+    Otherwise a credit committed after the totals were read would be overwritten by the rebuild
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {EarningsRollup._meta.db_table} IN SHARE ROW EXCLUSIVE MODE")
+
+
+def _upsert_rollups(batch):
+    EarningsRollup.objects.bulk_create(
+        batch,
+        update_conflicts=True,
+        unique_fields=["wallet", "granularity", "bucket"],
+        update_fields=["total", "transaction_count"],
+    )
+    return len(batch)
+
+
+def rebuild_earnings_rollups(since=None, batch_size=1000):
+    """
+    Recomputes the buckets from the transactions table, from the bucket holding `since` onwards or entirely.
+    Totals are upserted in place and only buckets left without credits are deleted, so charts never see a gap.
+    Returns the number of rows written
+    """
+    written = 0
+    with transaction.atomic():
+        _lock_rollups()
+        for granularity in GRANULARITIES:
+            rollups = EarningsRollup.objects.filter(granularity=granularity)
+            credits = Transaction.objects.filter(transaction_type=CREDIT)
+            if since:
+                start = truncate(since, granularity)
+                rollups = rollups.filter(bucket__gte=start)
+                credits = credits.filter(created_at__gte=start)
+
+            credits = (
+                credits.annotate(bucket=Trunc("created_at", granularity, tzinfo=dt_timezone.utc))
+                .values("wallet_id", "bucket")
+                .annotate(total=Sum("amount"), transaction_count=Count("id"))
+                .order_by()
+            )
+            rebuilt = set()
+            batch = []
+            for row in credits.iterator(chunk_size=batch_size):
+                rebuilt.add((row["wallet_id"], row["bucket"]))
+                batch.append(EarningsRollup(granularity=granularity, **row))
+                if len(batch) >= batch_size:
+                    written += _upsert_rollups(batch)
+                    batch = []
+            if batch:
+                written += _upsert_rollups(batch)
+
+            stale = [
+                pk for pk, wallet_id, bucket in rollups.values_list("pk", "wallet_id", "bucket").iterator()
+                if (wallet_id, bucket) not in rebuilt
+            ]
+            EarningsRollup.objects.filter(pk__in=stale).delete()
+    return written
+
+
+def _window(timeframe, now):
+    """Returns the start, the bucket granularity and the slot labels of a chart timeframe"""
+    if timeframe == "day":
+        return now - timezone.timedelta(days=1), HOUR, DAY_SLOTS
+    if timeframe == "week":
+        return now - timezone.timedelta(days=6), HOUR, WEEK_SLOTS
+    if timeframe == "month":
+        return now - timezone.timedelta(weeks=4), HOUR, MONTH_SLOTS
+    if timeframe == "year":
+        return (now - timezone.timedelta(days=365)).replace(day=1), DAY, YEAR_SLOTS
+    return None
+
+
+def _slot_index(timeframe, bucket, now):
+    if timeframe == "day":
+        return bucket.hour // 4
+    if timeframe == "week":
+        return bucket.weekday()
+    if timeframe == "month":
+        return min(3, (now - bucket).days // 7)
+    return bucket.month - 1
+
+
+def earnings_chart(timeframe, series, now=None):
+    """
+    Builds chart_data for a timeframe. `series` maps each chart key to a wallet id, or to None for the
+    platform wide totals. Returns None for an unknown timeframe
+    """
+    now = now or timezone.now()
+    window = _window(timeframe, now)
+    if window is None:
+        return None
+    start, granularity, labels = window
+
+    chart_data = [dict({"name": label}, **{key: 0.0 for key in series}) for label in labels]
+    for key, wallet_id in series.items():
+        buckets = EarningsRollup.objects.filter(granularity=granularity, bucket__gte=truncate(start, granularity))
+        if wallet_id is None:
+            buckets = buckets.values("bucket").annotate(bucket_total=Sum("total")).values_list("bucket", "bucket_total")
+        else:
+            buckets = buckets.filter(wallet_id=wallet_id).values_list("bucket", "total")
+        for bucket, total in buckets:
+            chart_data[_slot_index(timeframe, bucket, now)][key] += float(total)
+    return chart_data
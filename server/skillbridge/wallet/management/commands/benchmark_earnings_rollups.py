@@ -0,0 +1,113 @@
+import time
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from wallet.earnings import CREDIT, _slot_index, _window, earnings_chart, rebuild_earnings_rollups
+from wallet.models import EarningsRollup, Transaction, Wallet
+
+User = get_user_model()
+
+TIMEFRAMES = ("day", "week", "month", "year")
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+
+def timed(function, runs):
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - started)
+    return sorted(latencies)
+
+
+def scan_chart(timeframe, wallet_id, now):
+    """The charts as they were built before the rollups, bucketing every credit of the window in Python"""
+    start, _, labels = _window(timeframe, now)
+    chart = [0.0] * len(labels)
+    credits = Transaction.objects.filter(transaction_type=CREDIT, created_at__gte=start)
+    if wallet_id is not None:
+        credits = credits.filter(wallet_id=wallet_id)
+    for created_at, amount in credits.values_list("created_at", "amount").iterator(chunk_size=10000):
+        chart[_slot_index(timeframe, created_at, now)] += float(amount)
+    return chart
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the earnings rollups against scanning the transactions, on synthetic credits spread over the last '
+        'year. Everything runs in one transaction that is rolled back, so nothing is left behind'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=1000000)
+        parser.add_argument('--wallets', type=int, default=500)
+        parser.add_argument('--days', type=int, default=365, help='Credits are spread over the last N days')
+        parser.add_argument('--runs', type=int, default=20, help='Runs per rollup chart')
+        parser.add_argument('--scan-runs', type=int, default=3, help='Runs per scanned chart, 0 to skip the scans')
+        parser.add_argument('--inserts', type=int, default=1000, help='Credits created one by one through the ORM')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.benchmark(options)
+            transaction.set_rollback(True)
+
+    def benchmark(self, options):
+        now = timezone.now()
+        users = User.objects.bulk_create(
+            User(email=f"earnings-benchmark-{n}@example.com", role="tutor") for n in range(options['wallets'])
+        )
+        wallet_ids = [wallet.id for wallet in Wallet.objects.bulk_create(Wallet(user=user) for user in users)]
+
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT setseed(0.42)")
+            cursor.execute(
+                f"""
+                INSERT INTO {Transaction._meta.db_table} (wallet_id, amount, transaction_type, created_at)
+                SELECT (%s::bigint[])[1 + floor(random() * %s)::int], round((random() * 200)::numeric, 2), %s,
+                       %s - random() * %s * interval '1 day'
+                FROM generate_series(1, %s)
+                """,
+                [wallet_ids, len(wallet_ids), CREDIT, now, options['days'], options['transactions']],
+            )
+            cursor.execute(f"ANALYZE {Transaction._meta.db_table}")
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"earnings: {options['transactions']} credits over {len(wallet_ids)} wallets and {options['days']} days"
+        ))
+        self.stdout.write(f"  insert            {time.perf_counter() - started:.2f}s")
+
+        started = time.perf_counter()
+        written = rebuild_earnings_rollups()
+        self.stdout.write(f"  full rebuild      {time.perf_counter() - started:.2f}s, {written} rollup rows")
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {EarningsRollup._meta.db_table}")
+
+        started = time.perf_counter()
+        written = rebuild_earnings_rollups(since=now - timezone.timedelta(days=2))
+        self.stdout.write(f"  2 day rebuild     {time.perf_counter() - started:.2f}s, {written} rollup rows")
+
+        wallet = Wallet.objects.get(pk=wallet_ids[0])
+        started = time.perf_counter()
+        for _ in range(options['inserts']):
+            Transaction.objects.create(wallet=wallet, amount=Decimal("10.00"), transaction_type=CREDIT)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"  credit insert     {elapsed / options['inserts'] * 1000:.3f}ms each, rollups included")
+
+        for timeframe in TIMEFRAMES:
+            for label, wallet_id in (("wallet", wallet.id), ("platform", None)):
+                latencies = timed(lambda: earnings_chart(timeframe, {"total": wallet_id}, now=now), options['runs'])
+                self.write_latencies(f"{timeframe:<5} {label:<8} rollups", latencies)
+                if options['scan_runs']:
+                    latencies = timed(lambda: scan_chart(timeframe, wallet_id, now), options['scan_runs'])
+                    self.write_latencies(f"{timeframe:<5} {label:<8} scan   ", latencies)
+
+    def write_latencies(self, label, latencies):
+        self.stdout.write(
+            f"  {label}   p50 {percentile(latencies, 0.5):.3f}ms  p90 {percentile(latencies, 0.9):.3f}ms  "
+            f"max {latencies[-1] * 1000:.3f}ms over {len(latencies)} runs"
+        )
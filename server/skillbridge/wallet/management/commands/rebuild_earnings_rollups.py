@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from wallet.earnings import rebuild_earnings_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the hourly and daily EarningsRollup buckets from credit transactions. New credits wait for the '
+        'rebuild to commit, prefer --days over a full rebuild on a live system'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Only rebuild buckets from the last N days')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timezone.timedelta(days=options['days']) if options['days'] else None
+        written = rebuild_earnings_rollups(since=since, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} earnings rollup row(s).'))
@@ -22,5 +22,35 @@ class Transaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     description = models.TextField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', '-created_at', '-id'], name='transaction_keyset_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.wallet.user.first_name} - {self.transaction_type} - {self.amount}"
+
+class EarningsRollup(models.Model):
+    """Credit totals per wallet and hour/day bucket"""
+
+    GRANULARITY_CHOICES = (
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    )
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name="earnings_rollups")
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    transaction_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'granularity', 'bucket'], name='unique_earnings_rollup_bucket'),
+        ]
+        indexes = [
+            # Platform wide charts sum every wallet's buckets in the window
+            models.Index(fields=['granularity', 'bucket'], name='earnings_rollup_bucket_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.wallet.user.first_name} - {self.transaction_type} - {self.amount}"
\ No newline at end of file
+        return f"{self.wallet_id} - {self.granularity} {self.bucket:%Y-%m-%d %H:00} - {self.total}"
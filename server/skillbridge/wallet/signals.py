@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from .models import Transaction
+from .earnings import record_transaction
+
+
+@receiver(post_save, sender=Transaction)
+def add_transaction_to_rollups(sender, instance, created, **kwargs):
+    if created:
+        record_transaction(instance)
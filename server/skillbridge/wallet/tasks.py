@@ -0,0 +1,15 @@
+import logging
+from celery import shared_task
+from django.utils import timezone
+from .earnings import rebuild_earnings_rollups
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def rebuild_recent_earnings_rollups(days=2):
+    """Recomputes the latest buckets from the transactions table, repairing any increment that was lost"""
+    since = timezone.now() - timezone.timedelta(days=days)
+    rows = rebuild_earnings_rollups(since=since)
+    logger.info(f"Rebuilt {rows} earnings rollup rows since {since}")
+    return rows
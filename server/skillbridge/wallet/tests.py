@@ -1,3 +1,54 @@
+from datetime import datetime, timezone
+from decimal import Decimal
 from django.test import TestCase
+from base.testing import make_user
+from .earnings import DAY, HOUR, earnings_chart, rebuild_earnings_rollups
+from .models import EarningsRollup, Transaction, Wallet
 
-# Create your tests here.
+
+class EarningsRollupTests(TestCase):
+    now = datetime(2026, 3, 4, 15, 30, tzinfo=timezone.utc)
+
+    def setUp(self):
+        self.tutor_wallet = Wallet.objects.create(user=make_user("tutor@example.com", role="tutor"))
+        self.admin_wallet = Wallet.objects.create(user=make_user("admin@example.com", role="admin"))
+
+    def credit(self, wallet, amount, created_at=None):
+        credit = Transaction.objects.create(wallet=wallet, amount=Decimal(amount), transaction_type="credit")
+        if created_at:
+            # created_at is auto_now_add, the rollups only follow through a rebuild
+            Transaction.objects.filter(pk=credit.pk).update(created_at=created_at)
+        return credit
+
+    def test_credits_only_touch_their_wallets_buckets(self):
+        self.credit(self.tutor_wallet, "80.00")
+        self.credit(self.admin_wallet, "20.00")
+        self.credit(self.tutor_wallet, "5.00")
+        Transaction.objects.create(wallet=self.tutor_wallet, amount=Decimal("30.00"), transaction_type="debit")
+
+        self.assertEqual(EarningsRollup.objects.count(), 4)
+        hour = EarningsRollup.objects.get(wallet=self.tutor_wallet, granularity=HOUR)
+        self.assertEqual((hour.total, hour.transaction_count), (Decimal("85.00"), 2))
+
+    def test_platform_totals_sum_every_wallet(self):
+        self.credit(self.tutor_wallet, "80.00", created_at=self.now.replace(hour=9))
+        self.credit(self.admin_wallet, "20.00", created_at=self.now.replace(hour=10))
+        rebuild_earnings_rollups()
+
+        chart = earnings_chart("day", {"adminEarnings": self.admin_wallet.id, "totalSales": None}, now=self.now)
+        self.assertEqual(chart[2], {"name": "8AM", "adminEarnings": 20.0, "totalSales": 100.0})
+        self.assertEqual(sum(slot["totalSales"] for slot in chart), 100.0)
+
+    def test_rebuild_updates_buckets_in_place(self):
+        kept = self.credit(self.tutor_wallet, "80.00")
+        moved = self.credit(self.admin_wallet, "20.00")
+        rollup = EarningsRollup.objects.get(wallet=self.tutor_wallet, granularity=DAY)
+        Transaction.objects.filter(pk=kept.pk).update(amount=Decimal("60.00"))
+        Transaction.objects.filter(pk=moved.pk).update(created_at=self.now)
+
+        self.assertEqual(rebuild_earnings_rollups(since=self.now), 4)
+        rollup.refresh_from_db()
+        self.assertEqual(rollup.total, Decimal("60.00"))
+        # The admin wallet's old buckets held nothing but the moved credit
+        buckets = EarningsRollup.objects.filter(wallet=self.admin_wallet).order_by("bucket").values_list("bucket", flat=True)
+        self.assertEqual(list(buckets), [self.now.replace(hour=0, minute=0), self.now.replace(minute=0)])
@@ -3,7 +3,7 @@ from rest_framework.permissions import IsAuthenticated
 from .models import Wallet, Transaction
 from .serializers import WalletSerializer, TransactionSerializer
 from rest_framework.generics import RetrieveAPIView
-from base.custom_pagination import CustomPagination
+from base.custom_pagination import CursorEnabledPagination
 from django.shortcuts import get_object_or_404
 
 
@@ -18,7 +18,7 @@ class WalletView(RetrieveAPIView):
 class TransactionViewSet(ReadOnlyModelViewSet):
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = CustomPagination
+    pagination_class = CursorEnabledPagination
 
     def get_queryset(self):
         return Transaction.objects.filter(wallet__user=self.request.user).order_by("-created_at")
\ No newline at end of file